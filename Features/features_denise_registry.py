@@ -0,0 +1,343 @@
+import numpy as np
+import pandas as pd
+
+from utils.extra import STATUS_WEIGHTS
+from utils.functions import accepts_chunks
+
+from utils.battle_cache import Vocab, MISSING, STATS
+from utils.registry import FeatureRegistry
+from utils.turn_table import build_turn_table
+from utils.type_chart import max_type_effectiveness
+from utils.team_table import build_team_table, _take
+from utils.interning import InternedVocab
+from Features.features_denise import USELESS_LEADS
+from Features.features_olya_vectorized import _last_value, _seen_keys
+
+
+'''
+The `create_specialist_features` columns (Features/features_denise.py) as a
+lazy `FeatureRegistry`: every column is a vectorized function of a few shared
+intermediates, and `create_specialist_features_lazy(df, columns)` only builds
+what the requested columns need.
+
+    _team_table   the team details as a `TeamTable` (utils/team_table.py)
+    _leads        P1/P2 lead names and base stats (one row per battle)
+    _p1_team      P1 team, one row per Pokémon
+    _turn_table       the timelines as a `TurnTable` (only for timeline features)
+    _pokemon_states   name/hp_pct/status of every `pX_pokemon_state`, nothing else
+    _seen             end-of-battle seen-status totals of both sides
+
+The static lead/team features never touch the timelines, and the seen-status
+ones (hp_advantage_seen, mons_revealed_diff, team_status_diff,
+weighted_status_diff) only read the Pokémon states, so e.g. the lean logistic
+set skips the move, boost and switch bookkeeping of `build_turn_table`. Values match the replay
+extractor; seen-HP totals are summed in a different order and can differ in
+the last ulp.
+
+Only the specialist set is registered. The gen2 (`features_olya_vectorized`)
+and advanced (`features_kayo`) builders still compute all their columns, and
+the column lists of main.py are not resolved through a registry.
+'''
+
+
+SPECIALIST_FEATURES = FeatureRegistry('specialist')
+
+
+# --- Intermediates ---
+
+@SPECIALIST_FEATURES.register('_team_table', inputs=('p1_team_details', 'p2_lead_details'))
+def _team_table(p1_team_details, p2_lead_details):
+    return build_team_table(p1_team_details, p2_lead_details)
+
+
+@SPECIALIST_FEATURES.register('_leads', depends=('_team_table',))
+def _leads(teams):
+    leads = {f'{side}_name': teams.lead_names(side) for side in ('p1', 'p2')}
+    for side in ('p1', 'p2'):
+        for stat, values in zip(STATS, teams.lead_stats(side).T):
+            leads[f'{side}_{stat}'] = values
+    return pd.DataFrame(leads)
+
+
+@SPECIALIST_FEATURES.register('_p1_team', depends=('_team_table',))
+def _p1_team(teams):
+    return {
+        'battle': teams.team_battle,
+        'name_id': teams['team_name'],
+        'names': teams.vocab['pokemon'],
+        'base_spe': teams.team_stat('base_spe', default=70).astype(float),
+        'bulk': sum(teams.team_stat(stat, default=80) for stat in ('base_hp', 'base_def', 'base_spa')).astype(float),
+        'n_battles': len(teams),
+    }
+
+
+@SPECIALIST_FEATURES.register('_turn_table', inputs=('battle_timeline',))
+def _turn_table(battle_timeline):
+    return build_turn_table(battle_timeline)
+
+
+def _timeline_ids(teams, table, unknown=MISSING):
+    """Team-table Pokémon id -> id in the turn table's vocabulary (`unknown` if absent)."""
+    index = {name: i for i, name in enumerate(table.vocab['pokemon'])}
+    return np.array([index.get(name, unknown) for name in teams.vocab['pokemon']] + [unknown], dtype=np.int64)
+
+
+@SPECIALIST_FEATURES.register('_pokemon_states', inputs=('battle_timeline',))
+def _pokemon_states(battle_timeline):
+    """
+    Battle, name, hp_pct and status of every `pX_pokemon_state` with a name,
+    as flat arrays per side; the rest of the turn (moves, boosts, ...) is not
+    read. Names and statuses are coded on the fly (`names`, `statuses`); status
+    None gets code -1, and so does a state without a 'status' key (the
+    specialist builder resets the status then).
+    """
+    names, statuses = Vocab(), {None: -1}
+    columns = {side: ([], [], [], []) for side in ('p1', 'p2')}
+    sides = [(f'{side}_pokemon_state', *(column.append for column in columns[side])) for side in ('p1', 'p2')]
+    name_code, nan = names.code, float('nan')
+    for battle, timeline in enumerate(battle_timeline):
+        for turn in timeline or ():
+            for key, add_battle, add_name, add_hp, add_status in sides:
+                state = turn.get(key)
+                if not state:
+                    continue
+                name = state.get('name')
+                if not name:
+                    continue
+                add_battle(battle)
+                add_name(name_code(name))
+                hp = state.get('hp_pct')
+                add_hp(nan if hp is None else hp)
+                add_status(statuses.setdefault(state.get('status'), len(statuses) - 1))
+    states = {side: {'battle': np.array(b, dtype=np.int64), 'name': np.array(n, dtype=np.int64),
+                     'hp': np.array(h, dtype=float), 'status': np.array(st, dtype=np.int64)}
+              for side, (b, n, h, st) in columns.items()}
+    states['names'] = names.to_list()
+    states['statuses'] = [status for status in statuses if status is not None]
+    return states
+
+
+def _side_seen(states, initial_keys, n_codes, status_weight, n_battles):
+    """End-of-battle totals of one side's seen Pokémon (`SideState` of utils/replay.py)."""
+    row_keys = states['battle'] * n_codes + states['name'] + 1
+    keys = np.union1d(initial_keys, row_keys)
+    key_of_row = np.searchsorted(keys, row_keys)
+
+    def last_update(mask, values, default):
+        # last value of every key among the rows in `mask`: first hit in reversed order
+        out = np.full(len(keys), default, dtype=float)
+        rows = np.flatnonzero(mask)[::-1]
+        found, first = np.unique(key_of_row[rows], return_index=True)
+        out[found] = values[rows[first]]
+        return out
+
+    hp, status = states['hp'], states['status']
+    every = np.ones(len(status), dtype=bool)
+    battle_of_key = keys // n_codes
+    return {
+        'hp': np.bincount(battle_of_key, weights=last_update(~np.isnan(hp), hp, 100.0), minlength=n_battles),
+        'status': np.bincount(battle_of_key, weights=last_update(every, (status >= 0).astype(float), 0.0),
+                              minlength=n_battles),
+        'status_weight': np.bincount(battle_of_key, weights=last_update(every, status_weight[status], 0.0),
+                              minlength=n_battles),
+        'count': np.bincount(battle_of_key, minlength=n_battles),
+    }
+
+
+@SPECIALIST_FEATURES.register('_seen', depends=('_pokemon_states', '_team_table'))
+def _seen(states, teams):
+    # timeline names get ids after the team/lead ones
+    vocab = Vocab(teams.vocab['pokemon'])
+    to_vocab = np.array([vocab.code(name) for name in states['names']] + [MISSING], dtype=np.int64)
+    n, n_codes = len(teams), len(vocab.codes) + 1
+    # weight of every status code; -1 (None) reads the trailing zero
+    status_weight = np.array([STATUS_WEIGHTS.get(status, 0) for status in states['statuses']] + [0], dtype=float)
+    _, p1_keys, _, p2_keys = _seen_keys(teams['team_name'], teams.team_offsets, teams['lead_name'], n_codes)
+    seen = {}
+    for side, initial_keys in (('p1', p1_keys), ('p2', p2_keys)):
+        side_states = dict(states[side], name=to_vocab[states[side]['name']])
+        totals = _side_seen(side_states, initial_keys, n_codes, status_weight, n)
+        seen.update({f'{side}_{total}': values for total, values in totals.items()})
+    return seen
+
+
+def _move_count(table, side, flag):
+    is_flagged = InternedVocab('move', table.vocab['move']).flag(flag)
+    return table.segment_count(is_flagged[np.asarray(table[f'{side}_move_id'])])
+
+
+# --- Lead and team features ---
+
+@SPECIALIST_FEATURES.register('p1_lead_name', depends=('_leads',))
+def p1_lead_name(leads):
+    return leads['p1_name'].where(~leads['p1_name'].isin(USELESS_LEADS), 'Other')
+
+
+@SPECIALIST_FEATURES.register('p2_lead_name', depends=('_leads',))
+def p2_lead_name(leads):
+    return leads['p2_name'].where(~leads['p2_name'].isin(USELESS_LEADS), 'Other')
+
+
+@SPECIALIST_FEATURES.register('lead_speed_diff', depends=('_leads',))
+def lead_speed_diff(leads):
+    return leads['p1_base_spe'] - leads['p2_base_spe']
+
+
+@SPECIALIST_FEATURES.register('lead_type_adv', depends=('_team_table',))
+def lead_type_adv(teams):
+    p1_types = teams.lead_types('p1')
+    p2_types = teams.lead_types('p2')
+    return max_type_effectiveness(p1_types, p2_types) - max_type_effectiveness(p2_types, p1_types)
+
+
+@SPECIALIST_FEATURES.register('lead_atk_diff', depends=('_leads',))
+def lead_atk_diff(leads):
+    return leads['p1_base_atk'] - leads['p2_base_atk']
+
+
+@SPECIALIST_FEATURES.register('lead_bulk_diff', depends=('_leads',))
+def lead_bulk_diff(leads):
+    p1_bulk = leads['p1_base_hp'] + leads['p1_base_def'] + leads['p1_base_spa']
+    p2_bulk = leads['p2_base_hp'] + leads['p2_base_def'] + leads['p2_base_spa']
+    return p1_bulk - p2_bulk
+
+
+@SPECIALIST_FEATURES.register('p1_team_avg_speed', depends=('_p1_team',))
+def p1_team_avg_speed(team):
+    return _team_mean(team, team['base_spe'])
+
+
+@SPECIALIST_FEATURES.register('p1_team_avg_bulk', depends=('_p1_team',))
+def p1_team_avg_bulk(team):
+    return _team_mean(team, team['bulk'])
+
+
+def _team_mean(team, values):
+    sums = np.bincount(team['battle'], weights=values, minlength=team['n_battles'])
+    counts = np.bincount(team['battle'], minlength=team['n_battles'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+@SPECIALIST_FEATURES.register('p1_meta_threat_count', depends=('_p1_team',))
+def p1_meta_threat_count(team):
+    pokemon = InternedVocab('pokemon', team['names'])
+    return np.bincount(team['battle'], weights=pokemon.is_meta_threat[team['name_id']],
+                       minlength=team['n_battles']).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('p2_lead_is_meta_threat', depends=('_leads',))
+def p2_lead_is_meta_threat(leads):
+    pokemon = InternedVocab('pokemon', leads['p2_name'].unique())
+    return pokemon.is_meta_threat[pokemon.encode(leads['p2_name'])].astype(np.int64)
+
+
+# --- Timeline features ---
+
+@SPECIALIST_FEATURES.register('num_turns', depends=('_turn_table',))
+def num_turns(table):
+    turns = np.asarray(table['turn'], dtype=np.int64)
+    return _last_value(np.maximum(turns, 0), table, 0).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('end_boost_diff', depends=('_turn_table', 'num_turns'))
+def end_boost_diff(table, n_turns):
+    turns = np.asarray(table['turn'], dtype=np.int64)
+    diff = np.asarray(table['p1_boost_sum'], dtype=np.int64) - np.asarray(table['p2_boost_sum'], dtype=np.int64)
+    # value at the last row whose turn number is the final one
+    is_end = (turns >= 0) & (turns == np.repeat(n_turns, table.lengths))
+    rows = np.arange(table.n_turns)
+    last = table.segment_max(np.where(is_end, rows, -1), empty=-1).astype(np.int64)
+    return np.where(last >= 0, diff[np.maximum(last, 0)], 0)
+
+
+@SPECIALIST_FEATURES.register('p1_lead_stay_duration', depends=('_turn_table', '_team_table'))
+def p1_lead_stay_duration(table, teams):
+    lead = _timeline_ids(teams, table, unknown=-2)[_take(teams['team_name'], teams.p1_lead_rows())]
+    names = np.asarray(table['p1_name'], dtype=np.int64)
+    return table.segment_count(names == np.repeat(lead, table.lengths)).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('p2_lead_forced_out', depends=('_turn_table', '_team_table'))
+def p2_lead_forced_out(table, teams):
+    lead = _timeline_ids(teams, table, unknown=-2)[teams['lead_name']]
+    names = np.asarray(table['p2_name'], dtype=np.int64)
+    # the lead leaves the field: the previous turn showed it and this one does not
+    previous = np.concatenate([[-3], names[:-1]])
+    not_first = np.ones(table.n_turns, dtype=bool)
+    not_first[table.offsets[:-1][table.lengths > 0]] = False
+    leaves = not_first & (names != previous) & (previous == np.repeat(lead, table.lengths))
+    return (table.segment_count(leaves) > 0).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('first_ko_turn', depends=('_turn_table',))
+def first_ko_turn(table):
+    ko = (np.asarray(table['p1_hp_pct']) == 0) | (np.asarray(table['p2_hp_pct']) == 0)
+    rows = np.arange(table.n_turns)
+    first = table.segment_min(np.where(ko, rows, np.inf), empty=np.inf)
+    turns = np.maximum(np.asarray(table['turn'], dtype=np.int64), 0)
+    found = np.isfinite(first)
+    return np.where(found, turns[np.where(found, first, 0).astype(np.int64)], 0)
+
+
+@SPECIALIST_FEATURES.register('setup_advantage', depends=('_turn_table',))
+def setup_advantage(table):
+    return (_move_count(table, 'p1', 'is_setup_move') - _move_count(table, 'p2', 'is_setup_move')).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('key_attack_adv', depends=('_turn_table',))
+def key_attack_adv(table):
+    return (_move_count(table, 'p1', 'is_key_attack') - _move_count(table, 'p2', 'is_key_attack')).astype(np.int64)
+
+
+# --- Seen-status features ---
+
+@SPECIALIST_FEATURES.register('hp_advantage_seen', depends=('_seen',))
+def hp_advantage_seen(seen):
+    return seen['p1_hp'] - seen['p2_hp']
+
+
+@SPECIALIST_FEATURES.register('mons_revealed_diff', depends=('_seen',))
+def mons_revealed_diff(seen):
+    return (seen['p2_count'] - seen['p1_count']).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('team_status_diff', depends=('_seen',))
+def team_status_diff(seen):
+    return (seen['p1_status'] - seen['p2_status']).astype(np.int64)
+
+
+@SPECIALIST_FEATURES.register('weighted_status_diff', depends=('_seen',))
+def weighted_status_diff(seen):
+    return (seen['p1_status_weight'] - seen['p2_status_weight']).astype(np.int64)
+
+
+# column order of `create_specialist_features`
+SPECIALIST_COLUMNS = [
+    'p1_lead_name', 'p2_lead_name',
+    'lead_speed_diff', 'hp_advantage_seen', 'mons_revealed_diff', 'team_status_diff',
+    'end_boost_diff', 'num_turns',
+    'lead_type_adv', 'lead_atk_diff', 'lead_bulk_diff', 'p1_team_avg_speed', 'p1_team_avg_bulk',
+    'p1_meta_threat_count', 'p2_lead_is_meta_threat', 'p1_lead_stay_duration', 'p2_lead_forced_out',
+    'first_ko_turn', 'setup_advantage', 'key_attack_adv', 'weighted_status_diff',
+]
+
+
+@accepts_chunks
+def create_specialist_features_lazy(df, columns=None, turn_table=None):
+    """
+    `create_specialist_features` restricted to `columns`: only their
+    dependency closure in `SPECIALIST_FEATURES` is computed.
+
+    Args:
+        df: battles DataFrame or an iterable of chunks
+        columns: list of feature names (default: every column, in the usual order)
+        turn_table: optional `TurnTable` of the same battles, in the same order (e.g.
+            `turn_table_from_columns` on the columnar cache), so the timelines are not
+            flattened again; only with a DataFrame, not with chunks
+
+    Returns:
+        pd.DataFrame indexed by battle_id
+    """
+    given = {'_turn_table': turn_table} if turn_table is not None else None
+    return SPECIALIST_FEATURES.compute(df, SPECIALIST_COLUMNS if columns is None else columns, given=given)
@@ -1,5 +1,3 @@
-from tqdm.auto import tqdm
-import pandas as pd
 import numpy as np 
 import sklearn as skl
 
@@ -13,8 +11,10 @@ from utils.functions import (
     get_all_pokemons_used,
     safe_get,
     extract_levels,
-    check_missing
+    check_missing,
+    accepts_chunks
 )
+from utils.replay import Extractor, replay_features
 
 from utils.extra import (
     pokemon_base_stats_nested,
@@ -126,107 +126,182 @@ from utils.extra import (
 '''
 
 
-def create_advanced_features_gen2(df):
-    processed_data = []
-    embedding_dim = 6  # hp, atk, def, spa, spd, spe
-
-    for _, row in tqdm(df.iterrows(), total=df.shape[0], desc="Generating advanced features"):
-        p1_team = row['p1_team_details']
-        p2_lead = row['p2_lead_details']
-        timeline = row['battle_timeline']
+def fill_missing_stats(pokemon):
+    """Fills the base stats of a Pokémon dict in place (from the stats table, or 80s if unknown)."""
+    name = pokemon.get('name', '').lower()
+    if not name:
+        return pokemon
+    if any(k not in pokemon for k in ['base_hp', 'base_atk', 'base_def', 'base_spa', 'base_spd', 'base_spe']):
+        base_info = pokemon_base_stats_nested.get(name)
+        if base_info:
+            for stat in ['base_hp', 'base_atk', 'base_def', 'base_spa', 'base_spd', 'base_spe']:
+                pokemon[stat] = pokemon.get(stat, base_info[stat]['value'])
+        else:
+            pokemon.update({s: 80 for s in ['base_hp','base_atk','base_def','base_spa','base_spd','base_spe']})
+    return pokemon
+
+
+def lead_stat_features(p1_lead, p2_lead):
+    """Ratios and totals of the two leads' base stats (static for a whole battle)."""
+    features = {}
+    features['p1_lead_special_total'] = p1_lead['base_spa'] + p1_lead['base_spd']
+    features['p2_lead_special_total'] = p2_lead['base_spa'] + p2_lead['base_spd']
+    features['special_total_diff'] = features['p1_lead_special_total'] - features['p2_lead_special_total']
+
+
+    features['p1_lead_physical_total'] = p1_lead['base_atk'] + p1_lead['base_def']
+    features['p2_lead_physical_total'] = p2_lead['base_atk'] + p2_lead['base_def']
+    features['physical_total_diff'] = features['p1_lead_physical_total'] - features['p2_lead_physical_total']
+    features['atk_def_ratio_p1'] = p1_lead['base_atk'] / (p1_lead['base_def'] + 1)
+    features['atk_def_ratio_p2'] = p2_lead['base_atk'] / (p2_lead['base_def'] + 1)
+
+    features['hp_speed_interaction_lead'] = p1_lead['base_hp'] * p1_lead['base_spe']
+    features['hp_def_ratio_p1'] = p1_lead['base_hp'] / (p1_lead['base_def'] + 1)
+    features['hp_def_ratio_p2'] = p2_lead['base_hp'] / (p2_lead['base_def'] + 1)
+    features['hp_vs_total_stats_p1'] = p1_lead['base_hp'] / (sum([p1_lead[stat] for stat in ['base_atk','base_def','base_spa','base_spd','base_spe']]) + 1)
+    features['hp_vs_total_stats_p2'] = p2_lead['base_hp'] / (sum([p2_lead[stat] for stat in ['base_atk','base_def','base_spa','base_spd','base_spe']]) + 1)
+
+
+    features['lead_total_stats_p1'] = sum([p1_lead[stat] for stat in ['base_hp','base_atk','base_def','base_spa','base_spd','base_spe']])
+    features['lead_total_stats_p2'] = sum([p2_lead[stat] for stat in ['base_hp','base_atk','base_def','base_spa','base_spd','base_spe']])
+
+    features['atk_hp_ratio_p1'] = p1_lead['base_atk'] / (p1_lead['base_hp'] + 1)
+    features['atk_hp_ratio_p2'] = p2_lead['base_atk'] / (p2_lead['base_hp'] + 1)
+    features['def_hp_ratio_p1'] = p1_lead['base_def'] / (p1_lead['base_hp'] + 1)
+    features['def_hp_ratio_p2'] = p2_lead['base_def'] / (p2_lead['base_hp'] + 1)
+    return features
+
+
+def aggregate_team_embedding(team, embedding_dim=6):
+    """Mean, max and min of the team's Pokémon embeddings (3 x embedding_dim, or embedding_dim zeros)."""
+    arr = np.array([pokemon_embeddings.get(p['name'], np.zeros(embedding_dim)) for p in team])
+    if len(arr) == 0:
+        return np.zeros(embedding_dim)
+    return np.concatenate([arr.mean(axis=0), arr.max(axis=0), arr.min(axis=0)])  # 3 x embedding_dim
+
+
+class AdvancedGen2Extractor(Extractor):
+    """Features of `create_advanced_features_gen2`, computed during a `replay_features` pass."""
+
+    name = 'gen2'
+    desc = "Generating advanced features"
+
+    def __init__(self):
+        # Turn-10/20 snapshots are only assigned when that turn is reached and,
+        # like the locals of the original loop, keep their value across battles
+        self.damage_diff_turn10 = 0
+        self.damage_diff_turn20 = 0
+
+    def start(self, state):
+        # --- Ensure Pokémon stats exist (on copies: the battle dicts are left untouched) ---
+        self.p1_team = [fill_missing_stats(dict(mon)) for mon in state.p1_team]
+        self.p2_lead = fill_missing_stats(dict(state.p2_lead))
+
+        self.total_damage_dealt = 0
+        self.total_healing_done = 0
+        self.status_turns = 0
+        self.first_faint_turn = 0
+        self.damage_diff_turn25 = 0
+        self.damage_diff_turn30 = 0
+
+        self.hp_diff_series = []  # new: track per-turn total HP difference
+        self.p1_boost_per_turn = []
+        self.p2_boost_per_turn = []
+        self.p1_move_power = []
+        self.p2_move_power = []
+        self.p1_move_types = set()
+        self.p2_move_types = set()
+        self.p1_switches = 0
+        self.p2_switches = 0
+        self.p1_attacks = 0
+        self.p2_attacks = 0
+        self.p1_seen_set = set()
+        self.p2_seen_set = set()
+
+    def turn(self, state):
+        turn = state.turn
+        p1_state = state.p1_state
+        p2_state = state.p2_state
+        p1, p2 = state.p1, state.p2
+        turn_num = turn.get('turn', 0)
+        feat_num_turns = state.num_turns
+
+        # Track total damage / healing
+        if p2_state.get('hp_pct') is not None:
+            self.total_damage_dealt += max(0, 100 - p2_state['hp_pct'])
+        if p1_state.get('hp_pct') is not None:
+            self.total_healing_done += max(0, p1_state['hp_pct'] - 100)
+
+        # Count status turns
+        self.status_turns += p1.status_count + p2.status_count
+
+        # First faint turn
+        if not self.first_faint_turn:
+            if p1.fainted_count or p2.fainted_count:
+                self.first_faint_turn = turn_num
+
+        # --- Record total HP diff this turn ---
+        total_hp_p1 = p1.total_hp
+        total_hp_p2 = p2.total_hp
+        self.hp_diff_series.append(total_hp_p1 - total_hp_p2)
+
+        # Snapshots
+        if turn_num == 10 or (turn_num == feat_num_turns and turn_num < 10):
+            self.damage_diff_turn10 = (600 - total_hp_p1) - (600 - total_hp_p2)
+        if turn_num == 20 or (turn_num == feat_num_turns and turn_num < 20):
+            self.damage_diff_turn20 = (600 - total_hp_p1) - (600 - total_hp_p2)
+        if turn_num == 25 or (turn_num == feat_num_turns and turn_num < 25):
+            self.damage_diff_turn25 = (600 - total_hp_p1) - (600 - total_hp_p2)
+        if turn_num == 30 or (turn_num == feat_num_turns and turn_num < 30):
+            self.damage_diff_turn30 = (600 - total_hp_p1) - (600 - total_hp_p2)
+
+        # Boosts of the active Pokémon
+        self.p1_boost_per_turn.append(p1.boost_sum)
+        self.p2_boost_per_turn.append(p2.boost_sum)
+
+        # Moves and actions
+        p1_move = turn.get('p1_move_details')
+        p2_move = turn.get('p2_move_details')
+        if p1_move:
+            self.p1_move_power.append(p1_move.get('base_power', 0))
+            self.p1_move_types.add(p1_move.get('type', None))
+        if p2_move:
+            self.p2_move_power.append(p2_move.get('base_power', 0))
+            self.p2_move_types.add(p2_move.get('type', None))
+        p1_action = turn.get('p1_action')
+        p2_action = turn.get('p2_action')
+        self.p1_switches += p1_action == 'switch'
+        self.p2_switches += p2_action == 'switch'
+        self.p1_attacks += p1_action == 'attack'
+        self.p2_attacks += p2_action == 'attack'
+
+        # Pokémon seen in the timeline (`get_pokemons_seen_in_battle`)
+        if p1_state.get('name'):
+            self.p1_seen_set.add(p1_state['name'])
+        if p2_state.get('name'):
+            self.p2_seen_set.add(p2_state['name'])
+
+    def finish(self, state):
+        p1_team = self.p1_team
         p1_lead = p1_team[0]
-
-        # --- Ensure Pokémon stats exist ---
-        def fill_missing_stats(pokemon):
-            name = pokemon.get('name', '').lower()
-            if not name:
-                return pokemon
-            if any(k not in pokemon for k in ['base_hp', 'base_atk', 'base_def', 'base_spa', 'base_spd', 'base_spe']):
-                base_info = pokemon_base_stats_nested.get(name)
-                if base_info:
-                    for stat in ['base_hp', 'base_atk', 'base_def', 'base_spa', 'base_spd', 'base_spe']:
-                        pokemon[stat] = pokemon.get(stat, base_info[stat]['value'])
-                else:
-                    pokemon.update({s: 80 for s in ['base_hp','base_atk','base_def','base_spa','base_spd','base_spe']})
-            return pokemon
-
-        p1_lead = fill_missing_stats(p1_lead)
-        p2_lead = fill_missing_stats(p2_lead)
-        for mon in p1_team:
-            fill_missing_stats(mon)
-
-        # --- Basic numeric features ---
+        p2_lead = self.p2_lead
+        timeline = state.timeline
+        p1, p2 = state.p1, state.p2
+        hp_diff_series = self.hp_diff_series
+        embedding_dim = 6  # hp, atk, def, spa, spd, spe
         feat_lead_speed_diff = p1_lead['base_spe'] - p2_lead['base_spe']
+        feat_total_damage_dealt = self.total_damage_dealt
+        feat_total_healing_done = self.total_healing_done
+        feat_status_turns = self.status_turns
+        feat_first_faint_turn = self.first_faint_turn
+        feat_damage_diff_turn10 = self.damage_diff_turn10
+        feat_damage_diff_turn20 = self.damage_diff_turn20
+        feat_damage_diff_turn25 = self.damage_diff_turn25
+        feat_damage_diff_turn30 = self.damage_diff_turn30
+
+        # End-of-battle boosts
         feat_end_boost_diff = 0
-        feat_total_damage_dealt = 0
-        feat_total_healing_done = 0
-        feat_status_turns = 0
-        feat_first_faint_turn = 0
-        feat_damage_diff_turn25 = 0
-        feat_damage_diff_turn30 = 0
-
-        # --- Track seen Pokémon ---
-        p1_seen_status = {p['name']: {'hp_pct': 100, 'status': None} for p in p1_team}
-        p2_seen_status = {p2_lead['name']: {'hp_pct': 100, 'status': None}}
-
-        hp_diff_series = []  # new: track per-turn total HP difference
-
-        # --- Timeline analysis ---
         if timeline:
-            feat_num_turns = timeline[-1].get('turn', 0)
-            for turn in timeline:
-                p1_state = turn.get('p1_pokemon_state', {})
-                p2_state = turn.get('p2_pokemon_state', {})
-                turn_num = turn.get('turn', 0)
-
-                # Update p1 and p2 states
-                if p1_state and p1_state.get('name'):
-                    name = p1_state['name']
-                    p1_seen_status.setdefault(name, {'hp_pct': 100, 'status': None})
-                    prev_hp = p1_seen_status[name]['hp_pct']
-                    p1_seen_status[name]['hp_pct'] = p1_state.get('hp_pct', prev_hp)
-                    p1_seen_status[name]['status'] = p1_state.get('status', p1_seen_status[name]['status'])
-
-                if p2_state and p2_state.get('name'):
-                    name = p2_state['name']
-                    p2_seen_status.setdefault(name, {'hp_pct': 100, 'status': None})
-                    prev_hp = p2_seen_status[name]['hp_pct']
-                    p2_seen_status[name]['hp_pct'] = p2_state.get('hp_pct', prev_hp)
-                    p2_seen_status[name]['status'] = p2_state.get('status', p2_seen_status[name]['status'])
-
-                # Track total damage / healing
-                if p2_state.get('hp_pct') is not None:
-                    feat_total_damage_dealt += max(0, 100 - p2_state['hp_pct'])
-                if p1_state.get('hp_pct') is not None:
-                    feat_total_healing_done += max(0, p1_state['hp_pct'] - 100)
-
-                # Count status turns
-                feat_status_turns += sum(s['status'] is not None for s in p1_seen_status.values())
-                feat_status_turns += sum(s['status'] is not None for s in p2_seen_status.values())
-
-                # First faint turn
-                if not feat_first_faint_turn:
-                    if any(s['hp_pct'] <= 0 for s in p1_seen_status.values()) or any(s['hp_pct'] <= 0 for s in p2_seen_status.values()):
-                        feat_first_faint_turn = turn_num
-
-                # --- Record total HP diff this turn ---
-                total_hp_p1 = sum(p['hp_pct'] for p in p1_seen_status.values())
-                total_hp_p2 = sum(p['hp_pct'] for p in p2_seen_status.values())
-                hp_diff_series.append(total_hp_p1 - total_hp_p2)
-
-                
-                # Snapshots
-                
-                if turn_num == 10 or (turn_num == feat_num_turns and turn_num < 10):
-                    feat_damage_diff_turn10 = (600 - total_hp_p1) - (600 - total_hp_p2)
-                if turn_num == 20 or (turn_num == feat_num_turns and turn_num < 20):
-                    feat_damage_diff_turn20 = (600 - total_hp_p1) - (600 - total_hp_p2)
-                if turn_num == 25 or (turn_num == feat_num_turns and turn_num < 25):
-                    feat_damage_diff_turn25 = (600 - total_hp_p1) - (600 - total_hp_p2)
-                if turn_num == 30 or (turn_num == feat_num_turns and turn_num < 30):
-                    feat_damage_diff_turn30 = (600 - total_hp_p1) - (600 - total_hp_p2)
-
-            # End-of-battle boosts
             last_turn = timeline[-1]
             p1_boosts = sum(last_turn.get('p1_pokemon_state', {}).get('boosts', {}).values())
             p2_boosts = sum(last_turn.get('p2_pokemon_state', {}).get('boosts', {}).values())
@@ -239,14 +314,9 @@ def create_advanced_features_gen2(df):
             feat_hp_trend_diff = 0
 
         # --- Derived battle features ---
-        p1_total_hp_seen = sum(p['hp_pct'] for p in p1_seen_status.values())
-        p2_total_hp_seen = sum(p['hp_pct'] for p in p2_seen_status.values())
-        feat_hp_advantage_seen = p1_total_hp_seen - p2_total_hp_seen
-        feat_mons_revealed_diff = len(p2_seen_status) - len(p1_seen_status)
-        feat_team_status_diff = (
-            sum(1 for p in p1_seen_status.values() if p['status'] is not None)
-            - sum(1 for p in p2_seen_status.values() if p['status'] is not None)
-        )
+        feat_hp_advantage_seen = p1.total_hp - p2.total_hp
+        feat_mons_revealed_diff = len(p2) - len(p1)
+        feat_team_status_diff = p1.status_count - p2.status_count
 
         # --- Type and setup stuff ---
         p1_lead_types = p1_lead.get('types', [])
@@ -258,9 +328,8 @@ def create_advanced_features_gen2(df):
             - sum(1 for m in p2_lead.get('moves', []) if m in STATUS_MOVES or m in SETUP_MOVES)
         )
 
-        p1_seen_set, p2_seen_set = get_pokemons_seen_in_battle(timeline)
-        p1_seen_encoded = encode_pokemon_set(p1_seen_set)
-        p2_seen_encoded = encode_pokemon_set(p2_seen_set)
+        p1_seen_encoded = encode_pokemon_set(self.p1_seen_set)
+        p2_seen_encoded = encode_pokemon_set(self.p2_seen_set)
 
         # --- Lead embeddings ---
         p1_lead_embedding = pokemon_embeddings.get(p1_lead['name'], np.zeros(embedding_dim))
@@ -271,12 +340,10 @@ def create_advanced_features_gen2(df):
             for stat in ['base_hp', 'base_atk', 'base_def', 'base_spe', 'base_spa', 'base_spd']
         )
         
-        feat_switches_p1 = sum(1 for t in timeline if t.get('p1_action') == 'switch')
-        feat_switches_p2 = sum(1 for t in timeline if t.get('p2_action') == 'switch')
-        feat_switch_diff = feat_switches_p1 - feat_switches_p2
+        feat_switch_diff = self.p1_switches - self.p2_switches
         
-        feat_aggression_p1 = sum(1 for t in timeline if t.get('p1_action') == 'attack') / len(timeline)
-        feat_aggression_p2 = sum(1 for t in timeline if t.get('p2_action') == 'attack') / len(timeline)
+        feat_aggression_p1 = self.p1_attacks / len(timeline)
+        feat_aggression_p2 = self.p2_attacks / len(timeline)
         feat_aggression_diff = feat_aggression_p1 - feat_aggression_p2
         
                 # --- Additional high-value features (new) ---
@@ -297,28 +364,20 @@ def create_advanced_features_gen2(df):
         feat_early_sustain = feat_hp_mid - hp_diff_series[0] if hp_diff_series else 0
 
         # 3. Status dynamics
-        feat_status_inflicted = sum(1 for s in p2_seen_status.values() if s['status'])
-        feat_status_suffered = sum(1 for s in p1_seen_status.values() if s['status'])
+        feat_status_inflicted = p2.status_count
+        feat_status_suffered = p1.status_count
         feat_status_balance = feat_status_inflicted - feat_status_suffered
 
         # 4. Boost trends
-        boost_diffs = []
-        for turn in timeline:
-            p1_boost_sum = sum(turn.get('p1_pokemon_state', {}).get('boosts', {}).values()) if 'boosts' in turn.get('p1_pokemon_state', {}) else 0
-            p2_boost_sum = sum(turn.get('p2_pokemon_state', {}).get('boosts', {}).values()) if 'boosts' in turn.get('p2_pokemon_state', {}) else 0
-            boost_diffs.append(p1_boost_sum - p2_boost_sum)
+        boost_diffs = [b1 - b2 for b1, b2 in zip(self.p1_boost_per_turn, self.p2_boost_per_turn)]
         feat_boost_volatility = np.std(boost_diffs) if boost_diffs else 0
         feat_boost_trend = np.mean(np.diff(boost_diffs)) if len(boost_diffs) > 1 else 0
 
         # 5. Move dynamics (if move info available)
-        p1_move_power = [t.get('p1_move_details', {}).get('base_power', 0) for t in timeline if t.get('p1_move_details')]
-        p2_move_power = [t.get('p2_move_details', {}).get('base_power', 0) for t in timeline if t.get('p2_move_details')]
-        feat_move_power_diff = np.mean(p1_move_power or [0]) - np.mean(p2_move_power or [0])
-
-        feat_move_variety_p1 = len(set(t.get('p1_move_details', {}).get('type', None)
-                                       for t in timeline if t.get('p1_move_details')))
-        feat_move_variety_p2 = len(set(t.get('p2_move_details', {}).get('type', None)
-                                       for t in timeline if t.get('p2_move_details')))
+        feat_move_power_diff = np.mean(self.p1_move_power or [0]) - np.mean(self.p2_move_power or [0])
+
+        feat_move_variety_p1 = len(self.p1_move_types)
+        feat_move_variety_p2 = len(self.p2_move_types)
         feat_move_diversity_diff = feat_move_variety_p1 - feat_move_variety_p2
 
         # 6. Aggression and stalling behavior
@@ -330,7 +389,6 @@ def create_advanced_features_gen2(df):
         # --- Combine all features ---
         # --- Combine all features ---
         feature_dict = {
-            'battle_id': row['battle_id'],
             'lead_speed_diff': feat_lead_speed_diff,                 # ✅ top 10
             'hp_advantage_seen': feat_hp_advantage_seen,             # ✅ top 10
             'mons_revealed_diff': feat_mons_revealed_diff,           # ✅ top 10
@@ -374,69 +432,26 @@ def create_advanced_features_gen2(df):
         feature_dict['damage_ratio_turn10_20'] = feat_damage_diff_turn10 / feat_damage_diff_turn20 if feat_damage_diff_turn20 != 0 else 0
         feature_dict['damage_ratio_turn10_30'] = feat_damage_diff_turn10 / feat_damage_diff_turn30 if feat_damage_diff_turn30 != 0 else 0
         
-        feature_dict['p1_lead_special_total'] = p1_lead['base_spa'] + p1_lead['base_spd']
-        feature_dict['p2_lead_special_total'] = p2_lead['base_spa'] + p2_lead['base_spd']
-        feature_dict['special_total_diff'] = feature_dict['p1_lead_special_total'] - feature_dict['p2_lead_special_total']
-
-        
-        feature_dict['p1_lead_physical_total'] = p1_lead['base_atk'] + p1_lead['base_def']
-        feature_dict['p2_lead_physical_total'] = p2_lead['base_atk'] + p2_lead['base_def']
-        feature_dict['physical_total_diff'] = feature_dict['p1_lead_physical_total'] - feature_dict['p2_lead_physical_total']
-        feature_dict['atk_def_ratio_p1'] = p1_lead['base_atk'] / (p1_lead['base_def'] + 1)
-        feature_dict['atk_def_ratio_p2'] = p2_lead['base_atk'] / (p2_lead['base_def'] + 1)
-        
-        feature_dict['hp_speed_interaction_lead'] = p1_lead['base_hp'] * p1_lead['base_spe']
-        feature_dict['hp_def_ratio_p1'] = p1_lead['base_hp'] / (p1_lead['base_def'] + 1)
-        feature_dict['hp_def_ratio_p2'] = p2_lead['base_hp'] / (p2_lead['base_def'] + 1)
-        feature_dict['hp_vs_total_stats_p1'] = p1_lead['base_hp'] / (sum([p1_lead[stat] for stat in ['base_atk','base_def','base_spa','base_spd','base_spe']]) + 1)
-        feature_dict['hp_vs_total_stats_p2'] = p2_lead['base_hp'] / (sum([p2_lead[stat] for stat in ['base_atk','base_def','base_spa','base_spd','base_spe']]) + 1)
-
-        
-        feature_dict['lead_total_stats_p1'] = sum([p1_lead[stat] for stat in ['base_hp','base_atk','base_def','base_spa','base_spd','base_spe']])
-        feature_dict['lead_total_stats_p2'] = sum([p2_lead[stat] for stat in ['base_hp','base_atk','base_def','base_spa','base_spd','base_spe']])
-
-        feature_dict['atk_hp_ratio_p1'] = p1_lead['base_atk'] / (p1_lead['base_hp'] + 1)
-        feature_dict['atk_hp_ratio_p2'] = p2_lead['base_atk'] / (p2_lead['base_hp'] + 1)
-        feature_dict['def_hp_ratio_p1'] = p1_lead['base_def'] / (p1_lead['base_hp'] + 1)
-        feature_dict['def_hp_ratio_p2'] = p2_lead['base_def'] / (p2_lead['base_hp'] + 1)
+        feature_dict.update(lead_stat_features(p1_lead, p2_lead))
 
         # HP trend difference (you already compute this as feat_hp_trend_diff)
         feature_dict['feat_hp_trend_diff'] = feat_hp_trend_diff
 
         # Status inflicted difference
-        feat_status_inflicted = sum(1 for s in p2_seen_status.values() if s['status'])
-        feat_status_suffered = sum(1 for s in p1_seen_status.values() if s['status'])
         feature_dict['feat_status_diff_inflicted'] = feat_status_inflicted - feat_status_suffered
         
         
         # --- Inside your for _, row in df.iterrows() loop, after timeline processing ---
 
         # --- 1. Per-turn team statistics ---
-        p1_hp_per_turn = []
-        p2_hp_per_turn = []
-        p1_boost_per_turn = []
-        p2_boost_per_turn = []
-        p1_status_per_turn = []
-        p2_status_per_turn = []
-
-        for turn in timeline:
-            # Sum HP for all Pokémon alive
-            p1_total_hp = sum(p['hp_pct'] for p in p1_seen_status.values())
-            p2_total_hp = sum(p['hp_pct'] for p in p2_seen_status.values())
-            p1_hp_per_turn.append(p1_total_hp)
-            p2_hp_per_turn.append(p2_total_hp)
-
-            # Sum boosts
-            p1_boost_sum = sum(turn.get('p1_pokemon_state', {}).get('boosts', {}).values()) if 'boosts' in turn.get('p1_pokemon_state', {}) else 0
-            p2_boost_sum = sum(turn.get('p2_pokemon_state', {}).get('boosts', {}).values()) if 'boosts' in turn.get('p2_pokemon_state', {}) else 0
-            p1_boost_per_turn.append(p1_boost_sum)
-            p2_boost_per_turn.append(p2_boost_sum)
-
-            # Status count
-            p1_status_count = sum(1 for s in p1_seen_status.values() if s['status'])
-            p2_status_count = sum(1 for s in p2_seen_status.values() if s['status'])
-            p1_status_per_turn.append(p1_status_count)
-            p2_status_per_turn.append(p2_status_count)
+        # HP and status are read from the final seen-state, as in the original loop
+        n_turns = len(timeline)
+        p1_hp_per_turn = [p1.total_hp] * n_turns
+        p2_hp_per_turn = [p2.total_hp] * n_turns
+        p1_boost_per_turn = self.p1_boost_per_turn
+        p2_boost_per_turn = self.p2_boost_per_turn
+        p1_status_per_turn = [p1.status_count] * n_turns
+        p2_status_per_turn = [p2.status_count] * n_turns
 
         # --- 2. Aggregate stats ---
         feature_dict['p1_hp_mean'] = np.mean(p1_hp_per_turn)
@@ -474,15 +489,8 @@ def create_advanced_features_gen2(df):
         feature_dict['aggression_index'] = (1 - feature_dict['stall_ratio']) * np.mean(hp_changes) if len(hp_changes) > 0 else 0
 
         # --- 5. Team embedding aggregation ---
-        embedding_dim = 6
-        def aggregate_team_embedding(team):
-            arr = np.array([pokemon_embeddings.get(p['name'], np.zeros(embedding_dim)) for p in team])
-            if len(arr) == 0:
-                return np.zeros(embedding_dim)
-            return np.concatenate([arr.mean(axis=0), arr.max(axis=0), arr.min(axis=0)])  # 3 x embedding_dim
-
         p1_team_emb = aggregate_team_embedding(p1_team)
-        p2_team_emb = aggregate_team_embedding(row.get('p2_team_details', []))
+        p2_team_emb = aggregate_team_embedding(state.battle.get('p2_team_details', []))
         for i, val in enumerate(p1_team_emb):
             feature_dict[f'p1_team_emb_{i}'] = val
         for i, val in enumerate(p2_team_emb):
@@ -497,6 +505,9 @@ def create_advanced_features_gen2(df):
         for stat_name, val in zip(['hp','atk','def','spa','spd','spe'], p2_lead_embedding):
             feature_dict[f'p2_lead_{stat_name}'] = val
 
-        processed_data.append(feature_dict)
+        return feature_dict
+
 
-    return pd.DataFrame(processed_data).set_index('battle_id')
+@accepts_chunks
+def create_advanced_features_gen2(df, progress=True):
+    return replay_features(df, [AdvancedGen2Extractor()], progress=progress)[0]
@@ -0,0 +1,347 @@
+import numpy as np
+import pandas as pd
+
+from utils.functions import get_type_effectiveness, SEEN_POKEMON_COLUMNS
+from utils.replay import BattleState
+from utils.extra import (
+    pokemon_embeddings,
+    META_THREATS_GEN1,
+    STATUS_MOVES,
+    SETUP_MOVES,
+    POKEMON_RANKING,
+    POKEMON_LIST
+)
+from Features.features_olya import fill_missing_stats, lead_stat_features, aggregate_team_embedding
+
+'''
+Online (turn-by-turn) version of `create_advanced_features_gen2`.
+
+For a battle that is still being played, `OnlineGen2Features` keeps the state
+of the gen2 features and is fed one turn at a time:
+
+    live = OnlineGen2Features(p1_team_details, p2_lead_details, battle_id=battle_id)
+    for turn in incoming_turns:
+        live.update(turn)
+        row = live.snapshot()          # same columns, same order as the batch builder
+
+Every update does a constant amount of work: the HP-difference series is
+reduced to first/last/min/max and the turn of the first sign flip, the boost
+difference to running moments (Welford), damage/healing/status to running sums,
+and the seen multi-hot vectors are filled in place. Static lead/team features
+are computed once in the constructor.
+
+`snapshot()` after the last turn equals the batch row (up to float rounding),
+and after turn t it equals the batch row of the timeline cut at turn t. The
+only difference: the batch builder carries damage_diff_turn10/20 over from the
+previous battle when those turns are never reached with a longer timeline,
+while here they start at 0 for every battle.
+'''
+
+
+_DAMAGE_CHECKPOINTS = (10, 20, 25, 30)
+_STATS = ['base_hp', 'base_atk', 'base_def', 'base_spe', 'base_spa', 'base_spd']
+_EMBEDDING_NAMES = ['hp', 'atk', 'def', 'spa', 'spd', 'spe']
+
+
+class OnlineGen2Features:
+    """
+    Streaming gen2 features of one battle.
+
+    Args:
+        p1_team_details: list of P1's Pokémon dicts (as in the dataset)
+        p2_lead_details: P2's lead dict
+        p2_team_details: P2's team, if known (only used by the p2_team_emb_* columns)
+        battle_id: index of the frame returned by `snapshot_frame`
+    """
+
+    embedding_dim = 6  # hp, atk, def, spa, spd, spe
+
+    def __init__(self, p1_team_details, p2_lead_details, p2_team_details=None, battle_id=None):
+        # copies: the stat filling must not touch the caller's battle
+        p1_team = [fill_missing_stats(dict(p)) for p in p1_team_details]
+        p2_lead = fill_missing_stats(dict(p2_lead_details))
+        self.battle_id = battle_id
+        self.state = BattleState({'p1_team_details': p1_team, 'p2_lead_details': p2_lead,
+                                  'battle_timeline': []})
+        self._static_features(p1_team, p2_lead, p2_team_details or [])
+
+        self.n_turns = 0
+        self.turn_num = 0
+        self.total_damage_dealt = 0
+        self.total_healing_done = 0
+        self.status_turns = 0
+        self.first_faint_turn = 0
+        self.damage_checkpoints = {}
+
+        # HP difference series: first/last/min/max and first sign flip
+        self.hp_diff_first = self.hp_diff_last = 0
+        self.hp_diff_min = self.hp_diff_max = 0
+        self.momentum_shift_turn = 0
+
+        # Boosts: running sums, and Welford mean/M2 of the per-turn difference
+        self.p1_boost_total = 0
+        self.p2_boost_total = 0
+        self.boost_diff_first = self.boost_diff_last = 0
+        self.boost_diff_mean = 0.0
+        self.boost_diff_m2 = 0.0
+
+        self.p1_move_power = [0, 0]  # sum, count
+        self.p2_move_power = [0, 0]
+        self.p1_move_types = set()
+        self.p2_move_types = set()
+        self.p1_switches = 0
+        self.p2_switches = 0
+        self.p1_attacks = 0
+        self.p2_attacks = 0
+        self.p1_seen_encoded = np.zeros(len(POKEMON_LIST), dtype=int)
+        self.p2_seen_encoded = np.zeros(len(POKEMON_LIST), dtype=int)
+
+        # `snapshot_frame`: all/numeric columns, the preallocated numeric row, the layout per column list
+        self._frame_columns = self._numeric_columns = None
+        self._row = self._index = None
+        self._layouts = {}
+
+    @classmethod
+    def from_battle(cls, battle):
+        """Empty live state for a battle dict (its timeline is not replayed)."""
+        return cls(battle['p1_team_details'], battle['p2_lead_details'],
+                   battle.get('p2_team_details'), battle.get('battle_id'))
+
+    def _static_features(self, p1_team, p2_lead, p2_team):
+        p1_lead = p1_team[0]
+        self.lead_speed_diff = p1_lead['base_spe'] - p2_lead['base_spe']
+
+        p1_lead_types = p1_lead.get('types', [])
+        p2_lead_types = p2_lead.get('types', [])
+        self.lead_type_adv = np.prod([get_type_effectiveness(t1, p2_lead_types) for t1 in p1_lead_types]) if p1_lead_types else 1.0
+        self.meta_diff = sum(1 for p in p1_team if p['name'] in META_THREATS_GEN1) - (1 if p2_lead['name'] in META_THREATS_GEN1 else 0)
+        self.status_setup_diff = (
+            sum(1 for m in p1_lead.get('moves', []) if m in STATUS_MOVES or m in SETUP_MOVES)
+            - sum(1 for m in p2_lead.get('moves', []) if m in STATUS_MOVES or m in SETUP_MOVES)
+        )
+        self.total_stats_diff = sum(p1_lead.get(stat, 0) - p2_lead.get(stat, 0) for stat in _STATS)
+        self.lead_stats = lead_stat_features(p1_lead, p2_lead)
+
+        zeros = np.zeros(self.embedding_dim)
+        self.p1_team_emb = aggregate_team_embedding(p1_team, self.embedding_dim)
+        self.p2_team_emb = aggregate_team_embedding(p2_team, self.embedding_dim)
+        self.p1_lead_embedding = pokemon_embeddings.get(p1_lead['name'], zeros)
+        self.p2_lead_embedding = pokemon_embeddings.get(p2_lead['name'], zeros)
+
+    def _seen(self, encoded, name):
+        rank = POKEMON_RANKING.get(name)
+        if rank:  # skip unknown Pokémon, as `encode_pokemon_set`
+            encoded[rank - 1] = 1
+
+    def update(self, turn):
+        """Applies one entry of `battle_timeline`."""
+        state = self.state
+        state.advance(self.n_turns, turn)
+        p1_state, p2_state = state.p1_state, state.p2_state
+        p1, p2 = state.p1, state.p2
+        turn_num = turn.get('turn', 0)
+        self.turn_num = turn_num
+        self.n_turns += 1
+
+        if p2_state.get('hp_pct') is not None:
+            self.total_damage_dealt += max(0, 100 - p2_state['hp_pct'])
+        if p1_state.get('hp_pct') is not None:
+            self.total_healing_done += max(0, p1_state['hp_pct'] - 100)
+        self.status_turns += p1.status_count + p2.status_count
+        if not self.first_faint_turn and (p1.fainted_count or p2.fainted_count):
+            self.first_faint_turn = turn_num
+
+        hp_diff = p1.total_hp - p2.total_hp
+        if self.n_turns == 1:
+            self.hp_diff_first = self.hp_diff_min = self.hp_diff_max = hp_diff
+        else:
+            if not self.momentum_shift_turn and np.sign(hp_diff) != np.sign(self.hp_diff_last):
+                self.momentum_shift_turn = self.n_turns - 1
+            self.hp_diff_min = min(self.hp_diff_min, hp_diff)
+            self.hp_diff_max = max(self.hp_diff_max, hp_diff)
+        self.hp_diff_last = hp_diff
+        if turn_num in _DAMAGE_CHECKPOINTS:
+            self.damage_checkpoints[turn_num] = -hp_diff
+
+        self.p1_boost_total += p1.boost_sum
+        self.p2_boost_total += p2.boost_sum
+        boost_diff = p1.boost_sum - p2.boost_sum
+        if self.n_turns == 1:
+            self.boost_diff_first = boost_diff
+        self.boost_diff_last = boost_diff
+        delta = boost_diff - self.boost_diff_mean
+        self.boost_diff_mean += delta / self.n_turns
+        self.boost_diff_m2 += delta * (boost_diff - self.boost_diff_mean)
+
+        p1_move = turn.get('p1_move_details')
+        p2_move = turn.get('p2_move_details')
+        if p1_move:
+            self.p1_move_power[0] += p1_move.get('base_power', 0)
+            self.p1_move_power[1] += 1
+            self.p1_move_types.add(p1_move.get('type', None))
+        if p2_move:
+            self.p2_move_power[0] += p2_move.get('base_power', 0)
+            self.p2_move_power[1] += 1
+            self.p2_move_types.add(p2_move.get('type', None))
+        p1_action = turn.get('p1_action')
+        p2_action = turn.get('p2_action')
+        self.p1_switches += p1_action == 'switch'
+        self.p2_switches += p2_action == 'switch'
+        self.p1_attacks += p1_action == 'attack'
+        self.p2_attacks += p2_action == 'attack'
+
+        if p1_state.get('name'):
+            self._seen(self.p1_seen_encoded, p1_state['name'])
+        if p2_state.get('name'):
+            self._seen(self.p2_seen_encoded, p2_state['name'])
+        return self
+
+    def damage_diff(self, checkpoint):
+        """Damage difference at `checkpoint`, or the current one if that turn is still to come."""
+        if self.turn_num < checkpoint:
+            return -self.hp_diff_last
+        return self.damage_checkpoints.get(checkpoint, 0)
+
+    def snapshot(self):
+        """Feature dict of the battle so far, with the columns of `create_advanced_features_gen2`."""
+        p1, p2 = self.state.p1, self.state.p2
+        n = self.n_turns
+        per_turn = n or 1
+        hp_advantage = p1.total_hp - p2.total_hp
+        damage_10, damage_20, damage_25, damage_30 = (self.damage_diff(k) for k in _DAMAGE_CHECKPOINTS)
+        hp_trend = (self.hp_diff_last - self.hp_diff_first) / (n - 1) if n > 1 else 0
+        p1_power, p1_moves = self.p1_move_power
+        p2_power, p2_moves = self.p2_move_power
+        aggression_p1 = self.p1_attacks / per_turn
+        aggression_p2 = self.p2_attacks / per_turn
+
+        features = {
+            'lead_speed_diff': self.lead_speed_diff,
+            'hp_advantage_seen': hp_advantage,
+            'mons_revealed_diff': len(p2) - len(p1),
+            'team_status_diff': p1.status_count - p2.status_count,
+            'end_boost_diff': p1.boost_sum - p2.boost_sum,
+            'total_damage_dealt': self.total_damage_dealt,
+            'total_healing_done': self.total_healing_done,
+            'status_turns': self.status_turns,
+            'first_faint_turn': self.first_faint_turn,
+            'lead_type_adv': self.lead_type_adv,
+            'meta_diff': self.meta_diff,
+            'status_setup_diff': self.status_setup_diff,
+            'p1_seen_pokemons': self.p1_seen_encoded.copy(),
+            'p2_seen_pokemons': self.p2_seen_encoded.copy(),
+            'total_stats_diff': self.total_stats_diff,
+            # same column mapping as the batch builder
+            'damage_diff_turn10': damage_25,
+            'damage_diff_turn20': damage_30,
+            'damage_diff_turn25': damage_25,
+            'damage_diff_turn30': damage_30,
+            'hp_trend_diff': hp_trend,
+            'feat_switch_diff': self.p1_switches - self.p2_switches,
+            'feat_aggression_diff': aggression_p1 - aggression_p2,
+            # the batch builder overwrites these with the final-state per-turn series below
+            'hp_diff_std': 0.0,
+            'hp_diff_range': self.hp_diff_max - self.hp_diff_min,
+            'momentum_shift_turn': self.momentum_shift_turn,
+            'comeback_score': 0.0,
+            'early_sustain': 0.0,
+            'status_balance': n * (p1.status_count - p2.status_count),
+            'boost_volatility': np.sqrt(self.boost_diff_m2 / n) if n else 0,
+            'boost_trend': (self.boost_diff_last - self.boost_diff_first) / (n - 1) if n > 1 else np.nan,
+            'move_power_diff': (p1_power / p1_moves if p1_moves else 0) - (p2_power / p2_moves if p2_moves else 0),
+            'move_diversity_diff': len(self.p1_move_types) - len(self.p2_move_types),
+            'stall_ratio': 1.0,
+            'aggression_index': 0.0,
+        }
+
+        features['stats_speed_interaction'] = self.total_stats_diff * self.lead_speed_diff
+        features['hp_vs_stats_ratio'] = hp_advantage / self.total_stats_diff if self.total_stats_diff != 0 else 0
+        features['damage_ratio_turn25_30'] = damage_25 / damage_30 if damage_30 != 0 else 0
+        features['damage_ratio_turn20_25'] = damage_20 / damage_25 if damage_25 != 0 else 0
+        features['damage_ratio_turn10_20'] = damage_10 / damage_20 if damage_20 != 0 else 0
+        features['damage_ratio_turn10_30'] = damage_10 / damage_30 if damage_30 != 0 else 0
+        features.update(self.lead_stats)
+        features['feat_hp_trend_diff'] = hp_trend
+        features['feat_status_diff_inflicted'] = p2.status_count - p1.status_count
+
+        features['p1_hp_mean'] = p1.total_hp
+        features['p2_hp_mean'] = p2.total_hp
+        features['hp_diff_mean'] = hp_advantage
+        features['hp_diff_last'] = hp_advantage
+        features['p1_boost_mean'] = self.p1_boost_total / per_turn
+        features['p2_boost_mean'] = self.p2_boost_total / per_turn
+        features['boost_diff_mean'] = (self.p1_boost_total - self.p2_boost_total) / per_turn
+        features['p1_status_total'] = n * p1.status_count
+        features['p2_status_total'] = n * p2.status_count
+        features['momentum_flips'] = 0
+        features['p1_aggression'] = aggression_p1
+        features['p2_aggression'] = aggression_p2
+        features['aggression_diff'] = aggression_p1 - aggression_p2
+
+        for i, val in enumerate(self.p1_team_emb):
+            features[f'p1_team_emb_{i}'] = val
+        for i, val in enumerate(self.p2_team_emb):
+            features[f'p2_team_emb_{i}'] = val
+        for stat_name, val in zip(_EMBEDDING_NAMES, self.p1_lead_embedding):
+            features[f'p1_lead_{stat_name}'] = val
+        for stat_name, val in zip(_EMBEDDING_NAMES, self.p2_lead_embedding):
+            features[f'p2_lead_{stat_name}'] = val
+        return features
+
+    def _frame_layout(self, columns):
+        """Positions in the numeric row of the numeric `columns`, and where the seen arrays go."""
+        key = None if columns is None else tuple(columns)
+        if key not in self._layouts:
+            names = list(columns) if columns is not None else self._frame_columns
+            position = {c: j for j, c in enumerate(self._numeric_columns)}
+            numeric = [c for c in names if c not in SEEN_POKEMON_COLUMNS]
+            objects = [(loc, c) for loc, c in enumerate(names) if c in SEEN_POKEMON_COLUMNS]
+            self._layouts[key] = (pd.Index(numeric), [position[c] for c in numeric], objects)
+        return self._layouts[key]
+
+    def snapshot_frame(self, columns=None):
+        """
+        `snapshot()` as a one-row DataFrame indexed by battle_id, ready for a fitted pipeline.
+
+        The numbers are written into a row preallocated on the first call and the
+        frame is one float64 block taken from it (the integer features are exact
+        in float64), which is much cheaper than building a frame from the dict
+        every turn; only the seen-Pokémon arrays are added as object columns.
+
+        Args:
+            columns: columns to return, in this order (default: every column)
+        """
+        features = self.snapshot()
+        if self._row is None:
+            self._frame_columns = list(features)
+            self._numeric_columns = [c for c in features if c not in SEEN_POKEMON_COLUMNS]
+            self._row = np.zeros((1, len(self._numeric_columns)))
+            self._index = pd.Index([self.battle_id], name='battle_id')
+        numeric, positions, objects = self._frame_layout(columns)
+        self._row[0] = [features[c] for c in self._numeric_columns]
+
+        # fancy indexing copies: the frame does not share the preallocated row
+        frame = pd.DataFrame(self._row[:, positions], columns=numeric, index=self._index)
+        for loc, column in objects:
+            value = np.empty(1, dtype=object)
+            value[0] = features[column]
+            frame.insert(loc, column, value)
+        return frame
+
+
+def live_win_probability(pipeline, battle, columns=None):
+    """
+    Replays `battle` turn by turn and yields P1's win probability after every turn.
+
+    Args:
+        pipeline: fitted classifier/pipeline trained on gen2 features
+        battle: battle dict; its `battle_timeline` may be a live iterator of turns
+        columns: feature columns the pipeline was fitted on (default: every column)
+
+    Yields:
+        (turn number, probability of `player_won`)
+    """
+    live = OnlineGen2Features.from_battle(battle)
+    for turn in battle['battle_timeline'] or []:
+        row = live.update(turn).snapshot_frame(columns)
+        yield live.turn_num, pipeline.predict_proba(row)[0, 1]
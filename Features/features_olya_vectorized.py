@@ -0,0 +1,796 @@
+import numpy as np
+import pandas as pd
+
+from utils.extra import (
+    STATUS_MOVES,
+    SETUP_MOVES,
+    POKEMON_LIST,
+    pokemon_embeddings
+)
+
+from utils.functions import (
+    accepts_chunks,
+    multi_hot_matrix,
+    replace_with_sparse_columns,
+    SEEN_POKEMON_COLUMNS
+)
+
+from utils.battle_cache import Vocab, MISSING, MISSING_STATUS_KEY
+from utils.turn_table import build_turn_table, turn_table_from_columns, ACTION_CODES
+from utils.type_chart import lead_type_product
+from utils.team_table import TeamTable, build_team_table, team_table_from_columns
+from utils.damage import damage_engine, turns_to_ko, MAX_TURNS_TO_KO
+from utils.interning import InternedVocab
+from utils.compact import compact_dtypes
+from utils.team_embedding import (
+    embedding_table,
+    team_id_matrix,
+    team_embedding_block,
+    team_embedding_columns,
+    seen_embedding_mean,
+    cosine_similarity_rows
+)
+
+
+'''
+NumPy engine for `create_advanced_features_gen2` (Features/features_olya.py).
+
+Produces the same columns, in the same order and with the same values, but
+the timelines are flattened once into a `TurnTable` and every feature is
+computed with whole-column operations:
+
+* the per-Pokémon "seen status" dicts become a sort by (battle, Pokémon) and
+  forward fills of hp/status inside each group; team HP is a (turns x Pokémon)
+  matrix summed in dict insertion order, so totals match bit for bit;
+* counts, means, std and diffs are segment reductions over the battles;
+* `momentum_shift_turn` is a sign-change search, the `damage_diff_turn*`
+  snapshots are gathers of the row selected for each checkpoint.
+
+The quirks of the reference implementation are kept on purpose, so the two
+functions can be swapped: e.g. `damage_diff_turn10/20` hold the turn-25/30
+values, and the "per-turn" HP/status aggregates use the end-of-battle
+seen status (so `hp_diff_std`, `comeback_score`, `early_sustain`,
+`momentum_flips` and `aggression_index` are 0 and `stall_ratio` is 1).
+
+Two entry points: `create_advanced_features_gen2_vectorized(df)` takes the
+usual DataFrame (the dicts are still read once to build the turn table),
+`create_advanced_features_gen2_from_columns(cols)` reads the columnar cache
+directly and skips the dicts altogether. With `seen='sparse'` both return the
+seen-Pokémon multi-hots as sparse int8 columns (`p1_seen_pokemons_0`, ...)
+instead of one array per row in an object column.
+
+The turn snapshots are exposed on their own by `turn_snapshots(df)` (or
+`turn_snapshots_from_columns(cols)`): a `TurnSnapshots` keeps the per-turn
+team HP / boost / status series and reads them at any list of turns, e.g.
+`create_turn_snapshot_features(df, turns=range(5, 35, 5))`.
+'''
+
+
+EMB_STATS = ['hp', 'atk', 'def', 'spa', 'spd', 'spe']
+EMBEDDING_DIM = 6
+SNAPSHOT_TURNS = (10, 20, 25, 30)
+CHECKPOINT_TURNS = tuple(range(5, 35, 5))
+CHECKPOINT_FEATURES = ('hp', 'damage', 'boost', 'status')
+
+
+# --- Battle-level helpers ---
+
+def _status_setup_count(mon):
+    return sum(1 for m in mon.get('moves', []) if m in STATUS_MOVES or m in SETUP_MOVES)
+
+
+def _status_setup_counts(cols, prefix):
+    """`_status_setup_count` of every `prefix` row ('team', 'lead') of a `BattleColumns` entry."""
+    is_status_setup = np.array([m in STATUS_MOVES or m in SETUP_MOVES for m in cols.vocab['move']] + [False])
+    offsets = np.asarray(cols[f'{prefix}_moves_offsets'])
+    counts = np.concatenate([[0], np.cumsum(is_status_setup[np.asarray(cols[f'{prefix}_moves'], dtype=np.int64)])])
+    return counts[offsets[1:]] - counts[offsets[:-1]]
+
+
+# --- Turn-level helpers ---
+
+def _segment_cumsum(values, table):
+    """Cumulative sum that restarts at every battle."""
+    cs = np.cumsum(values)
+    before = np.concatenate([[0.0], cs])[table.offsets[:-1]]
+    return cs - np.repeat(before, table.lengths)
+
+
+def _ffill(values, valid, group_start, default):
+    """Forward fill inside groups; rows before the first valid value get `default`."""
+    idx = np.where(valid | group_start, np.arange(len(values)), 0)
+    idx = np.maximum.accumulate(idx) if len(idx) else idx
+    return np.where(valid[idx], values[idx], default)
+
+
+def _slot_order(keys, order, n_codes):
+    """Position of every (battle, Pokémon) key inside its battle, following `order`."""
+    battles = keys // n_codes
+    srt = np.lexsort((order, battles))
+    sorted_battles = battles[srt]
+    first = np.searchsorted(sorted_battles, sorted_battles, side='left')
+    slots = np.empty(len(keys), dtype=np.int64)
+    slots[srt] = np.arange(len(keys)) - first
+    return slots
+
+
+def _track_side(table, side, initial_keys, initial_order, n_codes):
+    """
+    Replays the `pX_seen_status` dict of one side for every turn at once.
+
+    `initial_keys` are the (battle * n_codes + Pokémon id + 1) keys known before
+    the first turn, `initial_order` their insertion position in the dict.
+    Returns per-row team HP total, status count and fainted count (after the
+    update of that row) plus the number of Pokémon revealed by the timeline.
+    """
+    n_battles, n_turns = len(table), table.n_turns
+    names = np.asarray(table[f'{side}_name'])
+    rows = np.flatnonzero(names >= 0)
+    keys = table.battle_index[rows].astype(np.int64) * n_codes + names[rows] + 1
+    order = np.argsort(keys, kind='stable')
+    rows, keys = rows[order], keys[order]
+    start = np.ones(len(keys), dtype=bool)
+    start[1:] = keys[1:] != keys[:-1]
+
+    hp = np.asarray(table[f'{side}_hp_pct'])[rows]
+    eff_hp = _ffill(hp, ~np.isnan(hp), start, 100.0)
+    status = np.asarray(table[f'{side}_status'])[rows]
+    eff_status = _ffill(status, status != MISSING_STATUS_KEY, start, MISSING)
+
+    was_seen = np.isin(keys, initial_keys)
+    has_status = (eff_status != MISSING).astype(float)
+    prev_status = np.where(start, 0.0, np.roll(has_status, 1))
+    fainted = (eff_hp <= 0).astype(float)
+    prev_fainted = np.where(start, 0.0, np.roll(fainted, 1))
+
+    def per_row(delta):
+        out = np.zeros(n_turns)
+        out[rows] = delta
+        return _segment_cumsum(out, table)
+
+    status_count = per_row(has_status - prev_status)
+    fainted_count = per_row(fainted - prev_fainted)
+
+    # Team HP: one column per Pokémon in dict insertion order (known ones first,
+    # then new ones by first appearance), summed left to right like `sum(...)`.
+    new_keys = keys[start][~was_seen[start]]
+    all_keys = np.concatenate([initial_keys, new_keys])
+    all_order = np.concatenate([initial_order, n_turns + 1 + rows[start][~was_seen[start]]])
+    slots = _slot_order(all_keys, all_order, n_codes)
+    n_slots = int(slots.max()) + 1 if len(slots) else 1
+    by_key = np.argsort(all_keys, kind='stable')
+    row_slot = slots[by_key[np.searchsorted(all_keys[by_key], keys)]]
+
+    current = np.full((n_turns, n_slots), np.nan)
+    current[rows, row_slot] = eff_hp
+    initial = np.zeros((n_battles, n_slots))
+    initial[initial_keys // n_codes, slots[:len(initial_keys)]] = 100.0
+    updated = ~np.isnan(current)
+    battle_start = np.zeros(n_turns, dtype=bool)
+    battle_start[table.offsets[:-1][table.lengths > 0]] = True
+    last_update = np.where(updated | battle_start[:, None], np.arange(n_turns)[:, None], 0)
+    if n_turns:
+        last_update = np.maximum.accumulate(last_update, axis=0)
+    slot_idx = np.arange(n_slots)[None, :]
+    hp_matrix = np.where(updated[last_update, slot_idx], current[last_update, slot_idx],
+                         initial[table.battle_index][:, :n_slots])
+    total_hp = np.zeros(n_turns) if n_slots == 0 else hp_matrix[:, 0].copy()
+    for j in range(1, n_slots):
+        total_hp += hp_matrix[:, j]
+
+    battle_of_group = table.battle_index[rows[start]]
+    revealed = np.bincount(battle_of_group, weights=~was_seen[start], minlength=n_battles)
+    return total_hp, status_count, fainted_count, revealed
+
+
+def _last_value(values, table, empty):
+    last = table.last_index()
+    return np.where(last >= 0, np.asarray(values)[np.maximum(last, 0)], empty)
+
+
+def _segment_std(values, table):
+    mean = table.segment_mean(values)
+    centered = values - np.repeat(mean, table.lengths)
+    return np.sqrt(table.segment_mean(centered ** 2))
+
+
+def _ratio(num, den):
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+
+
+def _boost_series(table, side):
+    """Boost sum of every row, 0 where the side has no boosts."""
+    return np.where(np.asarray(table[f'{side}_has_boosts']) == 1, table[f'{side}_boost_sum'], 0).astype(float)
+
+
+class TurnSnapshots:
+    """
+    Per-turn team HP, damage, boost and status series of a set of battles,
+    built once and read at any turn.
+
+    The value at turn k is the one after turn k; a battle that ended before k
+    gives its last turn, a battle with no turn k (nor a later end) gives `fill`.
+    Every query is one `searchsorted` over the rows sorted by (battle, turn) and
+    one gather, for all battles at once:
+
+        snaps = turn_snapshots(df)
+        snaps.at(range(5, 35, 5))               # hp/damage/boost/status diffs every 5 turns
+        snaps.values('damage', 25)              # one array, as `damage_diff_turn25`
+
+    Unlike the gen2 columns, `damage_diff_turn10/20` here are the turn-10/20 values.
+    """
+
+    def __init__(self, table, battle_ids, p1_hp, p2_hp, p1_status, p2_status):
+        self.table = table
+        self.battle_ids = np.asarray(battle_ids)
+        self.turns = np.asarray(table['turn'], dtype=np.int64)
+        self.series = {
+            'hp': p1_hp - p2_hp,
+            'damage': (600 - p1_hp) - (600 - p2_hp),
+            'boost': _boost_series(table, 'p1') - _boost_series(table, 'p2'),
+            'status': p1_status - p2_status,
+        }
+        battle_index = np.asarray(table.battle_index, dtype=np.int64)
+        self._order = np.lexsort((np.arange(len(self.turns)), self.turns, battle_index))
+        self._stride = int(self.turns.max()) + 2 if len(self.turns) else 1
+        self._keys = battle_index[self._order] * self._stride + self.turns[self._order]
+
+    def __len__(self):
+        return len(self.battle_ids)
+
+    def rows_at(self, turn):
+        """Row of every battle at `turn` (-1 if there is none)."""
+        n = len(self)
+        query = np.arange(n) * self._stride + min(max(turn, -1), self._stride - 1)
+        pos = np.searchsorted(self._keys, query, side='right') - 1
+        rows = self._order[np.maximum(pos, 0)] if len(self._order) else np.zeros(n, dtype=np.int64)
+        offsets = self.table.offsets
+        inside = (pos >= 0) & (rows >= offsets[:-1]) & (rows < offsets[1:])
+        valid = inside & ((self.turns[rows] == turn) | (rows == offsets[1:] - 1)) if len(self._order) else inside
+        return np.where(valid, rows, -1)
+
+    def values(self, feature, turn, fill=0):
+        """Difference `feature` ('hp', 'damage', 'boost' or 'status') of every battle at `turn`."""
+        rows = self.rows_at(turn)
+        series = self.series[feature]
+        return np.where(rows >= 0, series[np.maximum(rows, 0)] if len(series) else fill, fill)
+
+    def at(self, turns=CHECKPOINT_TURNS, features=CHECKPOINT_FEATURES, fill=0):
+        """
+        DataFrame indexed by battle_id with one `{feature}_diff_turn{k}` column
+        per feature and turn.
+        """
+        columns = {}
+        for turn in turns:
+            rows = self.rows_at(turn)
+            safe = np.maximum(rows, 0)
+            for feature in features:
+                series = self.series[feature]
+                columns[f'{feature}_diff_turn{turn}'] = np.where(rows >= 0, series[safe] if len(series) else fill, fill)
+        return pd.DataFrame(columns, index=pd.Index(self.battle_ids, name='battle_id'))
+
+
+def _seen_keys(team_codes, team_offsets, lead_codes, n_codes):
+    """(battle, Pokémon) keys known before the first turn: P1's team (with dict order) and P2's lead."""
+    n = len(lead_codes)
+    team_battle = np.repeat(np.arange(n), np.diff(team_offsets))
+    # -1 (unknown name) is kept apart from real ids by shifting every id by one
+    p1_keys, p1_first = np.unique(team_battle * n_codes + team_codes + 1, return_index=True)
+    p1_order = p1_first - team_offsets[p1_keys // n_codes]
+    p2_keys = np.arange(n) * n_codes + lead_codes + 1
+    return team_battle, p1_keys, p1_order, p2_keys
+
+
+def _gen2_columns(table, battle_ids, pokemon_names, team_codes, team_offsets, lead_codes,
+                  p1_stats, p2_stats, lead_type_adv, status_setup_diff, p2_team=None, seen='array'):
+    """
+    Core of the engine: every input is an array, one entry per battle (or per
+    team slot for `team_codes`). Pokémon ids index `pokemon_names`, -1 = unknown.
+
+    Returns:
+        dict column name -> array, in the column order of the reference function
+        (the seen-Pokémon columns hold CSR matrices when `seen='sparse'`)
+    """
+    n = len(battle_ids)
+    n_codes = len(pokemon_names) + 1
+    team_battle, p1_keys, p1_order, p2_keys = _seen_keys(team_codes, team_offsets, lead_codes, n_codes)
+    p1_initial_count = np.bincount(p1_keys // n_codes, minlength=n)
+    p1_hp, p1_atk, p1_def, p1_spa, p1_spd, p1_spe = p1_stats.T
+    p2_hp, p2_atk, p2_def, p2_spa, p2_spd, p2_spe = p2_stats.T
+
+    # --- Seen-status replay ---
+    lengths = table.lengths
+    turns = np.asarray(table['turn'], dtype=np.int64)
+    p1_total, p1_status_count, p1_fainted, p1_revealed = _track_side(table, 'p1', p1_keys, p1_order, n_codes)
+    p2_total, p2_status_count, p2_fainted, p2_revealed = _track_side(table, 'p2', p2_keys, np.zeros(n), n_codes)
+    hp_diff = p1_total - p2_total
+
+    p1_final_hp = _last_value(p1_total, table, 100.0 * p1_initial_count)
+    p2_final_hp = _last_value(p2_total, table, 100.0)
+    p1_final_status = _last_value(p1_status_count, table, 0.0)
+    p2_final_status = _last_value(p2_status_count, table, 0.0)
+
+    p2_hp_row = np.asarray(table['p2_hp_pct'])
+    p1_hp_row = np.asarray(table['p1_hp_pct'])
+    feat_total_damage_dealt = table.segment_sum(np.where(np.isnan(p2_hp_row), 0.0, np.maximum(0, 100 - p2_hp_row)))
+    feat_total_healing_done = table.segment_sum(np.where(np.isnan(p1_hp_row), 0.0, np.maximum(0, p1_hp_row - 100)))
+    feat_status_turns = table.segment_sum(p1_status_count + p2_status_count)
+
+    rows = np.arange(table.n_turns)
+    faint_rows = ((p1_fainted > 0) | (p2_fainted > 0)) & (turns != 0)
+    first_faint_row = table.segment_min(np.where(faint_rows, rows, np.inf), empty=np.inf)
+    feat_first_faint_turn = np.where(np.isfinite(first_faint_row),
+                                     turns[np.where(np.isfinite(first_faint_row), first_faint_row, 0).astype(np.int64)], 0)
+
+    # --- Snapshots ---
+    snaps = TurnSnapshots(table, battle_ids, p1_total, p2_total, p1_status_count, p2_status_count)
+    snapshots = {k: snaps.values('damage', k) for k in SNAPSHOT_TURNS}
+
+    # --- Trends on the real HP-difference series ---
+    first_row = np.repeat(table.offsets[:-1], lengths)
+    not_first = rows != first_row
+    step = np.zeros(table.n_turns)
+    step[1:] = np.diff(hp_diff)
+    step[~not_first] = 0
+    feat_hp_trend_diff = np.where(lengths > 1, _ratio(table.segment_sum(step), lengths - 1), 0)
+    feat_hp_diff_range = np.where(lengths > 0, table.segment_max(hp_diff, 0) - table.segment_min(hp_diff, 0), 0)
+
+    sign = np.sign(hp_diff)
+    flipped = np.zeros(table.n_turns, dtype=bool)
+    flipped[1:] = sign[1:] != sign[:-1]
+    flipped &= not_first
+    first_flip = table.segment_min(np.where(flipped, rows - first_row, np.inf), empty=np.inf)
+    feat_momentum_shift_turn = np.where(np.isfinite(first_flip), first_flip, 0).astype(np.int64)
+
+    # --- Boosts ---
+    p1_boost = _boost_series(table, 'p1')
+    p2_boost = _boost_series(table, 'p2')
+    boost_diff = p1_boost - p2_boost
+    feat_end_boost_diff = _last_value(np.asarray(table['p1_boost_sum'], dtype=np.int64)
+                                      - np.asarray(table['p2_boost_sum'], dtype=np.int64), table, 0)
+    feat_boost_volatility = np.where(lengths > 0, _segment_std(boost_diff, table), 0)
+    boost_step = np.zeros(table.n_turns)
+    boost_step[1:] = np.diff(boost_diff)
+    boost_step[~not_first] = 0
+    feat_boost_trend = np.where(lengths > 1, _ratio(table.segment_sum(boost_step), lengths - 1), np.nan)
+
+    # --- Moves and actions ---
+    for_moves = {}
+    for side in ('p1', 'p2'):
+        has_move = np.asarray(table[f'{side}_has_move']) == 1
+        n_moves = table.segment_count(has_move)
+        power = table.segment_sum(np.where(has_move, table[f'{side}_base_power'], 0))
+        mean_power = _ratio(power, n_moves)
+        move_battles = table.battle_index[has_move].astype(np.int64)
+        move_types = np.asarray(table[f'{side}_move_type'])[has_move].astype(np.int64) + 1
+        pairs = np.unique(move_battles * (len(table.vocab['move_type']) + 2) + move_types)
+        variety = np.bincount(pairs // (len(table.vocab['move_type']) + 2), minlength=n)
+        action = np.asarray(table[f'{side}_action'])
+        for_moves[side] = {
+            'power': mean_power,
+            'variety': variety,
+            'switches': table.segment_count(action == ACTION_CODES['switch']).astype(np.int64),
+            'attacks': table.segment_count(action == ACTION_CODES['attack']),
+        }
+    feat_move_power_diff = for_moves['p1']['power'] - for_moves['p2']['power']
+    feat_move_diversity_diff = for_moves['p1']['variety'] - for_moves['p2']['variety']
+    feat_switch_diff = for_moves['p1']['switches'] - for_moves['p2']['switches']
+    p1_aggression = _ratio(for_moves['p1']['attacks'], lengths)
+    p2_aggression = _ratio(for_moves['p2']['attacks'], lengths)
+
+    # --- Static features ---
+    feat_lead_speed_diff = p1_spe - p2_spe
+    feat_hp_advantage_seen = p1_final_hp - p2_final_hp
+    feat_mons_revealed_diff = (1 + p2_revealed - (p1_initial_count + p1_revealed)).astype(np.int64)
+    feat_team_status_diff = (p1_final_status - p2_final_status).astype(np.int64)
+    pokemon = InternedVocab('pokemon', pokemon_names)
+    is_meta = pokemon.is_meta_threat
+    feat_meta_diff = (np.bincount(team_battle, weights=is_meta[team_codes], minlength=n)
+                      - is_meta[lead_codes]).astype(np.int64)
+    feat_total_stats_diff = (p1_stats - p2_stats)[:, [0, 1, 2, 5, 3, 4]].sum(axis=1)
+
+    # `encode_pokemon_set`: multi-hot over the strength ranking
+    rank_of = pokemon.strength_rank - 1
+    seen_by_side = {}
+    for side in ('p1', 'p2'):
+        ranks = rank_of[np.asarray(table[f'{side}_name'])]
+        ranked = ranks >= 0
+        multi_hot = multi_hot_matrix(table.battle_index[ranked], ranks[ranked], n, len(POKEMON_LIST))
+        seen_by_side[side] = multi_hot if seen == 'sparse' else list(multi_hot.toarray().astype(int))
+
+    emb = embedding_table(pokemon_names, EMBEDDING_DIM)
+    p1_team_emb = team_embedding_block(team_id_matrix(team_codes, team_offsets), emb, dtype=float)
+    if p2_team is not None:
+        p2_team_emb = team_embedding_block(team_id_matrix(*p2_team), emb, dtype=float)
+    else:
+        p2_team_emb = np.zeros((n, EMBEDDING_DIM))
+    p1_lead_codes = np.where(np.diff(team_offsets) > 0, team_codes[np.minimum(team_offsets[:-1], len(team_codes) - 1)], -1)
+    p1_lead_emb = emb[p1_lead_codes]
+    p2_lead_emb = emb[lead_codes]
+    # the reference falls back to float zeros for a lead without embedding: the column is float64 then
+    has_embedding = np.array([name in pokemon_embeddings for name in pokemon_names] + [False])
+    p1_lead_dtype = np.int64 if has_embedding[p1_lead_codes].all() else np.float64
+    p2_lead_dtype = np.int64 if has_embedding[lead_codes].all() else np.float64
+
+    # --- Per-turn aggregates (computed on the end-of-battle seen status, as in the reference) ---
+    p1_status_truthy = p1_final_status
+    p2_status_truthy = p2_final_status
+    hp_diff_final = p1_final_hp - p2_final_hp
+
+    d25, d30 = snapshots[25], snapshots[30]
+    d10, d20 = snapshots[10], snapshots[20]
+    lead_totals_p1 = p1_stats.sum(axis=1)
+    lead_totals_p2 = p2_stats.sum(axis=1)
+    no_turns = lengths == 0
+
+    columns = {
+        'battle_id': battle_ids,
+        'lead_speed_diff': feat_lead_speed_diff,
+        'hp_advantage_seen': feat_hp_advantage_seen,
+        'mons_revealed_diff': feat_mons_revealed_diff,
+        'team_status_diff': feat_team_status_diff,
+        'end_boost_diff': feat_end_boost_diff.astype(np.int64),
+        'total_damage_dealt': feat_total_damage_dealt,
+        'total_healing_done': feat_total_healing_done.astype(np.int64),
+        'status_turns': feat_status_turns.astype(np.int64),
+        'first_faint_turn': feat_first_faint_turn.astype(np.int64),
+        'lead_type_adv': np.asarray(lead_type_adv, dtype=float),
+        'meta_diff': feat_meta_diff,
+        'status_setup_diff': np.asarray(status_setup_diff, dtype=np.int64),
+        'p1_seen_pokemons': seen_by_side['p1'],
+        'p2_seen_pokemons': seen_by_side['p2'],
+        'total_stats_diff': feat_total_stats_diff,
+        'damage_diff_turn10': d25,
+        'damage_diff_turn20': d30,
+        'damage_diff_turn25': d25,
+        'damage_diff_turn30': d30,
+        'hp_trend_diff': feat_hp_trend_diff,
+        'feat_switch_diff': feat_switch_diff,
+        'feat_aggression_diff': p1_aggression - p2_aggression,
+        'hp_diff_std': np.zeros(n),
+        'hp_diff_range': feat_hp_diff_range,
+        'momentum_shift_turn': feat_momentum_shift_turn,
+        'comeback_score': np.zeros(n),
+        'early_sustain': np.zeros(n),
+        'status_balance': ((p1_status_truthy - p2_status_truthy) * lengths).astype(np.int64),
+        'boost_volatility': feat_boost_volatility,
+        'boost_trend': feat_boost_trend,
+        'move_power_diff': feat_move_power_diff,
+        'move_diversity_diff': feat_move_diversity_diff,
+        'stall_ratio': np.where(no_turns, 0.0, 1.0),
+        'aggression_index': np.zeros(n),
+        'stats_speed_interaction': feat_total_stats_diff * feat_lead_speed_diff,
+        'hp_vs_stats_ratio': _ratio(feat_hp_advantage_seen, feat_total_stats_diff),
+        'damage_ratio_turn25_30': _ratio(d25, d30),
+        'damage_ratio_turn20_25': _ratio(d20, d25),
+        'damage_ratio_turn10_20': _ratio(d10, d20),
+        'damage_ratio_turn10_30': _ratio(d10, d30),
+        'p1_lead_special_total': p1_spa + p1_spd,
+        'p2_lead_special_total': p2_spa + p2_spd,
+        'special_total_diff': (p1_spa + p1_spd) - (p2_spa + p2_spd),
+        'p1_lead_physical_total': p1_atk + p1_def,
+        'p2_lead_physical_total': p2_atk + p2_def,
+        'physical_total_diff': (p1_atk + p1_def) - (p2_atk + p2_def),
+        'atk_def_ratio_p1': p1_atk / (p1_def + 1),
+        'atk_def_ratio_p2': p2_atk / (p2_def + 1),
+        'hp_speed_interaction_lead': p1_hp * p1_spe,
+        'hp_def_ratio_p1': p1_hp / (p1_def + 1),
+        'hp_def_ratio_p2': p2_hp / (p2_def + 1),
+        'hp_vs_total_stats_p1': p1_hp / (lead_totals_p1 - p1_hp + 1),
+        'hp_vs_total_stats_p2': p2_hp / (lead_totals_p2 - p2_hp + 1),
+        'lead_total_stats_p1': lead_totals_p1,
+        'lead_total_stats_p2': lead_totals_p2,
+        'atk_hp_ratio_p1': p1_atk / (p1_hp + 1),
+        'atk_hp_ratio_p2': p2_atk / (p2_hp + 1),
+        'def_hp_ratio_p1': p1_def / (p1_hp + 1),
+        'def_hp_ratio_p2': p2_def / (p2_hp + 1),
+        'feat_hp_trend_diff': feat_hp_trend_diff,
+        'feat_status_diff_inflicted': (p2_status_truthy - p1_status_truthy).astype(np.int64),
+        'p1_hp_mean': np.where(no_turns, np.nan, p1_final_hp),
+        'p2_hp_mean': np.where(no_turns, np.nan, p2_final_hp),
+        'hp_diff_mean': np.where(no_turns, np.nan, hp_diff_final),
+        'hp_diff_last': hp_diff_final,
+        'p1_boost_mean': table.segment_mean(p1_boost),
+        'p2_boost_mean': table.segment_mean(p2_boost),
+        'boost_diff_mean': table.segment_mean(boost_diff),
+        'p1_status_total': (p1_status_truthy * lengths).astype(np.int64),
+        'p2_status_total': (p2_status_truthy * lengths).astype(np.int64),
+        'momentum_flips': np.zeros(n, dtype=np.int64),
+        'p1_aggression': p1_aggression,
+        'p2_aggression': p2_aggression,
+        'aggression_diff': p1_aggression - p2_aggression,
+    }
+    for i in range(p1_team_emb.shape[1]):
+        columns[f'p1_team_emb_{i}'] = p1_team_emb[:, i]
+    for i in range(p2_team_emb.shape[1]):
+        columns[f'p2_team_emb_{i}'] = p2_team_emb[:, i]
+    for j, stat_name in enumerate(EMB_STATS):
+        columns[f'p1_lead_{stat_name}'] = p1_lead_emb[:, j].astype(p1_lead_dtype)
+    for j, stat_name in enumerate(EMB_STATS):
+        columns[f'p2_lead_{stat_name}'] = p2_lead_emb[:, j].astype(p2_lead_dtype)
+
+    return columns
+
+
+def _team_inputs(teams):
+    """Team / lead arguments of `_gen2_columns` from a `TeamTable`."""
+    return {
+        'team_codes': teams['team_name'],
+        'team_offsets': teams.team_offsets,
+        'lead_codes': teams['lead_name'],
+        'p1_stats': teams.lead_stats('p1'),
+        'p2_stats': teams.lead_stats('p2'),
+        'lead_type_adv': lead_type_product(teams.lead_types('p1'), teams.lead_types('p2')),
+    }
+
+
+def _flatten_teams(teams, vocab):
+    codes = [[vocab.code(p.get('name')) for p in (team or [])] for team in teams]
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(c) for c in codes])
+    flat = np.fromiter((c for team in codes for c in team), dtype=np.int64, count=offsets[-1])
+    return flat, offsets
+
+
+def _to_frame(columns):
+    matrices = {c: columns[c] for c in SEEN_POKEMON_COLUMNS if not isinstance(columns[c], list)}
+    # a placeholder keeps the position of each matrix, which is then expanded in place
+    frame = pd.DataFrame({c: 0 if c in matrices else v for c, v in columns.items()}).set_index('battle_id')
+    for column, matrix in matrices.items():
+        frame = replace_with_sparse_columns(frame, column, matrix)
+    return frame
+
+
+@accepts_chunks
+def create_advanced_features_gen2_vectorized(df, seen='array'):
+    """
+    Vectorized drop-in replacement for `create_advanced_features_gen2`.
+
+    The nested dicts are read once (to build the turn table and the team ids),
+    everything else runs on arrays.
+
+    Args:
+        df: battles DataFrame (as returned by `load_jsonl`) or an iterable of chunks
+        seen: 'array' (one multi-hot array per row, as the reference) or 'sparse'
+            (sparse int8 columns `p1_seen_pokemons_<i>`, see `sparse_seen_pokemons`)
+
+    Returns:
+        pd.DataFrame indexed by battle_id, same columns as the reference function
+    """
+    vocab = Vocab()
+    teams = build_team_table(df['p1_team_details'], df['p2_lead_details'], vocab={'pokemon': vocab})
+    table = build_turn_table(df['battle_timeline'], vocab={'pokemon': vocab})
+    p2_team = _flatten_teams(df['p2_team_details'], vocab) if 'p2_team_details' in df.columns else None
+    # lead move lists are not part of the team table
+    status_setup_diff = [_status_setup_count(team[0]) - _status_setup_count(lead)
+                         for team, lead in zip(df['p1_team_details'], df['p2_lead_details'])]
+
+    columns = _gen2_columns(
+        table,
+        battle_ids=df['battle_id'].to_numpy(),
+        pokemon_names=vocab.to_list(),
+        status_setup_diff=status_setup_diff,
+        p2_team=p2_team,
+        seen=seen,
+        **_team_inputs(teams),
+    )
+    return _to_frame(columns)
+
+
+def create_advanced_features_gen2_from_columns(cols, table=None, seen='array', compact=False, categories=None):
+    """
+    Same features, computed straight from the columnar cache (`utils.battle_cache`),
+    without touching any dict: on a warm cache this is the fastest path.
+
+    Args:
+        cols: BattleColumns (e.g. from `main.load_columns`)
+        table: optional TurnTable already derived from `cols` (see `turn_table_from_columns`)
+        seen: 'array' or 'sparse', as in `create_advanced_features_gen2_vectorized`
+        compact: fixed-width ints / float32 / sparse seen columns (`utils.compact.compact_dtypes`)
+        categories: with `compact`, dict column -> categories (`utils.compact.shared_categories`)
+
+    Returns:
+        pd.DataFrame indexed by battle_id
+    """
+    if table is None:
+        table = turn_table_from_columns(cols)
+    teams = team_table_from_columns(cols)
+    # P1's lead is the first team slot (row -1, i.e. the appended 0, for an empty team)
+    p1_lead_setup = np.append(_status_setup_counts(cols, 'team'), 0)[teams.p1_lead_rows()]
+    p2_team = None
+    if np.asarray(cols['has_p2_team']).any():
+        p2_team = (np.asarray(cols['p2team_name'], dtype=np.int64), np.asarray(cols['p2team_offsets']))
+    columns = _gen2_columns(
+        table,
+        battle_ids=np.asarray(cols['battle_id']),
+        pokemon_names=cols.vocab['pokemon'],
+        status_setup_diff=p1_lead_setup - _status_setup_counts(cols, 'lead'),
+        p2_team=p2_team,
+        seen=seen,
+        **_team_inputs(teams),
+    )
+    frame = _to_frame(columns)
+    return compact_dtypes(frame, categories=categories) if compact else frame
+
+
+def _snapshots(table, battle_ids, n_pokemon, teams):
+    n_codes = n_pokemon + 1
+    _, p1_keys, p1_order, p2_keys = _seen_keys(teams['team_name'], teams.team_offsets, teams['lead_name'], n_codes)
+    p1_total, p1_status, _, _ = _track_side(table, 'p1', p1_keys, p1_order, n_codes)
+    p2_total, p2_status, _, _ = _track_side(table, 'p2', p2_keys, np.zeros(len(teams)), n_codes)
+    return TurnSnapshots(table, battle_ids, p1_total, p2_total, p1_status, p2_status)
+
+
+def turn_snapshots(df):
+    """
+    `TurnSnapshots` of a battles DataFrame: the team HP / status series are
+    replayed once, then any set of checkpoints is a cheap query.
+    """
+    vocab = Vocab()
+    teams = build_team_table(df['p1_team_details'], df['p2_lead_details'], vocab={'pokemon': vocab})
+    table = build_turn_table(df['battle_timeline'], vocab={'pokemon': vocab})
+    return _snapshots(table, df['battle_id'].to_numpy(), len(vocab.to_list()), teams)
+
+
+def turn_snapshots_from_columns(cols, table=None):
+    """`TurnSnapshots` straight from the columnar cache (see `create_advanced_features_gen2_from_columns`)."""
+    if table is None:
+        table = turn_table_from_columns(cols)
+    return _snapshots(table, np.asarray(cols['battle_id']), len(cols.vocab['pokemon']),
+                      team_table_from_columns(cols))
+
+
+@accepts_chunks
+def create_turn_snapshot_features(df, turns=CHECKPOINT_TURNS, features=CHECKPOINT_FEATURES):
+    """
+    HP / damage / boost / status differences of every battle at the given turns.
+
+    Args:
+        df: battles DataFrame or an iterable of chunks
+        turns: checkpoints (default: every 5 turns up to 30)
+        features: any of 'hp', 'damage', 'boost', 'status'
+
+    Returns:
+        pd.DataFrame indexed by battle_id, columns `{feature}_diff_turn{k}`
+    """
+    return turn_snapshots(df).at(turns, features)
+
+
+def _damage_columns(engine, teams, battle_ids):
+    """Lead-vs-lead and P1 team-vs-P2 lead damage features from a `DamageEngine`."""
+    battle = teams.team_battle
+    slots, slot_levels = teams['team_name'], teams['team_level']
+    leads, lead_levels = teams['lead_name'][battle], teams['lead_level'][battle]
+    # one row per P1 team slot against the P2 lead of its battle
+    to_lead = engine.expected_damage(slots, leads, slot_levels, lead_levels)
+    from_lead = engine.expected_damage(leads, slots, lead_levels, slot_levels)
+    slot_ttko = turns_to_ko(to_lead)
+
+    rows = teams.p1_lead_rows()
+    p1_dmg, p2_dmg = np.append(to_lead, 0.0)[rows], np.append(from_lead, 0.0)[rows]
+    p1_ttko, p2_ttko = turns_to_ko(p1_dmg), turns_to_ko(p2_dmg)
+
+    n = len(teams)
+    team_max = np.zeros(n)
+    np.maximum.at(team_max, battle, to_lead)
+    team_min_ttko = np.full(n, float(MAX_TURNS_TO_KO))
+    np.minimum.at(team_min_ttko, battle, slot_ttko)
+    return {
+        'battle_id': battle_ids,
+        'lead_dmg_p1_to_p2': p1_dmg,
+        'lead_dmg_p2_to_p1': p2_dmg,
+        'lead_dmg_diff': p1_dmg - p2_dmg,
+        'lead_ttko_p1': p1_ttko,
+        'lead_ttko_p2': p2_ttko,
+        'lead_ko_race': p2_ttko - p1_ttko,
+        'team_max_dmg_to_p2_lead': team_max,
+        'team_mean_dmg_to_p2_lead': teams.team_mean(to_lead),
+        'team_mean_dmg_from_p2_lead': teams.team_mean(from_lead),
+        'team_min_ttko_p2_lead': team_min_ttko,
+        'team_2hko_p2_lead_count': teams.team_sum(slot_ttko <= 2).astype(np.int64),
+        'team_2hkoed_by_p2_lead_count': teams.team_sum(turns_to_ko(from_lead) <= 2).astype(np.int64),
+    }
+
+
+def fit_damage_engine(df):
+    """
+    `DamageEngine` of a battles DataFrame: movesets and move powers of its
+    timelines, over the Pokémon of its teams and leads. Build it once on the
+    training set and pass it to `create_damage_features` for every other set.
+    """
+    vocab = Vocab()
+    teams = build_team_table(df['p1_team_details'], df['p2_lead_details'], vocab={'pokemon': vocab})
+    table = build_turn_table(df['battle_timeline'], vocab={'pokemon': vocab})
+    return damage_engine(table, teams)
+
+
+@accepts_chunks
+def _damage_features(df, engine):
+    teams = build_team_table(df['p1_team_details'], df['p2_lead_details'], vocab={'pokemon': Vocab(engine.names)})
+    return pd.DataFrame(_damage_columns(engine, teams, df['battle_id'].to_numpy())).set_index('battle_id')
+
+
+def create_damage_features(df, engine=None, n_jobs=None, shard_size=None, compact=False):
+    """
+    Expected damage and turns-to-KO between the leads, and of the whole P1
+    team against P2's lead (`utils.damage`).
+
+    The movesets come from `engine`, so the features of a battle depend on the
+    battles the engine was fitted on: fit it on the training set
+    (`fit_damage_engine(train_df)`) and reuse it for the test set. Without one
+    it is fitted on `df` itself, which is only allowed for a whole DataFrame
+    run serially; shards and chunks would each get their own movesets.
+
+    Args:
+        df: battles DataFrame or an iterable of chunks
+        engine: `DamageEngine` from `fit_damage_engine`; Pokémon it does not
+            know are treated as unknown
+        n_jobs, shard_size, compact: as for the other builders (`accepts_chunks`)
+
+    Returns:
+        pd.DataFrame indexed by battle_id
+    """
+    if engine is None:
+        if n_jobs not in (None, 1) or not isinstance(df, pd.DataFrame):
+            raise ValueError("create_damage_features needs an explicit `engine` (fit_damage_engine(train_df)) "
+                             "with n_jobs or a stream of chunks.")
+        engine = fit_damage_engine(df)
+    return _damage_features(df, engine, n_jobs=n_jobs, shard_size=shard_size, compact=compact)
+
+
+def create_damage_features_from_columns(cols, table=None, engine=None):
+    """`create_damage_features` straight from the columnar cache (engine fitted on `cols` by default)."""
+    teams = team_table_from_columns(cols)
+    if engine is None:
+        engine = damage_engine(turn_table_from_columns(cols) if table is None else table, teams)
+    else:
+        # re-code the cache's Pokémon ids into the engine's vocabulary (MISSING stays MISSING)
+        vocab = Vocab(engine.names)
+        recode = np.array([vocab.code(name) for name in teams.vocab['pokemon']] + [MISSING], dtype=np.int64)
+        columns = dict(teams.columns, team_name=recode[teams['team_name']], lead_name=recode[teams['lead_name']])
+        teams = TeamTable(columns, dict(teams.vocab, pokemon=vocab.to_list()))
+    return pd.DataFrame(_damage_columns(engine, teams, np.asarray(cols['battle_id']))).set_index('battle_id')
+
+
+@accepts_chunks
+def create_team_embedding_features(df, std=False, dtype=np.float32, table=None):
+    """
+    Team-embedding block on its own: `p1_team_emb_*` (and `p2_team_emb_*` when
+    `p2_team_details` is present) plus `feat_team_emb_sim`, the cosine similarity
+    of the mean embeddings of the Pokémon seen in the timeline on each side.
+
+    Everything is written into one preallocated `dtype` block.
+
+    Args:
+        df: battles DataFrame or an iterable of chunks
+        std: add the per-dimension standard deviation after mean/max/min
+        dtype: dtype of the block (float32 by default)
+        table: optional TurnTable of the same battles (e.g. a saved one), skips reading the timelines
+
+    Returns:
+        pd.DataFrame indexed by battle_id
+    """
+    vocab = Vocab()
+    teams = {'p1': _flatten_teams(df['p1_team_details'], vocab)}
+    if 'p2_team_details' in df.columns:
+        teams['p2'] = _flatten_teams(df['p2_team_details'], vocab)
+    if table is None:
+        table = build_turn_table(df['battle_timeline'], vocab={'pokemon': vocab})
+    else:
+        # timeline ids index the table's own vocabulary
+        vocab = Vocab(table.vocab['pokemon'] + vocab.to_list())
+        teams = {side: _flatten_teams(df[f'{side}_team_details'], vocab) for side in teams}
+    emb = embedding_table(vocab.to_list(), EMBEDDING_DIM)
+
+    width = len(team_embedding_columns('p1', EMBEDDING_DIM, std))
+    columns = [c for side in teams for c in team_embedding_columns(side, EMBEDDING_DIM, std)] + ['feat_team_emb_sim']
+    block = np.empty((len(df), len(columns)), dtype=dtype)
+    for k, (codes, offsets) in enumerate(teams.values()):
+        team_embedding_block(team_id_matrix(codes, offsets), emb, std=std, out=block[:, k * width:(k + 1) * width])
+
+    p1_seen, p2_seen = (seen_embedding_mean(table.battle_index, table[f'{side}_name'], len(df), emb)
+                        for side in ('p1', 'p2'))
+    block[:, -1] = cosine_similarity_rows(p1_seen, p2_seen)
+    return pd.DataFrame(block, columns=columns, index=pd.Index(df['battle_id'].to_numpy(), name='battle_id'))
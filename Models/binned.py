@@ -0,0 +1,182 @@
+import inspect
+import threading
+import warnings
+from collections import OrderedDict
+
+import joblib
+import lightgbm
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+from sklearn.utils.validation import validate_data
+from xgboost import XGBClassifier, QuantileDMatrix
+from xgboost.sklearn import XGBModel
+from lightgbm import LGBMClassifier
+
+# private hooks of the pinned versions (requirements.txt), checked below
+try:
+    from xgboost.sklearn import _can_use_qdm
+except ImportError:
+    _can_use_qdm = None
+try:
+    from lightgbm.basic import _ConfigAliases
+except ImportError:
+    _ConfigAliases = None
+
+
+"""
+Pre-binned training matrices shared across fits.
+
+`XGBClassifier(tree_method='hist')` and `LGBMClassifier` quantize their
+training matrix into histogram bins at every `fit`. In a search (optuna,
+grid, random) the pipeline hands the classifier the same transformed fold
+over and over, with only the booster parameters changing, so the binned
+matrix can be built once and reused:
+
+    BinnedXGBClassifier    keeps the `QuantileDMatrix` of each training set
+    BinnedLGBMClassifier   keeps the `lightgbm.Dataset` (free_raw_data=False)
+
+Matrices live in a small in-process LRU (`BIN_CACHE`) keyed by a hash of the
+data, labels and weights plus the parameters that change the binning
+(XGBoost: max_bin, missing, ...; LightGBM: the Dataset parameters such as
+max_bin, min_data_in_bin, and min_data_in_leaf for the feature pre-filter).
+A trial that changes one of those builds a new entry. Trees are the same as
+with the stock classifiers.
+
+Both are selected by `get_pipeline(..., reuse_bins=True)`.
+
+Neither library exposes its binned matrix to the sklearn wrappers, so this
+relies on a few private pieces of the pinned xgboost / lightgbm versions:
+`XGBModel._create_dmatrix` and `xgboost.sklearn._can_use_qdm` (the matrix
+hook), `LGBMModel._process_params` and the fitted attributes that `fit` sets
+(`BinnedLGBMClassifier.fit` builds the Dataset and calls `lightgbm.train`
+itself), and `lightgbm.basic._ConfigAliases` (parameter aliases). They are
+checked at import: if one is missing or has changed, a warning is emitted and
+the classifiers behave exactly like the stock ones, without caching.
+`tests/test_binned.py` pins them.
+"""
+
+
+# Dataset parameters of `lightgbm.Dataset.get_params`, plus min_data_in_leaf (feature_pre_filter)
+_BINNING_PARAMS = (
+    "bin_construct_sample_cnt", "categorical_feature", "data_random_seed", "enable_bundle",
+    "feature_pre_filter", "forcedbins_filename", "is_enable_sparse", "linear_tree", "max_bin",
+    "max_bin_by_feature", "min_data_in_bin", "min_data_in_leaf", "use_missing", "zero_as_missing",
+)
+# with their aliases (max_bins, min_child_samples, ...), when lightgbm can list them
+LGBM_BINNING_PARAMS = (_ConfigAliases.get(*_BINNING_PARAMS) if hasattr(_ConfigAliases, 'get')
+                       else set(_BINNING_PARAMS))
+
+
+def _xgb_hooks_available():
+    """`XGBModel._create_dmatrix(self, ref, **kwargs)` and `_can_use_qdm` are there, as in xgboost 3.1."""
+    create = getattr(XGBModel, '_create_dmatrix', None)
+    return (callable(_can_use_qdm) and create is not None
+            and list(inspect.signature(create).parameters)[:2] == ['self', 'ref'])
+
+
+def _lgbm_hooks_available():
+    """`LGBMModel._process_params(stage)` is there and `_ConfigAliases` lists the aliases, as in lightgbm 4.6."""
+    process = getattr(LGBMClassifier, '_process_params', None)
+    return (process is not None and 'stage' in inspect.signature(process).parameters
+            and hasattr(_ConfigAliases, 'get'))
+
+
+XGB_HOOKS = _xgb_hooks_available()
+LGBM_HOOKS = _lgbm_hooks_available()
+if not (XGB_HOOKS and LGBM_HOOKS):
+    warnings.warn("Models.binned: the private xgboost/lightgbm hooks differ from the pinned versions, "
+                  f"reuse_bins=True fits without caching (xgboost: {XGB_HOOKS}, lightgbm: {LGBM_HOOKS})",
+                  stacklevel=2)
+
+
+class BinCache:
+    """LRU of binned training matrices, keyed by a hash of their inputs."""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key_parts, build):
+        """Cached matrix for `key_parts` (anything `joblib.hash` accepts), built by `build()` on a miss."""
+        key = joblib.hash(key_parts)
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        matrix = build()
+        with self._lock:
+            self.misses += 1
+            self.entries[key] = matrix
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return matrix
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+BIN_CACHE = BinCache()
+
+
+class BinnedXGBClassifier(XGBClassifier):
+    """`XGBClassifier` whose training `QuantileDMatrix` comes from `BIN_CACHE`."""
+
+    def _create_dmatrix(self, ref, **kwargs):
+        # evaluation matrices (ref is set) and non-hist methods keep the stock path
+        if (not XGB_HOOKS or ref is not None or not _can_use_qdm(self.tree_method, self.device)
+                or self.booster == "gblinear"):
+            return super()._create_dmatrix(ref, **kwargs)
+        key = ('xgboost', self.max_bin, sorted(kwargs.items()))
+        return BIN_CACHE.get(key, lambda: QuantileDMatrix(**kwargs, ref=ref, nthread=self.n_jobs,
+                                                          max_bin=self.max_bin))
+
+
+class BinnedLGBMClassifier(LGBMClassifier):
+    """
+    `LGBMClassifier` whose training `Dataset` comes from `BIN_CACHE`.
+
+    `fit` builds (or reuses) the Dataset and calls `lightgbm.train` directly,
+    then sets the attributes the stock `fit` sets, so prediction, pickling
+    and `booster_` work as usual. Validation sets, class weights and the other
+    `fit` arguments take the stock path (not cached).
+    """
+
+    def fit(self, X, y, sample_weight=None, feature_name='auto', categorical_feature='auto', **kwargs):
+        if kwargs or self.class_weight is not None or not LGBM_HOOKS:
+            return super().fit(X, y, sample_weight=sample_weight, feature_name=feature_name,
+                               categorical_feature=categorical_feature, **kwargs)
+
+        self._le = LabelEncoder().fit(y)
+        labels = self._le.transform(y)
+        self._classes = self._le.classes_
+        self._n_classes = len(self._classes)
+        self._class_map = dict(zip(self._classes, self._le.transform(self._classes)))
+        self._objective = self.objective
+        if isinstance(X, pd.DataFrame):
+            self.n_features_in_ = X.shape[1]
+        else:
+            X, labels = validate_data(self, X, labels, reset=True, accept_sparse=True,
+                                      ensure_all_finite=False, ensure_min_samples=2)
+        params = self._process_params(stage="fit")
+
+        binning = {k: v for k, v in params.items() if k in LGBM_BINNING_PARAMS}
+        key = ('lightgbm', X, labels, sample_weight, feature_name, categorical_feature, sorted(binning.items()))
+        train_set = BIN_CACHE.get(key, lambda: lightgbm.Dataset(
+            X, label=labels, weight=sample_weight, feature_name=feature_name,
+            categorical_feature=categorical_feature, params=params, free_raw_data=False))
+
+        self._Booster = lightgbm.train(params, train_set, num_boost_round=self.n_estimators)
+        self._n_features = self._Booster.num_feature()
+        self._evals_result = {}
+        self._best_iteration = self._Booster.best_iteration
+        self._best_score = self._Booster.best_score
+        self.fitted_ = True
+        # the cached Dataset outlives the booster
+        self._Booster.free_dataset()
+        return self
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.utils.validation import check_is_fitted
+from catboost import CatBoostClassifier
+
+
+"""
+Native categorical columns for the tree models.
+
+With `get_pipeline(..., categorical_encoding='auto')` (or 'native') the lead
+names are not one-hot encoded for XGBoost, LightGBM and CatBoost: the column
+transformer turns them into integer codes (`OrdinalEncoder`, -1 for
+unknown/missing), the pipeline runs on DataFrames
+(`set_output(transform='pandas')`) so the codes keep their `cat__` column
+names through VarianceThreshold and `SelectKBestKeepCategorical` (an F-test
+on arbitrary codes means nothing, so they are always kept), and
+`CategoricalCodes` casts them to a pandas category dtype right before the
+classifier:
+
+    XGBoost    enable_categorical=True
+    LightGBM   category dtype columns are categorical by default
+    CatBoost   `NativeCatBoostClassifier` declares them as cat_features
+
+One column per name instead of one per lead Pokémon.
+"""
+
+
+def _codes(values):
+    """Integer codes of a column of ordinal codes (-1 for NaN)."""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), -1, values).astype(np.int64)
+
+
+class CategoricalCodes(BaseEstimator, TransformerMixin):
+    """
+    Casts the integer-code columns whose name starts with `prefix` to a
+    category dtype; the categories are fixed at fit (unseen codes become -1).
+    """
+
+    def __init__(self, prefix='cat__'):
+        self.prefix = prefix
+
+    def fit(self, X, y=None):
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.columns_ = [c for c in X.columns if str(c).startswith(self.prefix)]
+        self.categories_ = {c: np.union1d([-1], _codes(X[c])) for c in self.columns_}
+        return self
+
+    def transform(self, X):
+        X = X.copy()
+        for column in self.columns_:
+            if column in X.columns:
+                codes = _codes(X[column])
+                categories = self.categories_[column]
+                X[column] = pd.Categorical(np.where(np.isin(codes, categories), codes, -1), categories=categories)
+        return X
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_in_
+
+
+class SelectKBestKeepCategorical(SelectKBest):
+    """
+    `SelectKBest` that always keeps the columns whose name starts with `prefix`;
+    the `k` best of the other columns are selected as usual.
+    """
+
+    def __init__(self, score_func=f_classif, *, k=10, prefix='cat__'):
+        super().__init__(score_func=score_func, k=k)
+        self.prefix = prefix
+
+    def fit(self, X, y=None):
+        super().fit(X, y)
+        names = getattr(self, 'feature_names_in_', None)
+        self.keep_ = (np.array([str(name).startswith(self.prefix) for name in names], dtype=bool)
+                      if names is not None else np.zeros(len(self.scores_), dtype=bool))
+        return self
+
+    def _get_support_mask(self):
+        check_is_fitted(self)
+        keep = self.keep_
+        if self.k == 'all':
+            return np.ones(len(keep), dtype=bool)
+        scores = np.where(keep, -np.inf, np.nan_to_num(np.asarray(self.scores_, dtype=float), nan=-np.inf))
+        k = min(self.k, int((~keep).sum()))
+        mask = keep.copy()
+        if k > 0:
+            mask[np.argsort(scores, kind='mergesort')[-k:]] = True
+        return mask
+
+
+class NativeCatBoostClassifier(CatBoostClassifier):
+    """`CatBoostClassifier` that declares the category dtype columns of X as cat_features."""
+
+    def fit(self, X, y=None, cat_features=None, **kwargs):
+        if cat_features is None and isinstance(X, pd.DataFrame):
+            cat_features = [c for c in X.columns if isinstance(X[c].dtype, pd.CategoricalDtype)] or None
+        return super().fit(X, y, cat_features=cat_features, **kwargs)
@@ -0,0 +1,126 @@
+import os
+from contextlib import contextmanager
+
+from joblib import parallel_config
+from threadpoolctl import threadpool_limits
+
+
+"""
+One CPU budget for nested parallelism.
+
+A search runs `outer` fits at once (joblib workers of GridSearchCV /
+RandomizedSearchCV) and every fit can start its own thread pool (forest
+n_jobs, XGBoost/LightGBM/CatBoost threads, BLAS). Left at -1 everywhere,
+each of the workers uses every core and the machine is oversubscribed.
+`CpuBudget` splits the cores once:
+
+    budget = cpu_budget(-1, n_tasks=n_candidates * cv)   # outer x inner <= cores
+    set_model_threads(pipeline, budget.inner)              # forest / booster threads
+    with budget.limits():                                  # loky workers and BLAS pools
+        search = GridSearchCV(pipeline, grid, n_jobs=budget.outer, refit=False).fit(X, y)
+    best = set_model_threads(clone(pipeline).set_params(**search.best_params_), budget.total)
+    best.fit(X, y)                                         # one fit: every core, no caps
+
+Outer parallelism is preferred (whole fits scale better than threads inside
+one fit); the cores left over when there are fewer tasks than cores go to
+the model threads.
+"""
+
+
+# thread parameter of each classifier (by class name, so subclasses such as
+# BinnedXGBClassifier or NativeCatBoostClassifier are covered)
+THREAD_PARAMS = {
+    'RandomForestClassifier': 'n_jobs',
+    'XGBClassifier': 'n_jobs',
+    'LGBMClassifier': 'n_jobs',
+    'CatBoostClassifier': 'thread_count',
+}
+
+
+def available_cpus():
+    """Cores this process may run on (affinity mask when available)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_cpus(n_jobs):
+    """sklearn/joblib convention: None -> 1, -1 = all cores, -2 = all but one, ..."""
+    cpus = available_cpus()
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, cpus + 1 + n_jobs)
+    return min(n_jobs, cpus)
+
+
+class CpuBudget:
+    """`total` cores split into `outer` parallel fits of `inner` threads each."""
+
+    def __init__(self, total, outer, inner):
+        self.total = total
+        self.outer = outer
+        self.inner = inner
+
+    def __repr__(self):
+        return f"CpuBudget(total={self.total}, outer={self.outer}, inner={self.inner})"
+
+    @contextmanager
+    def limits(self):
+        """Caps the thread pools of the joblib (loky) workers and of this process to `inner`."""
+        with parallel_config(backend='loky', inner_max_num_threads=self.inner), \
+                threadpool_limits(limits=self.inner):
+            yield self
+
+
+def cpu_budget(n_jobs=-1, n_tasks=None, outer=None):
+    """
+    Splits `n_jobs` cores between parallel fits and threads inside each fit.
+
+    Args:
+        n_jobs: total cores (-1 = all)
+        n_tasks: number of independent fits (e.g. candidates x folds); None = unbounded
+        outer: force the number of parallel fits
+
+    Returns:
+        CpuBudget
+    """
+    total = resolve_cpus(n_jobs)
+    if outer is None:
+        outer = total if n_tasks is None else min(total, max(1, n_tasks))
+    outer = max(1, min(outer, total))
+    return CpuBudget(total, outer, max(1, total // outer))
+
+
+def model_thread_param(estimator):
+    """Name of the thread-count parameter of `estimator` (None if it has none)."""
+    for cls in type(estimator).__mro__:
+        if cls.__name__ in THREAD_PARAMS:
+            return THREAD_PARAMS[cls.__name__]
+    return None
+
+
+def _nested_models(estimator):
+    """`estimator` and, recursively, the pipeline steps and ensemble members inside it."""
+    if estimator is None or isinstance(estimator, str):  # 'drop' / 'passthrough'
+        return
+    yield estimator
+    for _, step in getattr(estimator, 'steps', None) or ():
+        yield from _nested_models(step)
+    # VotingClassifier / StackingClassifier members, then the stacking meta-model
+    for _, member in getattr(estimator, 'estimators', None) or ():
+        yield from _nested_models(member)
+    yield from _nested_models(getattr(estimator, 'final_estimator', None))
+
+
+def set_model_threads(pipeline, n_threads):
+    """
+    Sets the thread count of every classifier in `pipeline` in place: a bare
+    estimator, the steps of a Pipeline and the members (and final estimator)
+    of a Voting / Stacking ensemble, nested at any depth.
+    """
+    for model in _nested_models(pipeline):
+        param = model_thread_param(model)
+        if param is not None:
+            model.set_params(**{param: n_threads})
+    return pipeline
@@ -1,16 +1,56 @@
 from sklearn.feature_selection import VarianceThreshold, SelectKBest, f_classif
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import StandardScaler, RobustScaler, OneHotEncoder
+from sklearn.preprocessing import StandardScaler, RobustScaler, OneHotEncoder, OrdinalEncoder, FunctionTransformer
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from xgboost import XGBClassifier
 from lightgbm import LGBMClassifier
 from catboost import CatBoostClassifier
+from Models.binned import BinnedXGBClassifier, BinnedLGBMClassifier
+from Models.categorical import CategoricalCodes, NativeCatBoostClassifier, SelectKBestKeepCategorical
+from Models.cpu_budget import set_model_threads
+import numpy as np
+from scipy import sparse
+from joblib import Memory
 import inspect
 
+
+PIPELINE_CACHE_DIR = '.pipeline_cache'
+
+# categorical_encoding='auto' (opt-in): how each model family gets the categorical columns
+CATEGORICAL_ROUTING = {
+    'logistic': 'sparse_onehot',
+    'random_forest': 'onehot',  # sparse input is slower for the forest
+    'gradient_boost': 'sparse_onehot',
+    'xgboost': 'native',
+    'lightgbm': 'native',
+    'catboost': 'native',
+}
+
+
+def to_sparse(X):
+    """Sparse DataFrame columns (e.g. `p1_seen_pokemons_<i>`) -> CSR matrix, without densifying."""
+    if hasattr(X, 'sparse'):
+        return X.sparse.to_coo().tocsr()
+    return sparse.csr_matrix(X)
+
+
+def pipeline_memory(cache):
+    """
+    `memory` argument of the Pipeline for the `cache` option of `get_pipeline`:
+    None/False (no cache), True (`PIPELINE_CACHE_DIR`), a directory or a `joblib.Memory`.
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        cache = PIPELINE_CACHE_DIR
+    return cache if isinstance(cache, Memory) else Memory(cache, verbose=0)
+
+
 def get_pipeline(model_name: str, numerical_features: list, categorical_features: list = None,
-                 scaler='auto', **extra_model_params):
+                 scaler='auto', sparse_features: list = None, cache=None, reuse_bins=False,
+                 categorical_encoding='onehot', n_jobs=None, **extra_model_params):
     """
     Returns a ready-to-use sklearn pipeline with optional preprocessing and the chosen model.
     Extra model parameters can be provided as kwargs. Invalid ones are ignored.
@@ -20,6 +60,25 @@ def get_pipeline(model_name: str, numerical_features: list, categorical_features
         numerical_features: list of numeric column names
         categorical_features: list of categorical column names (optional)
         scaler: 'standard', 'robust', 'auto', or 'false' (skip numeric scaling)
+        sparse_features: list of sparse 0/1 column names, e.g. the seen-Pokémon multi-hots
+            (passed through unscaled as a CSR block)
+        cache: opt-in fit-cache of the preprocessing steps (column transformer,
+            variance filter, SelectKBest): True, a directory or a `joblib.Memory`.
+            Fitted steps are stored on disk keyed by their parameters and the
+            fold's data, so searches that only change `classifier__*` reuse the
+            transformed matrices instead of refitting them for every candidate
+        reuse_bins: for 'xgboost' / 'lightgbm', keep the binned training matrix
+            (QuantileDMatrix / Dataset) of each fold in memory and reuse it in
+            the next fits that do not change the binning (see `Models.binned`)
+        categorical_encoding: 'onehot' (default, dense one-hot for every model),
+            'sparse_onehot', 'native' (integer codes kept out of SelectKBest and
+            used as categories by xgboost/lightgbm/catboost, see `Models.categorical`)
+            or 'auto' (per model, `CATEGORICAL_ROUTING`: sparse one-hot for
+            logistic/gradient_boost, native for xgboost/lightgbm/catboost).
+            'native' needs a DataFrame pipeline, so with `sparse_features` it
+            falls back to sparse one-hot
+        n_jobs: threads of the classifier (n_jobs / thread_count), e.g. the
+            `inner` share of a `Models.cpu_budget.CpuBudget`; None keeps the defaults
         **extra_model_params: optional extra parameters for the chosen model
 
     Returns:
@@ -47,13 +106,29 @@ def get_pipeline(model_name: str, numerical_features: list, categorical_features
             transformers.append(('num', 'passthrough', numerical_features))
 
     # Categorical transformer
-    if categorical_features:
-        transformers.append(('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), categorical_features))
+    model_name_lower = model_name.lower()
+    if categorical_encoding == 'auto':
+        categorical_encoding = CATEGORICAL_ROUTING.get(model_name_lower, 'onehot')
+    if categorical_encoding not in ('onehot', 'sparse_onehot', 'native'):
+        raise ValueError("categorical_encoding must be 'auto', 'onehot', 'sparse_onehot' or 'native'.")
+    if categorical_encoding == 'native' and sparse_features:
+        categorical_encoding = 'sparse_onehot'
+    native_categoricals = bool(categorical_features) and categorical_encoding == 'native'
+    if native_categoricals:
+        transformers.append(('cat', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1,
+                                                   encoded_missing_value=-1, dtype=np.int64), categorical_features))
+    elif categorical_features:
+        transformers.append(('cat', OneHotEncoder(handle_unknown='ignore',
+                                                  sparse_output=categorical_encoding == 'sparse_onehot'),
+                             categorical_features))
+
+    # Sparse multi-hot columns: no scaling, kept sparse
+    if sparse_features:
+        transformers.append(('sparse', FunctionTransformer(to_sparse, accept_sparse=True), sparse_features))
 
     preprocessor = ColumnTransformer(transformers) if transformers else 'passthrough'
 
     # Define base model
-    model_name_lower = model_name.lower()
     if model_name_lower == 'logistic':
         model_cls = LogisticRegression
         default_params = {'max_iter': 8000, 'solver': 'liblinear', 'random_state': 42}
@@ -61,13 +136,15 @@ def get_pipeline(model_name: str, numerical_features: list, categorical_features
         model_cls = RandomForestClassifier
         default_params = {'random_state': 42, 'n_jobs': -1}
     elif model_name_lower == 'xgboost':
-        model_cls = XGBClassifier
+        model_cls = BinnedXGBClassifier if reuse_bins else XGBClassifier
         default_params = {'eval_metric': 'logloss', 'tree_method': 'hist', 'random_state': 42}
+        if native_categoricals:
+            default_params['enable_categorical'] = True
     elif model_name_lower == 'lightgbm':
-        model_cls = LGBMClassifier
+        model_cls = BinnedLGBMClassifier if reuse_bins else LGBMClassifier
         default_params = {'boosting_type': 'dart', 'random_state': 42}
     elif model_name_lower == 'catboost':
-        model_cls = CatBoostClassifier
+        model_cls = NativeCatBoostClassifier if native_categoricals else CatBoostClassifier
         default_params = {'task_type': 'CPU', 'random_seed': 42, 'verbose': 0}
     elif model_name_lower == 'gradient_boost':
         model_cls = GradientBoostingClassifier
@@ -83,11 +160,19 @@ def get_pipeline(model_name: str, numerical_features: list, categorical_features
     model_instance = model_cls(**default_params, **filtered_params)
 
     # Build pipeline
-    pipeline = Pipeline([
+    steps = [
         ('preprocessor', preprocessor),
         ('remove_constant_features', VarianceThreshold(threshold=0)),
-        ('selectkbest', SelectKBest(score_func=f_classif)),
-        ('classifier', model_instance)
-    ])
+        ('selectkbest', SelectKBestKeepCategorical(score_func=f_classif) if native_categoricals
+                        else SelectKBest(score_func=f_classif)),
+    ]
+    if native_categoricals:
+        # category codes keep their 'cat__' names up to the classifier
+        steps.append(('categorical_codes', CategoricalCodes()))
+    pipeline = Pipeline(steps + [('classifier', model_instance)], memory=pipeline_memory(cache))
+    if native_categoricals:
+        pipeline.set_output(transform='pandas')
+    if n_jobs is not None:
+        set_model_threads(pipeline, n_jobs)
 
     return pipeline
@@ -29,6 +29,10 @@ from utils.functions import (
 )
 
 from Features.features_olya import create_advanced_features_gen2
+from Features.features_olya_vectorized import (
+    create_advanced_features_gen2_vectorized,
+    create_advanced_features_gen2_from_columns
+)
 from Models.pipeline import get_pipeline
 from Submission import submit
 
@@ -91,8 +95,12 @@ embedding_features = [
 
 
 import os
+import numpy as np
 import pandas as pd
 from utils.load_json import load_jsonl
+from utils.jsonl_index import load_jsonl_index
+from utils.battle_cache import load_battle_columns
+from utils.compact import compact_dtypes
 from sklearn.model_selection import train_test_split
 from Features.features_olya import create_advanced_features_gen2
 
@@ -139,13 +147,61 @@ from Features.features_olya import create_advanced_features_gen2
 
 #     return train_df, test_df
 
-def load_data(data_dir=None):
+def _filter_train(train_df, riga_da_rimuovere=4877, report_missing=True):
+    """Drops the broken row (by file position) and keeps only level-100 teams."""
+    # Usiamo un controllo per sicurezza, nel caso la riga non esista
+    if riga_da_rimuovere in train_df.index:
+        train_df = train_df.drop(riga_da_rimuovere)
+        print(f"Riga {riga_da_rimuovere} rimossa con successo.")
+    elif report_missing:
+        print(f"Riga {riga_da_rimuovere} non trovata (forse già rimossa o non presente).")
+
+    filtro_livello_100 = train_df['p1_team_details'].apply(
+        lambda team_list: all(pokemon.get('level') == 100 for pokemon in team_list)
+    )
+
+    return train_df[filtro_livello_100]
+
+
+def _train_rows(train_path, riga_da_rimuovere=4877):
+    """Rows kept by `_filter_train`, evaluated on the sidecar index (no battle is parsed)."""
+    index = load_jsonl_index(train_path)
+    mask = index.level_mask(100)
+    if riga_da_rimuovere < len(mask) and mask[riga_da_rimuovere]:
+        mask[riga_da_rimuovere] = False
+        print(f"Riga {riga_da_rimuovere} rimossa con successo.")
+    else:
+        print(f"Riga {riga_da_rimuovere} non trovata (forse già rimossa o non presente).")
+    return np.flatnonzero(mask)
+
+
+def _iter_train_chunks(train_path, chunksize):
+    for chunk in load_jsonl(train_path, chunksize=chunksize):
+        chunk = _filter_train(chunk, report_missing=False)
+        if len(chunk):
+            yield chunk
+
+
+def load_data(data_dir=None, chunksize=None, compact=False, use_index=False):
     """
     Loads train/test JSONL data.
     
     This function is environment-aware. It will automatically detect
     if it's running in Kaggle and use the standard Kaggle input path.
     Otherwise, it will fall back to a local 'Data' folder.
+
+    If `chunksize` is given, train and test are returned as generators of
+    DataFrames with at most `chunksize` battles each (the train filters are
+    applied chunk by chunk). They can be passed directly to the
+    `create_*features*` builders, which then never hold the whole file in memory.
+
+    With `compact=True` the flat columns of the battles (battle_id, player_won)
+    get compact dtypes; pass `compact=True` to the feature builders as well to
+    shrink the feature matrices (see `utils.compact`).
+
+    With `use_index=True` the train filters are evaluated on the byte-offset
+    index of train.jsonl (`utils.jsonl_index`, built on the first call) and
+    only the kept battles are read and parsed.
     """
     
     KAGGLE_INPUT_PATH = "/kaggle/input/fds-pokemon-battle-data"
@@ -169,24 +225,27 @@ def load_data(data_dir=None):
         print(f"Error: test.jsonl not found at {test_path}")
         return pd.DataFrame(), pd.DataFrame()
 
-    train_df = load_jsonl(train_path)
-    test_df = load_jsonl(test_path)
-    
-    #####
-    riga_da_rimuovere = 4877
-
-    # Usiamo un controllo per sicurezza, nel caso la riga non esista
-    if riga_da_rimuovere in train_df.index:
-        train_df = train_df.drop(riga_da_rimuovere)
-        print(f"Riga {riga_da_rimuovere} rimossa con successo.")
+    if chunksize is not None:
+        print(f"✓ Streaming train.jsonl / test.jsonl in chunks of {chunksize} battles.")
+        if use_index:
+            train_chunks = load_jsonl(train_path, chunksize=chunksize, rows=_train_rows(train_path))
+        else:
+            train_chunks = _iter_train_chunks(train_path, chunksize)
+        test_chunks = load_jsonl(test_path, chunksize=chunksize)
+        if compact:
+            return (compact_dtypes(c, categorical=()) for c in train_chunks), \
+                   (compact_dtypes(c, categorical=()) for c in test_chunks)
+        return train_chunks, test_chunks
+
+    if use_index:
+        train_df = load_jsonl(train_path, rows=_train_rows(train_path))
     else:
-        print(f"Riga {riga_da_rimuovere} non trovata (forse già rimossa o non presente).")
-
-    filtro_livello_100 = train_df['p1_team_details'].apply(
-        lambda team_list: all(pokemon.get('level') == 100 for pokemon in team_list)
-    )
+        train_df = _filter_train(load_jsonl(train_path))
+    test_df = load_jsonl(test_path)
 
-    train_df = train_df[filtro_livello_100]
+    if compact:
+        train_df = compact_dtypes(train_df, categorical=())
+        test_df = compact_dtypes(test_df, categorical=())
     
     print("✓ train.jsonl loaded successfully. Shape:", train_df.shape)
     print("✓ test.jsonl loaded successfully. Shape:", test_df.shape)
@@ -204,3 +263,40 @@ def load_data(data_dir=None):
     pipeline_gb = get_pipeline('gradient_boost', gb_features)
 
     '''
+
+
+
+def train_filter_mask(train_cols, riga_da_rimuovere=4877):
+    """
+    Same filters as `load_data` (broken row + level-100 teams) as a boolean
+    mask over the battles of a `BattleColumns`.
+    """
+    offsets = np.asarray(train_cols['team_offsets'])
+    slot_battle = np.repeat(np.arange(len(train_cols)), np.diff(offsets))
+    not_100 = np.bincount(slot_battle, weights=(np.asarray(train_cols['team_level']) != 100),
+                          minlength=len(train_cols))
+    mask = not_100 == 0
+    if riga_da_rimuovere < len(mask):
+        mask[riga_da_rimuovere] = False
+    return mask
+
+
+def load_columns(data_dir="Data", cache_dir=None):
+    """
+    Loads train/test through the columnar cache (`utils.battle_cache`).
+
+    The first call parses the JSONL files and writes the cache, later calls
+    only memory-map the column files. Use `train_filter_mask` to apply the
+    same train filters as `load_data`.
+
+    Returns:
+        train_cols, test_cols (BattleColumns)
+    """
+    train_path = os.path.join(data_dir, "train.jsonl")
+    test_path = os.path.join(data_dir, "test.jsonl")
+
+    train_cols = load_battle_columns(train_path, cache_dir=cache_dir)
+    test_cols = load_battle_columns(test_path, cache_dir=cache_dir)
+
+    print(f"✓ Columnar cache ready: {len(train_cols)} train / {len(test_cols)} test battles.")
+    return train_cols, test_cols
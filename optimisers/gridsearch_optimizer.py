@@ -1,10 +1,14 @@
-from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import GridSearchCV, ParameterGrid, check_cv
+from sklearn.base import clone
 from sklearn.metrics import make_scorer, accuracy_score
 import joblib
 import os
 from datetime import datetime
 
-def run_grid_search(pipeline, X_train, y_train, param_grid, cv=5, scoring='accuracy', save_dir='submissions'):
+from Models.cpu_budget import cpu_budget, set_model_threads
+
+def run_grid_search(pipeline, X_train, y_train, param_grid, cv=5, scoring='accuracy', save_dir='submissions',
+                    n_jobs=-1):
     """
     Runs GridSearchCV on a pipeline and saves the best estimator and parameters.
 
@@ -15,24 +19,34 @@ def run_grid_search(pipeline, X_train, y_train, param_grid, cv=5, scoring='accur
         cv: cross-validation folds
         scoring: metric to optimize
         save_dir: folder to save results
+        n_jobs: total cores, split between parallel fits and the model's own
+            threads (see `Models.cpu_budget`)
 
     Returns:
         best_pipeline, best_params, best_score
     """
     scorer = make_scorer(accuracy_score) if scoring == 'accuracy' else scoring
 
+    budget = cpu_budget(n_jobs, n_tasks=len(ParameterGrid(param_grid)) * check_cv(cv).get_n_splits())
+    pipeline = set_model_threads(clone(pipeline), budget.inner)
+    print(f"[INFO] {budget}")
+
     grid = GridSearchCV(
         pipeline,
         param_grid=param_grid,
         cv=cv,
         scoring=scorer,
-        n_jobs=-1,
+        n_jobs=budget.outer,
+        refit=False,
         verbose=3
     )
-    grid.fit(X_train, y_train)
+    with budget.limits():
+        grid.fit(X_train, y_train)
 
-    best_pipeline = grid.best_estimator_
+    # the refit is a single fit: it gets every core, outside the per-worker caps
     best_params = grid.best_params_
+    best_pipeline = set_model_threads(clone(pipeline).set_params(**best_params), budget.total)
+    best_pipeline.fit(X_train, y_train)
     best_score = grid.best_score_
 
     os.makedirs(save_dir, exist_ok=True)
@@ -3,6 +3,8 @@ from sklearn.metrics import accuracy_score
 import logging
 from datetime import datetime
 
+from Models.cpu_budget import cpu_budget, set_model_threads
+
 # --- Setup logging ---
 logging.basicConfig(
     level=logging.INFO,
@@ -10,7 +12,7 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
-def optimize_optuna(pipeline_factory, X_train, y_train, X_val, y_val, param_space, n_trials=50):
+def optimize_optuna(pipeline_factory, X_train, y_train, X_val, y_val, param_space, n_trials=50, n_jobs=-1):
     """
     Optimizes a scikit-learn pipeline using Optuna.
 
@@ -20,15 +22,18 @@ def optimize_optuna(pipeline_factory, X_train, y_train, X_val, y_val, param_spac
         X_val, y_val: validation data
         param_space: dict of parameter search space (keys must match pipeline parameter names)
         n_trials: number of Optuna trials
+        n_jobs: cores for the model threads (trials run one at a time, see `Models.cpu_budget`)
 
     Returns:
         best_params: dictionary of best hyperparameters
         best_score: validation accuracy of best trial
     """
 
+    budget = cpu_budget(n_jobs, n_tasks=1)
+
     def objective(trial):
         # Build a fresh pipeline
-        pipeline = pipeline_factory()
+        pipeline = set_model_threads(pipeline_factory(), budget.inner)
         
         # Generate trial-specific parameters
         trial_params = {}
@@ -48,8 +53,9 @@ def optimize_optuna(pipeline_factory, X_train, y_train, X_val, y_val, param_spac
         pipeline.set_params(**trial_params)
 
         # Fit and evaluate
-        pipeline.fit(X_train, y_train)
-        preds = pipeline.predict(X_val)
+        with budget.limits():
+            pipeline.fit(X_train, y_train)
+            preds = pipeline.predict(X_val)
         acc = accuracy_score(y_val, preds)
 
         logging.info(f"Trial {trial.number+1}/{n_trials} - Accuracy: {acc:.4f} - Params: {trial_params}")
@@ -66,8 +72,9 @@ def optimize_optuna(pipeline_factory, X_train, y_train, X_val, y_val, param_spac
     logging.info(f"Best Parameters: {best_params}")
 
     logging.info("Fitting the best pipeline on the provided training data...")
-    best_pipeline = pipeline_factory()
+    best_pipeline = set_model_threads(pipeline_factory(), budget.inner)
     best_pipeline.set_params(**best_params)
-    best_pipeline.fit(X_train, y_train)
+    with budget.limits():
+        best_pipeline.fit(X_train, y_train)
 
     return best_pipeline, best_params, best_score
@@ -1,12 +1,15 @@
-from sklearn.model_selection import RandomizedSearchCV
+from sklearn.model_selection import RandomizedSearchCV, check_cv
+from sklearn.base import clone
 from sklearn.metrics import make_scorer, accuracy_score
 import joblib
 import os
 from datetime import datetime
 
+from Models.cpu_budget import cpu_budget, set_model_threads
+
 def run_random_search(pipeline, X_train, y_train, param_distributions,
                                n_iter=50, cv=5, scoring='accuracy', 
-                               save_dir='Models', random_state=42):
+                               save_dir='Models', random_state=42, n_jobs=-1):
     """
     Runs RandomizedSearchCV on a pipeline and saves the best estimator and parameters.
 
@@ -19,26 +22,36 @@ def run_random_search(pipeline, X_train, y_train, param_distributions,
         scoring: metric to optimize
         save_dir: folder to save results
         random_state: reproducibility seed
+        n_jobs: total cores, split between parallel fits and the model's own
+            threads (see `Models.cpu_budget`)
 
     Returns:
         best_pipeline, best_params, best_score
     """
     scorer = make_scorer(accuracy_score) if scoring == 'accuracy' else scoring
 
+    budget = cpu_budget(n_jobs, n_tasks=n_iter * check_cv(cv).get_n_splits())
+    pipeline = set_model_threads(clone(pipeline), budget.inner)
+    print(f"[INFO] {budget}")
+
     random_search = RandomizedSearchCV(
         pipeline,
         param_distributions=param_distributions,
         n_iter=n_iter,
         cv=cv,
         scoring=scorer,
-        n_jobs=-1,
+        n_jobs=budget.outer,
         random_state=random_state,
+        refit=False,
         verbose=1
     )
-    random_search.fit(X_train, y_train)
+    with budget.limits():
+        random_search.fit(X_train, y_train)
 
-    best_pipeline = random_search.best_estimator_
+    # the refit is a single fit: it gets every core, outside the per-worker caps
     best_params = random_search.best_params_
+    best_pipeline = set_model_threads(clone(pipeline).set_params(**best_params), budget.total)
+    best_pipeline.fit(X_train, y_train)
     best_score = random_search.best_score_
 
     os.makedirs(save_dir, exist_ok=True)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+
+# the modules import each other from the project root (`from utils.x import ...`)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+@pytest.fixture(scope='session')
+def battles_path():
+    """Small JSONL fixture (31 battles in the challenge format; the last one has leads unknown to `pokemon_embeddings`)."""
+    return os.path.join(DATA_DIR, 'battles.jsonl')
+
+
+@pytest.fixture(scope='session')
+def battles(battles_path):
+    from utils.load_json import load_jsonl
+    return load_jsonl(battles_path)
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from Features.features_olya import create_advanced_features_gen2
+from Features.features_olya_vectorized import create_advanced_features_gen2_from_columns
+from utils import battle_cache
+from utils.battle_cache import load_battle_columns
+from utils.load_json import load_jsonl
+
+from test_feature_parity import assert_same_features
+
+
+MOVES = ['Toxic', 'Swords Dance', 'Thunderbolt', 'Recover', 'Body Slam', 'Amnesia', 'Thunder Wave']
+
+
+@pytest.fixture(scope='module')
+def full_battles_path(battles_path, tmp_path_factory):
+    """The fixture battles with the optional keys: `moves` everywhere and `p2_team_details`."""
+    path = tmp_path_factory.mktemp('full') / 'battles.jsonl'
+    with open(battles_path, encoding='utf-8') as src, open(path, 'w', encoding='utf-8') as dst:
+        for i, line in enumerate(src):
+            battle = json.loads(line)
+            for j, mon in enumerate(battle['p1_team_details']):
+                mon['moves'] = MOVES[(i + j) % 4:(i + j) % 4 + 3]
+            battle['p2_lead_details']['moves'] = MOVES[i % 5:i % 5 + 2]
+            battle['p2_team_details'] = [dict(mon, moves=MOVES[:1]) for mon in battle['p1_team_details'][::-1]]
+            dst.write(json.dumps(battle) + '\n')
+    return str(path)
+
+
+def test_round_trip(full_battles_path, tmp_path):
+    cols = load_battle_columns(full_battles_path, cache_dir=str(tmp_path))
+    # the timeline hp goes through float64 arithmetic: only the battle-level keys compare exactly
+    keys = ['battle_id', 'player_won', 'p1_team_details', 'p2_lead_details', 'p2_team_details']
+    assert cols.to_frame()[keys].to_dict('records') == load_jsonl(full_battles_path)[keys].to_dict('records')
+
+
+def test_from_columns_optional_keys(full_battles_path, tmp_path):
+    expected = create_advanced_features_gen2(load_jsonl(full_battles_path))
+    assert expected['status_setup_diff'].any()
+    assert 'p2_team_emb_17' in expected.columns
+    cols = load_battle_columns(full_battles_path, cache_dir=str(tmp_path))
+    assert_same_features(expected, create_advanced_features_gen2_from_columns(cols))
+
+
+def test_warm_load_does_not_hash(battles_path, tmp_path, monkeypatch):
+    cold = load_battle_columns(battles_path, cache_dir=str(tmp_path))
+
+    def fingerprint(*args, **kwargs):
+        raise AssertionError('warm load hashed the file')
+
+    monkeypatch.setattr(battle_cache, 'file_fingerprint', fingerprint)
+    warm = load_battle_columns(battles_path, cache_dir=str(tmp_path))
+    assert warm.path == cold.path
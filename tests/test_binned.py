@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+import lightgbm
+from lightgbm import LGBMClassifier
+from xgboost import XGBClassifier
+
+from Models import binned
+from Models.binned import BIN_CACHE, BinnedLGBMClassifier, BinnedXGBClassifier
+
+
+"""
+The binned classifiers rely on private xgboost / lightgbm pieces of the pinned
+versions: these tests fail when an upgrade moves them, and check that the
+cached fits give the same models as the stock classifiers.
+"""
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(400, 6)), columns=[f'f{i}' for i in range(6)])
+    X['lead'] = pd.Categorical(rng.choice(['a', 'b', 'c'], size=len(X)))
+    y = ((X['f0'] + X['f1'] * X['f2'] + (X['lead'] == 'a')) > 0).astype(int).to_numpy()
+    BIN_CACHE.clear()
+    yield X, y
+    BIN_CACHE.clear()
+
+
+def test_private_hooks_are_available():
+    assert binned.XGB_HOOKS
+    assert binned.LGBM_HOOKS
+    assert {'max_bin', 'max_bins', 'min_data_in_leaf', 'min_child_samples'} <= set(binned.LGBM_BINNING_PARAMS)
+
+
+@pytest.mark.parametrize('numeric_only', [False, True])
+def test_lgbm_matches_stock(data, numeric_only):
+    X, y = data
+    if numeric_only:
+        X = X.drop(columns='lead').to_numpy()
+    params = dict(n_estimators=20, num_leaves=7, verbose=-1)
+    for learning_rate in (0.1, 0.3):
+        stock = LGBMClassifier(learning_rate=learning_rate, **params).fit(X, y)
+        model = BinnedLGBMClassifier(learning_rate=learning_rate, **params).fit(X, y)
+        np.testing.assert_allclose(model.predict_proba(X), stock.predict_proba(X))
+        assert model.n_features_in_ == stock.n_features_in_
+        assert list(model.classes_) == list(stock.classes_)
+    assert (BIN_CACHE.misses, BIN_CACHE.hits) == (1, 1)
+    # the stock fit is left alone
+    assert lightgbm.sklearn.Dataset is lightgbm.Dataset
+
+
+def test_lgbm_binning_params_are_part_of_the_key(data):
+    X, y = data
+    BinnedLGBMClassifier(n_estimators=5, verbose=-1).fit(X, y)
+    BinnedLGBMClassifier(n_estimators=5, max_bin=31, verbose=-1).fit(X, y)
+    BinnedLGBMClassifier(n_estimators=5, min_child_samples=40, verbose=-1).fit(X, y)
+    assert (BIN_CACHE.misses, BIN_CACHE.hits) == (3, 0)
+
+
+def test_xgb_matches_stock(data):
+    X, y = data
+    params = dict(n_estimators=20, max_depth=3, tree_method='hist', enable_categorical=True)
+    for learning_rate in (0.1, 0.3):
+        stock = XGBClassifier(learning_rate=learning_rate, **params).fit(X, y)
+        model = BinnedXGBClassifier(learning_rate=learning_rate, **params).fit(X, y)
+        np.testing.assert_allclose(model.predict_proba(X), stock.predict_proba(X))
+    assert (BIN_CACHE.misses, BIN_CACHE.hits) == (1, 1)
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+from catboost import CatBoostClassifier
+from sklearn.ensemble import RandomForestClassifier, StackingClassifier, VotingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from xgboost import XGBClassifier
+
+from Models import cpu_budget as budgets
+from Models.cpu_budget import CpuBudget, cpu_budget, set_model_threads
+from optimisers import gridsearch_optimizer, randomsearch_optimizer
+
+
+def test_budget_split(monkeypatch):
+    monkeypatch.setattr(budgets, 'available_cpus', lambda: 8)
+    assert (cpu_budget(-1, n_tasks=20).outer, cpu_budget(-1, n_tasks=20).inner) == (8, 1)
+    assert (cpu_budget(-1, n_tasks=2).outer, cpu_budget(-1, n_tasks=2).inner) == (2, 4)
+    assert (cpu_budget(4, outer=1).outer, cpu_budget(4, outer=1).inner) == (1, 4)
+
+
+def test_set_model_threads_nested():
+    forest = RandomForestClassifier()
+    booster = XGBClassifier()
+    meta = CatBoostClassifier(verbose=0)
+    ensemble = StackingClassifier([
+        ('forest', Pipeline([('scale', StandardScaler()), ('classifier', forest)])),
+        ('vote', VotingClassifier([('xgb', Pipeline([('classifier', booster)])), ('lr', LogisticRegression()),
+                                   ('off', 'drop')])),
+    ], final_estimator=meta)
+    set_model_threads(ensemble, 3)
+    assert forest.n_jobs == 3 and booster.n_jobs == 3 and meta.get_params()['thread_count'] == 3
+
+
+class RecordingForest(RandomForestClassifier):
+    """Forest that records its thread count and whether the budget caps were on at every fit."""
+
+    fits = []
+
+    def fit(self, X, y, sample_weight=None):
+        RecordingForest.fits.append((self.n_jobs, RecordingBudget.capped))
+        return super().fit(X, y, sample_weight)
+
+
+class RecordingBudget(CpuBudget):
+    capped = False
+
+    @contextmanager
+    def limits(self):
+        RecordingBudget.capped = True
+        try:
+            yield self
+        finally:
+            RecordingBudget.capped = False
+
+
+@pytest.mark.parametrize('run', [
+    lambda *args, **kwargs: gridsearch_optimizer.run_grid_search(*args, **kwargs),
+    lambda pipeline, X, y, grid, **kwargs: randomsearch_optimizer.run_random_search(pipeline, X, y, grid, n_iter=2,
+                                                                                    **kwargs),
+])
+def test_refit_outside_the_caps(run, monkeypatch, tmp_path):
+    budget = RecordingBudget(total=4, outer=1, inner=1)
+    for module in (gridsearch_optimizer, randomsearch_optimizer):
+        monkeypatch.setattr(module, 'cpu_budget', lambda *args, **kwargs: budget)
+    RecordingForest.fits = []
+    rng = np.random.default_rng(0)
+    X, y = rng.normal(size=(40, 3)), np.arange(40) % 2
+    pipeline = Pipeline([('classifier', RecordingForest(n_estimators=5, random_state=0))])
+    best, params, _ = run(pipeline, X, y, {'classifier__max_depth': [2, 3]}, cv=2, save_dir=str(tmp_path))
+    # 2 candidates x 2 folds with the inner share under the caps, then one uncapped refit on every core
+    assert RecordingForest.fits[:-1] == [(1, True)] * 4
+    assert RecordingForest.fits[-1] == (4, False)
+    assert best.named_steps['classifier'].max_depth == params['classifier__max_depth']
@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from Features.features_olya_vectorized import create_damage_features, fit_damage_engine
+from utils.damage import turns_to_ko
+from utils.functions import get_base_stats, get_type_effectiveness
+
+
+"""
+The damage features against a plain per-battle implementation of the formula
+in utils/damage.py: scalar stats and damage with `get_base_stats` and
+`get_type_effectiveness`, one (attacker, defender) pair at a time.
+"""
+
+
+SPECIAL_TYPES = {'FIRE', 'WATER', 'GRASS', 'ELECTRIC', 'PSYCHIC', 'ICE', 'DRAGON'}
+
+
+def stat(base, level, hp=False):
+    core = math.floor(((base + 15) * 2 + 63) * level / 100)
+    return core + (level + 10 if hp else 5)
+
+
+class ScalarDamage:
+    """Movesets, move powers and species types read from the battles, like `damage_engine`."""
+
+    def __init__(self, battles):
+        self.types, self.moves, self.movesets = {}, {}, {}
+        for key in ('p1_team_details', 'p2_lead_details'):
+            for team in battles[key]:
+                for mon in (team if isinstance(team, list) else [team]):
+                    types = [t.upper() for t in mon.get('types', []) if t.upper() != 'NOTYPE']
+                    self.types.setdefault(mon['name'], types)
+        for timeline in battles['battle_timeline']:
+            for turn in timeline:
+                for side in ('p1', 'p2'):
+                    move, name = turn.get(f'{side}_move_details'), (turn.get(f'{side}_pokemon_state') or {}).get('name')
+                    if not move:
+                        continue
+                    power = self.moves.get(move['name'], (None, 0))[1]
+                    self.moves[move['name']] = (move['type'].upper(), max(power, move['base_power'] or 0))
+                    if name:
+                        self.movesets.setdefault(name, set()).add(move['name'])
+
+    def percent(self, attacker, defender, attack_level, defend_level, move_type, power):
+        if power <= 0:
+            return 0.0
+        a, d = get_base_stats(attacker), get_base_stats(defender)
+        special = move_type in SPECIAL_TYPES
+        attack = stat(a['base_spa' if special else 'base_atk'], attack_level)
+        defense = stat(d['base_spd' if special else 'base_def'], defend_level)
+        hp = stat(d['base_hp'], defend_level, hp=True)
+        damage = math.floor(math.floor(math.floor(2 * attack_level / 5 + 2) * power * attack / defense) / 50) + 2
+        stab = 1.5 if move_type in self.types.get(attacker, []) else 1.0
+        return 100.0 * damage * stab * get_type_effectiveness(move_type, self.types.get(defender, [])) * (236 / 255) / hp
+
+    def best(self, attacker, defender, attack_level=100, defend_level=100):
+        moves = [self.moves[m] for m in self.movesets.get(attacker, ())]
+        if any(power > 0 for _, power in moves):
+            return max([0.0] + [self.percent(attacker, defender, attack_level, defend_level, t, p) for t, p in moves])
+        types = self.types.get(attacker, [])
+        # no damaging move seen: a base-80 STAB move of the first type
+        return self.percent(attacker, defender, attack_level, defend_level, types[0], 80) if types else 0.0
+
+    def features(self, battle):
+        team, lead = battle['p1_team_details'], battle['p2_lead_details']
+        to_lead = [self.best(m['name'], lead['name'], m['level'], lead['level']) for m in team]
+        from_lead = [self.best(lead['name'], m['name'], lead['level'], m['level']) for m in team]
+        ttko, ttko_from = turns_to_ko(to_lead), turns_to_ko(from_lead)
+        return {
+            'lead_dmg_p1_to_p2': to_lead[0],
+            'lead_dmg_p2_to_p1': from_lead[0],
+            'lead_dmg_diff': to_lead[0] - from_lead[0],
+            'lead_ttko_p1': ttko[0],
+            'lead_ttko_p2': ttko_from[0],
+            'lead_ko_race': ttko_from[0] - ttko[0],
+            'team_max_dmg_to_p2_lead': max(to_lead),
+            'team_mean_dmg_to_p2_lead': np.mean(to_lead),
+            'team_mean_dmg_from_p2_lead': np.mean(from_lead),
+            'team_min_ttko_p2_lead': ttko.min(),
+            'team_2hko_p2_lead_count': int((ttko <= 2).sum()),
+            'team_2hkoed_by_p2_lead_count': int((ttko_from <= 2).sum()),
+        }
+
+
+def test_damage_features_match_scalar(battles):
+    scalar = ScalarDamage(battles)
+    expected = pd.DataFrame([scalar.features(b) for b in battles.to_dict('records')],
+                            index=pd.Index(battles['battle_id'].to_numpy(), name='battle_id'))
+    assert expected['lead_dmg_p1_to_p2'].gt(0).all()
+    pd.testing.assert_frame_equal(expected, create_damage_features(battles), check_dtype=False)
+
+
+def test_damage_engine_reused(battles):
+    engine = fit_damage_engine(battles)
+    chunks = (battles.iloc[i:i + 7] for i in range(0, len(battles), 7))
+    pd.testing.assert_frame_equal(create_damage_features(battles, engine=engine),
+                                  create_damage_features(chunks, engine=engine))
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from Features.features_denise import create_specialist_features
+from utils.feature_cache import cached_features
+
+
+def test_compact_partial_hit(battles, tmp_path):
+    cache_dir = str(tmp_path)
+    cached_features(create_specialist_features, battles.iloc[:10], cache_dir=cache_dir, compact=True)
+    # 10 rows read back + two computed parts of 10
+    result = cached_features(create_specialist_features, battles.iloc[:30], cache_dir=cache_dir,
+                             chunksize=10, compact=True)
+    expected = create_specialist_features(battles.iloc[:30], compact=True)
+    assert isinstance(result['p1_lead_name'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(expected, result)
+
+
+def test_compact_shares_the_plain_entry(battles, tmp_path):
+    cache_dir = str(tmp_path)
+    plain = cached_features(create_specialist_features, battles, cache_dir=cache_dir)
+    compact = cached_features(create_specialist_features, battles, cache_dir=cache_dir, compact=True)
+    assert len(list(tmp_path.iterdir())) == 1
+    pd.testing.assert_frame_equal(create_specialist_features(battles), plain)
+    pd.testing.assert_frame_equal(create_specialist_features(battles, compact=True), compact)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Features.features_olya import create_advanced_features_gen2
+from Features.features_olya_vectorized import (
+    create_advanced_features_gen2_vectorized,
+    create_advanced_features_gen2_from_columns,
+)
+from Features.features_olya_online import OnlineGen2Features
+from Features.features_denise import create_specialist_features
+from Features.features_denise_registry import create_specialist_features_lazy
+from utils.battle_cache import load_battle_columns
+from utils.functions import SEEN_POKEMON_COLUMNS
+
+
+"""
+The faster builders must give the same frame as the reference ones: same
+columns in the same order, same index, same dtypes and the same values (up to
+float rounding). `OnlineGen2Features.snapshot_frame` is the exception for the
+dtypes: its numeric columns are all float64.
+"""
+
+
+def assert_same_features(expected, result, check_dtype=True):
+    object_columns = [c for c in SEEN_POKEMON_COLUMNS if c in expected.columns]
+    # the multi-hot arrays are compared element-wise, everything else by pandas
+    pd.testing.assert_frame_equal(expected.drop(columns=object_columns), result.drop(columns=object_columns),
+                                  check_dtype=check_dtype)
+    for column in object_columns:
+        assert list(expected.columns).index(column) == list(result.columns).index(column)
+        for a, b in zip(expected[column], result[column]):
+            np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+
+
+@pytest.fixture(scope='module')
+def gen2_reference(battles):
+    return create_advanced_features_gen2(battles)
+
+
+def test_gen2_vectorized(battles, gen2_reference):
+    assert_same_features(gen2_reference, create_advanced_features_gen2_vectorized(battles))
+
+
+def test_gen2_vectorized_chunks(battles, gen2_reference):
+    chunks = (battles.iloc[i:i + 7] for i in range(0, len(battles), 7))
+    assert_same_features(gen2_reference, create_advanced_features_gen2_vectorized(chunks))
+
+
+def test_gen2_from_columns(battles_path, gen2_reference, tmp_path):
+    cols = load_battle_columns(battles_path, cache_dir=str(tmp_path))
+    assert_same_features(gen2_reference, create_advanced_features_gen2_from_columns(cols))
+
+
+def test_gen2_online(battles, gen2_reference):
+    rows = []
+    for battle in battles.to_dict('records'):
+        live = OnlineGen2Features.from_battle(battle)
+        for turn in battle['battle_timeline']:
+            live.update(turn)
+        rows.append(live.snapshot())
+    online = pd.DataFrame(rows, index=gen2_reference.index)
+    assert_same_features(gen2_reference, online)
+
+
+def test_gen2_online_frame(battles, gen2_reference):
+    live = OnlineGen2Features.from_battle(battles.iloc[0].to_dict())
+    rows = []
+    for turn in battles.iloc[0]['battle_timeline']:
+        rows.append(live.update(turn).snapshot_frame())
+    # one float64 block: same values as the dict, the integer columns as floats
+    assert_same_features(gen2_reference.iloc[:1], rows[-1], check_dtype=False)
+    assert (rows[-1].drop(columns=SEEN_POKEMON_COLUMNS).dtypes == np.float64).all()
+    assert not rows[0].equals(rows[-1])
+
+    columns = ['lead_speed_diff', 'p2_seen_pokemons', 'hp_advantage_seen']
+    subset = live.snapshot_frame(columns)
+    assert list(subset.columns) == columns
+    pd.testing.assert_frame_equal(subset, rows[-1][columns])
+
+
+def test_specialist_lazy(battles):
+    assert_same_features(create_specialist_features(battles), create_specialist_features_lazy(battles))
+
+
+def test_specialist_parallel(battles):
+    assert_same_features(create_specialist_features(battles),
+                         create_specialist_features(battles, n_jobs=2, shard_size=8))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from utils.jsonl_index import load_jsonl_index
+from utils.load_json import load_jsonl
+
+
+@pytest.fixture
+def train_path(battles_path, tmp_path):
+    """The fixture battles (some teams have level-80 members) with a blank line."""
+    path = tmp_path / 'train.jsonl'
+    with open(battles_path, encoding='utf-8') as src, open(path, 'w', encoding='utf-8') as dst:
+        for i, line in enumerate(src):
+            dst.write(line)
+            if i == 10:
+                dst.write('\n')
+    return str(path)
+
+
+def test_index_matches_load_jsonl(train_path):
+    index = load_jsonl_index(train_path)
+    full = load_jsonl(train_path)
+    assert len(index) == len(full)
+    np.testing.assert_array_equal(index['battle_id'], full['battle_id'])
+    rows = [17, 3, 25]
+    pd.testing.assert_frame_equal(index.frame(rows), full.loc[rows])
+    assert index.battles([full.loc[5, 'battle_id']])[0]['battle_id'] == full.loc[5, 'battle_id']
+    # a second call reads the saved sidecar
+    np.testing.assert_array_equal(load_jsonl_index(train_path)['offsets'], index['offsets'])
+
+
+@pytest.mark.parametrize('riga, removed', [(3, True), (2, False), (1000, False)])
+def test_train_rows_match_filter(train_path, riga, removed, capsys):
+    # row 2 has level-80 members (the level filter drops it anyway), row 1000 does not exist
+    expected = main._filter_train(load_jsonl(train_path), riga_da_rimuovere=riga)
+    capsys.readouterr()
+    rows = main._train_rows(train_path, riga_da_rimuovere=riga)
+    np.testing.assert_array_equal(rows, expected.index)
+    assert ('rimossa con successo' in capsys.readouterr().out) == removed
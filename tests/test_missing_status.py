@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+from Features.features_denise import create_specialist_features, calculate_status_score
+from Features.features_denise_registry import create_specialist_features_lazy
+from Features.features_olya import create_advanced_features_gen2
+from Features.features_olya_vectorized import create_advanced_features_gen2_vectorized
+from utils.extra import STATUS_WEIGHTS
+
+from test_feature_parity import assert_same_features
+
+
+"""
+Timelines where some `pX_pokemon_state` have no 'status' key. The original
+specialist loop reset the status to None then (`state.get('status')`), while
+the gen2/advanced loops kept the previous one (`state.get('status', prev)`).
+"""
+
+
+@pytest.fixture(scope='module')
+def battles_without_status(battles):
+    battles = battles.copy()
+
+    def drop_status(timeline):
+        turns = []
+        for i, turn in enumerate(timeline):
+            turn = dict(turn)
+            if i % 3 == 2:
+                for key in ('p1_pokemon_state', 'p2_pokemon_state'):
+                    turn[key] = {k: v for k, v in turn[key].items() if k != 'status'}
+            turns.append(turn)
+        return turns
+
+    battles['battle_timeline'] = battles['battle_timeline'].map(drop_status)
+    return battles
+
+
+def original_status_diffs(battle):
+    """team_status_diff / weighted_status_diff as computed by the original specialist loop."""
+    seen = {side: {} for side in ('p1', 'p2')}
+    for p in battle['p1_team_details']:
+        seen['p1'][p['name']] = {'hp_pct': 100, 'status': None}
+    seen['p2'][battle['p2_lead_details']['name']] = {'hp_pct': 100, 'status': None}
+    for turn in battle['battle_timeline']:
+        for side in ('p1', 'p2'):
+            state = turn.get(f'{side}_pokemon_state', {})
+            if state and state.get('name'):
+                seen[side].setdefault(state['name'], {'hp_pct': 100, 'status': None})
+                seen[side][state['name']]['status'] = state.get('status')
+    count = {side: sum(1 for p in seen[side].values() if p['status'] is not None) for side in seen}
+    return {
+        'team_status_diff': count['p1'] - count['p2'],
+        'weighted_status_diff': (calculate_status_score(seen['p1'], STATUS_WEIGHTS)
+                                 - calculate_status_score(seen['p2'], STATUS_WEIGHTS)),
+    }
+
+
+def test_specialist_resets_missing_status(battles_without_status):
+    expected = pd.DataFrame([original_status_diffs(b) for b in battles_without_status.to_dict('records')],
+                            index=pd.Index(battles_without_status['battle_id'], name='battle_id'))
+    columns = list(expected.columns)
+    result = create_specialist_features(battles_without_status)
+    pd.testing.assert_frame_equal(expected, result[columns])
+    pd.testing.assert_frame_equal(result, create_specialist_features_lazy(battles_without_status))
+
+
+def test_gen2_keeps_missing_status(battles_without_status):
+    assert_same_features(create_advanced_features_gen2(battles_without_status),
+                         create_advanced_features_gen2_vectorized(battles_without_status))
@@ -0,0 +1,93 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_selection import SelectKBest
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+from Features.features_denise import create_specialist_features
+from Models.categorical import SelectKBestKeepCategorical
+from Models.pipeline import get_pipeline, CATEGORICAL_ROUTING
+
+
+NUMERIC = ['lead_speed_diff', 'hp_advantage_seen', 'mons_revealed_diff', 'team_status_diff',
+           'lead_atk_diff', 'lead_bulk_diff', 'p1_team_avg_speed', 'num_turns']
+CATEGORICAL = ['p1_lead_name', 'p2_lead_name']
+
+
+@pytest.fixture(scope='module')
+def train_xy(battles):
+    X = create_specialist_features(battles, progress=False)
+    return X, battles.set_index('battle_id')['player_won'].astype(int).loc[X.index]
+
+
+def dense(X):
+    return X.toarray() if hasattr(X, 'toarray') else np.asarray(X)
+
+
+def cached_steps(cache_dir):
+    """Entries of the transformer fits stored by the Pipeline's `memory`."""
+    return glob.glob(os.path.join(cache_dir, 'joblib', '**', '_fit_transform_one', '*', ''), recursive=True)
+
+
+def test_cache_hits_on_classifier_params(train_xy, tmp_path):
+    X, y = train_xy
+    cache = str(tmp_path)
+    pipeline = get_pipeline('logistic', NUMERIC, CATEGORICAL, cache=cache)
+    pipeline.set_params(selectkbest__k=5).fit(X, y)
+    n_steps = len(cached_steps(cache))
+    assert n_steps > 0
+
+    # only the classifier changes: every transformer fit is read back
+    refit = get_pipeline('logistic', NUMERIC, CATEGORICAL, cache=cache).set_params(selectkbest__k=5, classifier__C=0.1)
+    refit.fit(X, y)
+    assert len(cached_steps(cache)) == n_steps
+    np.testing.assert_array_equal(dense(pipeline[:-1].transform(X)), dense(refit[:-1].transform(X)))
+
+    # another fold: new entries
+    fold = X.index[::2]
+    refit.fit(X.loc[fold], y.loc[fold])
+    assert len(cached_steps(cache)) == 2 * n_steps
+
+
+FAST = {'n_estimators': 5}
+
+
+def test_default_is_dense_onehot(train_xy):
+    X, y = train_xy
+    for model_name in CATEGORICAL_ROUTING:
+        pipeline = get_pipeline(model_name, NUMERIC, CATEGORICAL, **FAST)
+        encoder = pipeline.named_steps['preprocessor'].transformers[1][1]
+        assert isinstance(encoder, OneHotEncoder) and not encoder.sparse_output
+        assert type(pipeline.named_steps['selectkbest']) is SelectKBest
+
+
+@pytest.mark.parametrize('model_name', sorted(CATEGORICAL_ROUTING))
+def test_auto_routes(train_xy, model_name):
+    X, y = train_xy
+    pipeline = get_pipeline(model_name, NUMERIC, CATEGORICAL, categorical_encoding='auto', **FAST)
+    pipeline.set_params(selectkbest__k=2).fit(X, y)
+    encoder = pipeline.named_steps['preprocessor'].named_transformers_['cat']
+    route = CATEGORICAL_ROUTING[model_name]
+    if route == 'native':
+        assert isinstance(encoder, OrdinalEncoder)
+        # the codes bypass the F-test: both kept on top of the 2 best numeric columns
+        assert isinstance(pipeline.named_steps['selectkbest'], SelectKBestKeepCategorical)
+        selected = pipeline[:-1].transform(X)
+        assert [c for c in selected.columns if c.startswith('cat__')] == [f'cat__{c}' for c in CATEGORICAL]
+        assert selected.shape[1] == 2 + len(CATEGORICAL)
+        assert all(isinstance(selected[f'cat__{c}'].dtype, pd.CategoricalDtype) for c in CATEGORICAL)
+    else:
+        assert isinstance(encoder, OneHotEncoder)
+        assert encoder.sparse_output == (route == 'sparse_onehot')
+    proba = pipeline.predict_proba(X)
+    assert proba.shape == (len(X), 2)
+
+
+def test_native_with_sparse_features_falls_back(train_xy):
+    pipeline = get_pipeline('xgboost', NUMERIC, CATEGORICAL, sparse_features=['p1_meta_threat_count'],
+                            categorical_encoding='native')
+    encoder = pipeline.named_steps['preprocessor'].transformers[1][1]
+    assert isinstance(encoder, OneHotEncoder) and encoder.sparse_output
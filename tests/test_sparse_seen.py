@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from Features.features_olya import create_advanced_features_gen2
+from Features.features_olya_vectorized import create_advanced_features_gen2_vectorized
+from utils.extra import POKEMON_LIST
+from utils.functions import (
+    encode_pokemon_set,
+    encode_pokemon_sets,
+    multi_hot_matrix,
+    sparse_seen_pokemons,
+    SEEN_POKEMON_COLUMNS
+)
+
+
+SETS = [{'alakazam', 'snorlax'}, set(), None, {'missingno', 'chansey'}, ['tauros', 'tauros', 'gengar'],
+        set(POKEMON_LIST)]
+
+
+def test_encode_pokemon_sets():
+    expected = np.stack([encode_pokemon_set(s) for s in SETS])
+    result = encode_pokemon_sets(SETS)
+    assert result.dtype == np.int8
+    np.testing.assert_array_equal(expected, result.toarray())
+
+
+def test_multi_hot_matrix_duplicates():
+    matrix = multi_hot_matrix([0, 0, 2, 2, 2], [1, 1, 0, 3, 0], 3, 4)
+    np.testing.assert_array_equal(matrix.toarray(), [[0, 1, 0, 0], [0, 0, 0, 0], [1, 0, 0, 1]])
+
+
+def test_sparse_seen_pokemons(battles):
+    reference = create_advanced_features_gen2(battles)
+    result = sparse_seen_pokemons(reference)
+    assert not set(SEEN_POKEMON_COLUMNS) & set(result.columns)
+    for column in SEEN_POKEMON_COLUMNS:
+        names = [f'{column}_{i}' for i in range(len(POKEMON_LIST))]
+        assert (result[names].dtypes == pd.SparseDtype(np.int8, 0)).all()
+        np.testing.assert_array_equal(np.stack(reference[column]), result[names].sparse.to_dense().to_numpy())
+    pd.testing.assert_frame_equal(result, create_advanced_features_gen2_vectorized(battles, seen='sparse'))
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from Features.features_olya import aggregate_team_embedding, create_advanced_features_gen2
+from Features.features_olya_vectorized import create_team_embedding_features
+from utils.extra import pokemon_embeddings
+from utils.functions import get_pokemons_seen_in_battle
+from utils.team_embedding import (
+    embedding_table,
+    team_id_matrix,
+    team_embedding_block,
+    team_embedding_columns
+)
+
+
+NAMES = ['snorlax', 'chansey', 'missingno', 'tauros', 'alakazam']
+TEAMS = [[0, 1, 3], [], [2], [4, 4, 0, 1, 3, 2], [1]]
+
+
+def test_team_embedding_block():
+    codes = np.array([code for team in TEAMS for code in team])
+    offsets = np.cumsum([0] + [len(team) for team in TEAMS])
+    block = team_embedding_block(team_id_matrix(codes, offsets), embedding_table(NAMES), std=True, dtype=float)
+    assert block.shape == (len(TEAMS), len(team_embedding_columns('p1', std=True)))
+    for row, team in zip(block, TEAMS):
+        members = [{'name': NAMES[code]} for code in team]
+        expected = aggregate_team_embedding(members)
+        if team:
+            vectors = np.array([pokemon_embeddings.get(NAMES[code], np.zeros(6)) for code in team])
+            expected = np.concatenate([expected, vectors.std(axis=0)])
+        # an empty team is `embedding_dim` zeros in the reference, a zero row here
+        np.testing.assert_allclose(row[:len(expected)], expected)
+        assert not row[len(expected):].any()
+
+
+def seen_similarity(timeline):
+    """Cosine similarity of the mean embeddings of the Pokémon seen on each side (0 if either is zero)."""
+    means = [np.mean([pokemon_embeddings.get(name, np.zeros(6)) for name in seen], axis=0) if seen else np.zeros(6)
+             for seen in get_pokemons_seen_in_battle(timeline)]
+    norms = np.linalg.norm(means[0]) * np.linalg.norm(means[1])
+    return float(means[0] @ means[1] / norms) if norms > 0 else 0.0
+
+
+def test_team_embedding_features(battles):
+    reference = create_advanced_features_gen2(battles)
+    result = create_team_embedding_features(battles, dtype=np.float64)
+    assert result.dtypes.eq(np.float64).all()
+    team_columns = team_embedding_columns('p1')
+    assert list(result.columns) == team_columns + ['feat_team_emb_sim']
+    pd.testing.assert_frame_equal(reference[team_columns], result[team_columns], check_dtype=False)
+    np.testing.assert_allclose(result['feat_team_emb_sim'], battles['battle_timeline'].map(seen_similarity))
+    # float32 block: same values up to rounding
+    pd.testing.assert_frame_equal(result, create_team_embedding_features(battles).astype(np.float64), rtol=1e-6)
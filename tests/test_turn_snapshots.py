@@ -0,0 +1,59 @@
+import pandas as pd
+
+from Features.features_olya import create_advanced_features_gen2
+from Features.features_olya_vectorized import (
+    create_turn_snapshot_features,
+    turn_snapshots_from_columns,
+    CHECKPOINT_FEATURES
+)
+from utils.battle_cache import load_battle_columns
+from utils.replay import Extractor, replay_features
+
+
+TURNS = (0, 1, 3, 5, 7, 10, 20, 25, 30, 100)
+
+
+class CheckpointExtractor(Extractor):
+    """The `if turn_num == k or (turn_num == last and turn_num < k)` snapshots of the gen2 loop, at any turns."""
+
+    def __init__(self, turns):
+        self.turns = turns
+
+    def start(self, state):
+        self.values = {}
+
+    def turn(self, state):
+        turn_num, p1, p2 = state.turn.get('turn'), state.p1, state.p2
+        for k in self.turns:
+            if turn_num == k or (turn_num == state.num_turns and turn_num < k):
+                self.values[k] = {
+                    'hp': p1.total_hp - p2.total_hp,
+                    'damage': (600 - p1.total_hp) - (600 - p2.total_hp),
+                    'boost': p1.boost_sum - p2.boost_sum,
+                    'status': p1.status_count - p2.status_count,
+                }
+
+    def finish(self, state):
+        return {f'{feature}_diff_turn{k}': self.values.get(k, {}).get(feature, 0)
+                for k in self.turns for feature in CHECKPOINT_FEATURES}
+
+
+def test_snapshots_match_replay(battles):
+    expected = replay_features(battles, [CheckpointExtractor(TURNS)])[0]
+    pd.testing.assert_frame_equal(expected, create_turn_snapshot_features(battles, turns=TURNS), check_dtype=False)
+
+
+def test_snapshots_match_gen2(battles):
+    # the gen2 dict stores the turn-25/30 values under damage_diff_turn10/20
+    reference = create_advanced_features_gen2(battles)
+    snaps = create_turn_snapshot_features(battles, turns=(25, 30), features=('damage',))
+    for turn, column in ((25, 'damage_diff_turn10'), (30, 'damage_diff_turn20'),
+                         (25, 'damage_diff_turn25'), (30, 'damage_diff_turn30')):
+        pd.testing.assert_series_equal(reference[column], snaps[f'damage_diff_turn{turn}'],
+                                       check_dtype=False, check_names=False)
+
+
+def test_snapshots_from_columns(battles, battles_path, tmp_path):
+    cols = load_battle_columns(battles_path, cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(create_turn_snapshot_features(battles, turns=TURNS),
+                                  turn_snapshots_from_columns(cols).at(TURNS))
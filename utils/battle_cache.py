@@ -0,0 +1,434 @@
+import os
+import json
+import shutil
+import hashlib
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from utils.load_json import iter_battles
+
+
+"""
+Columnar on-disk cache of parsed battles.
+
+The first time a JSONL file is seen it is parsed once (streaming, see
+`iter_battles`) and written as one `.npy` file per column:
+
+1. Battle-level scalars (`battle_id`, `player_won`).
+2. `p1_team_details` flattened to one row per team slot (`team_*` columns,
+   `team_offsets` gives the slots of battle i), `p2_lead_details` as one
+   row per battle (`lead_*` columns) and, when the file has it,
+   `p2_team_details` like the P1 team (`p2team_*`, `has_p2_team` tells
+   whether the key was there). Move lists are stored ragged
+   (`team_moves` + `team_moves_offsets`, same for `lead_` and `p2team_`).
+3. `battle_timeline` flattened to one row per turn (`turn_*`, `p1_*`, `p2_*`
+   columns, `turn_offsets` gives the turns of battle i). The `effects` lists
+   are stored ragged as well (`p1_effects` + `p1_effects_offsets`).
+
+Strings are stored as integer codes, the vocabularies live in `meta.json`.
+Missing values use sentinels: -1 for missing ints/codes, NaN for missing
+floats, and -2 for a missing `status` key (-1 is an explicit None).
+
+The cache directory name contains the SHA-1 of the file content and
+`CACHE_SCHEMA_VERSION`, so editing the JSONL or changing this loader
+automatically points to a new entry. The entry also records the size and
+mtime of the file it was built from: as long as they match, a warm load does
+not read the JSONL at all (the content is only hashed again when they
+differ, like the sidecar index of `utils.jsonl_index`). Columns are opened
+with `np.load(..., mmap_mode='r')`, so a warm load only maps the files.
+"""
+
+
+CACHE_SCHEMA_VERSION = 2
+DEFAULT_CACHE_DIR = '.battle_cache'
+
+STATS = ['base_hp', 'base_atk', 'base_def', 'base_spa', 'base_spd', 'base_spe']
+BOOST_KEYS = ['atk', 'def', 'spa', 'spd', 'spe']
+VOCAB_KINDS = ['pokemon', 'type', 'status', 'move', 'category', 'effect', 'action']
+
+MISSING = -1
+MISSING_STATUS_KEY = -2
+MISSING_BOOST = -128
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """SHA-1 of the file content, read in blocks."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_stamp(path):
+    """[size, mtime in ns] of the file: a change means its content must be hashed again."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def cache_path_for(path, cache_dir=None):
+    """Directory of the cache entry for `path` (it may not exist yet); hashes the whole file."""
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    stem = os.path.splitext(os.path.basename(path))[0]
+    fingerprint = file_fingerprint(path)
+    return os.path.join(cache_dir, f"{stem}-{fingerprint[:16]}-v{CACHE_SCHEMA_VERSION}")
+
+
+def _entries_of(path, cache_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if not os.path.isdir(cache_dir):
+        return []
+    return [os.path.join(cache_dir, entry) for entry in os.listdir(cache_dir)
+            if entry.startswith(f"{stem}-") and os.path.isdir(os.path.join(cache_dir, entry))]
+
+
+def _fresh_entry(path, cache_dir):
+    """Entry built from `path` whose recorded size and mtime still match the file (None if none)."""
+    source, stamp = os.path.abspath(path), file_stamp(path)
+    for entry in _entries_of(path, cache_dir):
+        if not entry.endswith(f"-v{CACHE_SCHEMA_VERSION}"):
+            continue
+        try:
+            with open(os.path.join(entry, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('source') == source and meta.get('source_stamp') == stamp:
+            return entry
+    return None
+
+
+class Vocab:
+    """String -> compact integer code, in order of first appearance."""
+
+    def __init__(self, values=()):
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        if value is None:
+            return MISSING
+        return self.codes.setdefault(value, len(self.codes))
+
+    def to_list(self):
+        return list(self.codes)
+
+
+def _int_or_missing(value):
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else MISSING
+
+
+def _float_or_nan(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else float('nan')
+
+
+def build_battle_columns(battles):
+    """
+    Flattens an iterable of battle dicts into typed columns.
+
+    Returns:
+        (columns, meta): dict of numpy arrays and a JSON-serializable dict with
+        the vocabularies and the original top-level key order.
+    """
+    vocab = {kind: Vocab() for kind in VOCAB_KINDS}
+    cols = {
+        'battle_id': array('q'), 'player_won': array('b'),
+        'team_offsets': array('q', [0]), 'team_name': array('h'), 'team_level': array('h'),
+        'team_type1': array('h'), 'team_type2': array('h'),
+        'lead_name': array('h'), 'lead_level': array('h'), 'lead_type1': array('h'), 'lead_type2': array('h'),
+        'turn_offsets': array('q', [0]), 'turn': array('h'),
+    }
+    cols.update({'has_p2_team': array('b'), 'p2team_offsets': array('q', [0]), 'p2team_name': array('h'),
+                 'p2team_level': array('h'), 'p2team_type1': array('h'), 'p2team_type2': array('h')})
+    for prefix in ('team', 'lead', 'p2team'):
+        for stat in STATS:
+            cols[f'{prefix}_{stat}'] = array('h')
+        cols.update({f'{prefix}_moves': array('h'), f'{prefix}_moves_offsets': array('q', [0]),
+                     f'{prefix}_has_moves': array('b')})
+    for side in ('p1', 'p2'):
+        cols.update({
+            f'{side}_name': array('h'), f'{side}_hp_pct': array('d'), f'{side}_status': array('h'),
+            f'{side}_has_boosts': array('b'), f'{side}_effects': array('h'),
+            f'{side}_effects_offsets': array('q', [0]), f'{side}_has_effects': array('b'),
+            f'{side}_move_name': array('h'), f'{side}_move_type': array('h'),
+            f'{side}_move_category': array('h'), f'{side}_move_base_power': array('h'),
+            f'{side}_move_accuracy': array('d'), f'{side}_move_priority': array('b'),
+            f'{side}_action': array('h'),
+        })
+        for key in BOOST_KEYS:
+            cols[f'{side}_boost_{key}'] = array('b')
+
+    def add_pokemon(prefix, mon):
+        types = list(mon.get('types') or [])
+        cols[f'{prefix}_name'].append(vocab['pokemon'].code(mon.get('name')))
+        cols[f'{prefix}_level'].append(_int_or_missing(mon.get('level')))
+        cols[f'{prefix}_type1'].append(vocab['type'].code(types[0] if len(types) > 0 else None))
+        cols[f'{prefix}_type2'].append(vocab['type'].code(types[1] if len(types) > 1 else None))
+        for stat in STATS:
+            cols[f'{prefix}_{stat}'].append(_int_or_missing(mon.get(stat)))
+        moves = mon.get('moves')
+        cols[f'{prefix}_has_moves'].append(int(moves is not None))
+        for move in moves or []:
+            cols[f'{prefix}_moves'].append(vocab['move'].code(move))
+        cols[f'{prefix}_moves_offsets'].append(len(cols[f'{prefix}_moves']))
+
+    key_order = None
+    for battle in battles:
+        if key_order is None:
+            key_order = list(battle)
+        cols['battle_id'].append(int(battle.get('battle_id', MISSING)))
+        won = battle.get('player_won')
+        cols['player_won'].append(MISSING if won is None else int(bool(won)))
+
+        team = battle.get('p1_team_details') or []
+        for mon in team:
+            add_pokemon('team', mon)
+        cols['team_offsets'].append(cols['team_offsets'][-1] + len(team))
+        add_pokemon('lead', battle.get('p2_lead_details') or {})
+        p2_team = battle.get('p2_team_details')
+        cols['has_p2_team'].append(int(p2_team is not None))
+        for mon in p2_team or []:
+            add_pokemon('p2team', mon)
+        cols['p2team_offsets'].append(cols['p2team_offsets'][-1] + len(p2_team or []))
+
+        timeline = battle.get('battle_timeline') or []
+        for turn in timeline:
+            cols['turn'].append(_int_or_missing(turn.get('turn')))
+            for side in ('p1', 'p2'):
+                state = turn.get(f'{side}_pokemon_state') or {}
+                cols[f'{side}_name'].append(vocab['pokemon'].code(state.get('name')))
+                cols[f'{side}_hp_pct'].append(_float_or_nan(state.get('hp_pct')))
+                cols[f'{side}_status'].append(
+                    vocab['status'].code(state['status']) if 'status' in state else MISSING_STATUS_KEY
+                )
+                boosts = state.get('boosts')
+                cols[f'{side}_has_boosts'].append(int(isinstance(boosts, dict)))
+                for key in BOOST_KEYS:
+                    value = boosts.get(key) if isinstance(boosts, dict) else None
+                    cols[f'{side}_boost_{key}'].append(MISSING_BOOST if value is None else int(value))
+                effects = state.get('effects')
+                cols[f'{side}_has_effects'].append(int(effects is not None))
+                for effect in effects or []:
+                    cols[f'{side}_effects'].append(vocab['effect'].code(effect))
+                cols[f'{side}_effects_offsets'].append(len(cols[f'{side}_effects']))
+
+                move = turn.get(f'{side}_move_details') or {}
+                cols[f'{side}_move_name'].append(vocab['move'].code(move.get('name')))
+                cols[f'{side}_move_type'].append(vocab['type'].code(move.get('type')))
+                cols[f'{side}_move_category'].append(vocab['category'].code(move.get('category')))
+                cols[f'{side}_move_base_power'].append(_int_or_missing(move.get('base_power')))
+                cols[f'{side}_move_accuracy'].append(_float_or_nan(move.get('accuracy')))
+                cols[f'{side}_move_priority'].append(_int_or_missing(move.get('priority')))
+                cols[f'{side}_action'].append(vocab['action'].code(turn.get(f'{side}_action')))
+        cols['turn_offsets'].append(cols['turn_offsets'][-1] + len(timeline))
+
+    columns = {name: np.frombuffer(values, dtype=values.typecode) if len(values) else
+               np.array([], dtype=values.typecode) for name, values in cols.items()}
+    meta = {
+        'schema_version': CACHE_SCHEMA_VERSION,
+        'n_battles': len(cols['battle_id']),
+        'key_order': key_order or [],
+        'vocab': {kind: v.to_list() for kind, v in vocab.items()},
+    }
+    return columns, meta
+
+
+class BattleColumns:
+    """
+    Read-only view over the cached columns of one JSONL file.
+
+    `cols['p1_hp_pct']` returns the (memory-mapped) array, `cols.vocab['move']`
+    the list of move names indexed by code.
+    """
+
+    def __init__(self, columns, meta, path=None):
+        self.columns = columns
+        self.meta = meta
+        self.vocab = meta['vocab']
+        self.path = path
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        return self.meta['n_battles']
+
+    def decode(self, kind, codes):
+        """Maps integer codes back to strings (missing codes become None)."""
+        names = self.vocab[kind]
+        return [names[c] if c >= 0 else None for c in np.asarray(codes).tolist()]
+
+    def to_frame(self):
+        """Rebuilds the nested DataFrame that `load_jsonl` would return."""
+        c = {name: arr.tolist() for name, arr in self.columns.items()}
+        v = self.vocab
+
+        def name_of(kind, code):
+            return v[kind][code] if code >= 0 else None
+
+        def pokemon(prefix, i):
+            mon = {'name': name_of('pokemon', c[f'{prefix}_name'][i])}
+            if c[f'{prefix}_level'][i] != MISSING:
+                mon['level'] = c[f'{prefix}_level'][i]
+            types = [name_of('type', c[f'{prefix}_type1'][i]), name_of('type', c[f'{prefix}_type2'][i])]
+            mon['types'] = [t for t in types if t is not None]
+            for stat in STATS:
+                if c[f'{prefix}_{stat}'][i] != MISSING:
+                    mon[stat] = c[f'{prefix}_{stat}'][i]
+            if c[f'{prefix}_has_moves'][i]:
+                lo, hi = c[f'{prefix}_moves_offsets'][i], c[f'{prefix}_moves_offsets'][i + 1]
+                mon['moves'] = [v['move'][m] for m in c[f'{prefix}_moves'][lo:hi]]
+            return mon
+
+        def side_state(side, t):
+            if c[f'{side}_name'][t] == MISSING:
+                return {}
+            state = {'name': name_of('pokemon', c[f'{side}_name'][t])}
+            hp = c[f'{side}_hp_pct'][t]
+            if hp == hp:  # not NaN
+                state['hp_pct'] = hp
+            if c[f'{side}_status'][t] != MISSING_STATUS_KEY:
+                state['status'] = name_of('status', c[f'{side}_status'][t])
+            if c[f'{side}_has_effects'][t]:
+                lo, hi = c[f'{side}_effects_offsets'][t], c[f'{side}_effects_offsets'][t + 1]
+                state['effects'] = [v['effect'][e] for e in c[f'{side}_effects'][lo:hi]]
+            if c[f'{side}_has_boosts'][t]:
+                state['boosts'] = {key: c[f'{side}_boost_{key}'][t] for key in BOOST_KEYS
+                                   if c[f'{side}_boost_{key}'][t] != MISSING_BOOST}
+            return state
+
+        def side_move(side, t):
+            if c[f'{side}_move_name'][t] == MISSING:
+                return None
+            move = {
+                'name': name_of('move', c[f'{side}_move_name'][t]),
+                'type': name_of('type', c[f'{side}_move_type'][t]),
+                'category': name_of('category', c[f'{side}_move_category'][t]),
+            }
+            base_power = c[f'{side}_move_base_power'][t]
+            move['base_power'] = base_power if base_power != MISSING else None
+            accuracy = c[f'{side}_move_accuracy'][t]
+            move['accuracy'] = accuracy if accuracy == accuracy else None
+            priority = c[f'{side}_move_priority'][t]
+            move['priority'] = priority if priority != MISSING else None
+            return move
+
+        records = []
+        for i in range(len(self)):
+            team = [pokemon('team', s) for s in range(c['team_offsets'][i], c['team_offsets'][i + 1])]
+            timeline = []
+            for t in range(c['turn_offsets'][i], c['turn_offsets'][i + 1]):
+                turn = {'turn': c['turn'][t]}
+                for side in ('p1', 'p2'):
+                    turn[f'{side}_pokemon_state'] = side_state(side, t)
+                    turn[f'{side}_move_details'] = side_move(side, t)
+                    if c[f'{side}_action'][t] != MISSING:
+                        turn[f'{side}_action'] = name_of('action', c[f'{side}_action'][t])
+                timeline.append(turn)
+            record = {
+                'battle_id': c['battle_id'][i],
+                'p1_team_details': team,
+                'p2_lead_details': pokemon('lead', i),
+                'battle_timeline': timeline,
+            }
+            if c['has_p2_team'][i]:
+                record['p2_team_details'] = [pokemon('p2team', s) for s in
+                                             range(c['p2team_offsets'][i], c['p2team_offsets'][i + 1])]
+            if c['player_won'][i] != MISSING:
+                record['player_won'] = bool(c['player_won'][i])
+            records.append(record)
+
+        key_order = [k for k in self.meta['key_order'] if k in (records[0] if records else {})]
+        return pd.DataFrame(records, columns=key_order or None)
+
+
+def write_battle_columns(columns, meta, target_dir):
+    """Writes the columns atomically: a temporary folder is renamed into place."""
+    tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(tmp_dir, target_dir)
+
+
+def read_battle_columns(target_dir, mmap_mode='r'):
+    """Opens a cache entry. Returns None if it is missing or was written by another schema version."""
+    meta_path = os.path.join(target_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('schema_version') != CACHE_SCHEMA_VERSION:
+        return None
+    columns = {}
+    for filename in os.listdir(target_dir):
+        if filename.endswith('.npy'):
+            columns[filename[:-4]] = np.load(os.path.join(target_dir, filename), mmap_mode=mmap_mode)
+    return BattleColumns(columns, meta, path=target_dir)
+
+
+def _remove_stale_entries(path, cache_dir, keep):
+    for entry in _entries_of(path, cache_dir):
+        if entry != keep:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _record_source(target_dir, path, stamp):
+    """Stores the path / size / mtime the entry is valid for in its meta.json."""
+    meta_path = os.path.join(target_dir, 'meta.json')
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    meta.update({'source': os.path.abspath(path), 'source_stamp': stamp})
+    tmp = f"{meta_path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def load_battle_columns(path, cache_dir=None, mmap_mode='r'):
+    """
+    Returns the cached columns of a JSONL file, building the cache entry on first use.
+
+    The file is only read (hashed) when no entry records its current size and mtime.
+
+    Args:
+        path: path to the .jsonl file
+        cache_dir: where cache entries live (default: `.battle_cache` in the working dir)
+        mmap_mode: passed to `np.load` ('r' memory-maps the columns, None loads them in RAM)
+
+    Returns:
+        BattleColumns
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    fresh = _fresh_entry(path, cache_dir)
+    cached = read_battle_columns(fresh, mmap_mode=mmap_mode) if fresh else None
+    if cached is not None:
+        return cached
+
+    # taken before reading: a write during the build changes it, and the next load re-hashes
+    stamp = file_stamp(path)
+    target_dir = cache_path_for(path, cache_dir)
+    cached = read_battle_columns(target_dir, mmap_mode=mmap_mode)
+    if cached is not None:
+        # same content under a new size/mtime (touched or copied file)
+        _record_source(target_dir, path, stamp)
+        return read_battle_columns(target_dir, mmap_mode=mmap_mode)
+
+    columns, meta = build_battle_columns(iter_battles(path))
+    meta.update({'source': os.path.abspath(path), 'source_stamp': stamp})
+    os.makedirs(cache_dir, exist_ok=True)
+    write_battle_columns(columns, meta, target_dir)
+    _remove_stale_entries(path, cache_dir, keep=target_dir)
+    return read_battle_columns(target_dir, mmap_mode=mmap_mode)
@@ -0,0 +1,148 @@
+import warnings
+import numpy as np
+import pandas as pd
+
+
+"""
+Compact dtypes for the feature matrices.
+
+The builders return int64/float64 columns, the lead names as strings and the
+seen Pokémon as one multi-hot array per row. `compact_dtypes` shrinks a
+feature DataFrame without touching its values beyond float32 rounding:
+
+    int columns      -> the fixed width of the column in `INT_WIDTHS` (int32 if not listed)
+    float columns    -> float32
+    lead names       -> pandas Categorical
+    seen Pokémon     -> sparse int8 columns (`utils.functions.sparse_seen_pokemons`)
+
+The int widths come from what a column can hold (base stats are at most 255,
+turn counts stay well below 2**15, ...), not from the values of the frame at
+hand, so train and test, or two chunks, always get the same dtypes. A
+`UserWarning` lists the int columns whose values do not fit their width (they
+stay int64) and the float columns where float32 changes a value by more than
+`rtol` or turns a whole number into another one (counts above 2**24, values
+outside the float32 range; those columns are still converted). Bool, other
+object and sparse columns are left as they are.
+
+Categories are taken from the data; to give train and test the same codes,
+build them once and pass them to both calls:
+
+    categories = shared_categories(train_X, test_X)
+    train_X = compact_dtypes(train_X, categories=categories)
+    test_X = compact_dtypes(test_X, categories=categories)
+
+Every builder decorated with `accepts_chunks` takes `compact=True`, and
+`categories=` along with it:
+
+    train_X = create_specialist_features_lazy(train_df, compact=True, categories=categories)
+"""
+
+
+CATEGORICAL_COLUMNS = ('p1_lead_name', 'p2_lead_name')
+DEFAULT_INT_DTYPE = np.dtype(np.int32)
+# width of the int columns of the builders, from the range the feature can take
+INT_WIDTHS = {
+    # small counts and differences of counts (team slots, boost stages, moves)
+    **dict.fromkeys([
+        'mons_revealed_diff', 'team_status_diff', 'end_boost_diff', 'meta_diff', 'status_setup_diff',
+        'feat_switch_diff', 'move_diversity_diff', 'feat_status_diff_inflicted',
+        'team_2hko_p2_lead_count', 'team_2hkoed_by_p2_lead_count', 'p1_team_meta_count',
+        'p2_lead_is_meta', 'status_move_diff', 'setup_move_diff', 'volatile_status_diff',
+        'team_speed_adv_vs_lead', 'fainted_mons_diff', 'p1_meta_threat_count', 'p2_lead_is_meta_threat',
+        'p2_lead_forced_out', 'setup_advantage', 'key_attack_adv',
+    ], np.dtype(np.int8)),
+    # turn counts, base stats (<= 255) and their sums / differences
+    **dict.fromkeys([
+        'num_turns', 'first_ko_turn', 'first_faint_turn', 'momentum_shift_turn', 'momentum_flips',
+        'p1_lead_stay_duration', 'status_turns', 'p1_status_total', 'p2_status_total', 'status_balance',
+        'weighted_status_diff', 'lead_speed_diff', 'lead_hp_diff', 'lead_atk_diff', 'lead_def_diff',
+        'lead_spa_diff', 'lead_spd_diff', 'lead_bulk_diff', 'total_stats_diff',
+        'p1_lead_special_total', 'p2_lead_special_total', 'special_total_diff',
+        'p1_lead_physical_total', 'p2_lead_physical_total', 'physical_total_diff',
+        'lead_total_stats_p1', 'lead_total_stats_p2', 'p1_team_max_hp', 'total_base_power_diff',
+        *(f'{side}_lead_{stat}' for side in ('p1', 'p2') for stat in ('hp', 'atk', 'def', 'spa', 'spd', 'spe')),
+    ], np.dtype(np.int16)),
+    # products of stats and sums over turns
+    **dict.fromkeys(['stats_speed_interaction', 'hp_speed_interaction_lead', 'total_healing_done'],
+                    np.dtype(np.int32)),
+    'battle_id': np.dtype(np.int64),
+}
+
+
+def int_dtype(column, int_dtypes=None):
+    """Fixed int width of `column` (`int_dtypes` overrides `INT_WIDTHS`)."""
+    if int_dtypes and column in int_dtypes:
+        return np.dtype(int_dtypes[column])
+    return INT_WIDTHS.get(column, DEFAULT_INT_DTYPE)
+
+
+def shared_categories(*frames, columns=CATEGORICAL_COLUMNS):
+    """Sorted union of the values of `columns` over several DataFrames (dict column -> list)."""
+    categories = {}
+    for column in columns:
+        values = set()
+        for frame in frames:
+            if column in frame.columns:
+                values.update(frame[column].dropna().unique())
+        if values:
+            categories[column] = sorted(values, key=str)
+    return categories
+
+
+def compact_dtypes(df, categorical=CATEGORICAL_COLUMNS, categories=None, int_dtypes=None,
+                   float_dtype=np.float32, sparse_seen=True, rtol=1e-6, warn=True):
+    """
+    Returns a copy of `df` with compact dtypes.
+
+    Args:
+        df: feature DataFrame
+        categorical: columns to store as pandas Categorical (when present)
+        categories: optional dict column -> categories (see `shared_categories`)
+        int_dtypes: optional dict column -> int dtype, on top of `INT_WIDTHS`
+        float_dtype: dtype of the float columns
+        sparse_seen: expand the seen-Pokémon arrays into sparse int8 columns
+        rtol: relative change above which a float downcast counts as lossy
+        warn: emit a UserWarning listing the int columns that do not fit and the lossy float columns
+
+    Returns:
+        pd.DataFrame with the same index and (up to rounding) values; with `sparse_seen`
+        the seen-Pokémon columns are replaced by `p1_seen_pokemons_<i>`, ...
+    """
+    if sparse_seen:
+        # utils.functions imports this module
+        from utils.functions import sparse_seen_pokemons
+        df = sparse_seen_pokemons(df)
+    categories = categories or {}
+    converted, overflow, lossy = {}, [], []
+    for column in df.columns:
+        values = df[column]
+        dtype = values.dtype
+        if column in categorical:
+            converted[column] = pd.Categorical(values, categories=categories.get(column))
+        elif isinstance(dtype, pd.SparseDtype) or not isinstance(dtype, np.dtype):
+            continue
+        elif dtype.kind in 'iu':
+            array = values.to_numpy()
+            target = int_dtype(column, int_dtypes)
+            info = np.iinfo(target)
+            if len(array) and (array.min() < info.min or array.max() > info.max):
+                overflow.append(column)
+                continue
+            converted[column] = array.astype(target)
+        elif dtype.kind == 'f' and dtype.itemsize > np.dtype(float_dtype).itemsize:
+            array = values.to_numpy()
+            with np.errstate(over='ignore', invalid='ignore'):
+                small = array.astype(float_dtype)
+            integral = np.isfinite(array) & (array == np.round(array))
+            if (not np.allclose(small, array, rtol=rtol, atol=0, equal_nan=True)
+                    or (small[integral] != array[integral]).any()):
+                lossy.append(column)
+            converted[column] = small
+    if overflow and warn:
+        warnings.warn(f"values do not fit the int width of (kept as int64): {', '.join(overflow)}",
+                      stacklevel=2)
+    if lossy and warn:
+        warnings.warn(f"float32 downcast loses precision (rtol={rtol}) in: {', '.join(lossy)}",
+                      stacklevel=2)
+    return pd.DataFrame({column: converted.get(column, df[column]) for column in df.columns},
+                        index=df.index)
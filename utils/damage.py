@@ -0,0 +1,197 @@
+import numpy as np
+
+from utils.battle_cache import MISSING
+from utils.team_table import base_stats_table, UNKNOWN_STAT
+from utils.type_chart import EFFECTIVENESS, TYPE_NAMES, NO_TYPE, type_id
+
+
+"""
+Vectorized Gen 1 damage estimates.
+
+A `DamageEngine` holds, for every Pokémon id of a vocabulary, its base stats
+(`pokemon_base_stats_nested`), its types (from the team details) and the
+damaging moves it was seen using in the timelines (`p*_move_details`: type
+and base_power). From those it computes once, for a pair of levels, the
+attacker x defender x move table of expected damage, in % of the
+defender's HP:
+
+    damage = (floor(floor(floor(2 * L / 5 + 2) * power * A / D) / 50) + 2)
+             * STAB * type effectiveness * mean random roll (236/255) * accuracy
+
+with Gen 1 stats at level L (max DVs and stat experience), the physical /
+special split by move type and `TYPE_CHART_GEN1` (type names upper-cased).
+Critical hits are ignored. The best move of every attacker against every
+defender is kept as an attacker x defender table, and features for whole
+columns of battles are gathers into it:
+
+    engine = damage_engine(turn_table, team_table)
+    pct = engine.expected_damage(attacker_ids, defender_ids, attacker_levels, defender_levels)
+    turns_to_ko(pct)
+
+A Pokémon that was never seen using a damaging move gets a STAB move of
+`DEFAULT_POWER` of its first type. Id -1 (unknown Pokémon) reads a
+trailing entry with stats of 80 and no type.
+"""
+
+
+DEFAULT_LEVEL = 100
+DEFAULT_POWER = 80
+STAB = 1.5
+RANDOM_MEAN = 236 / 255  # mean of the 217..255 / 255 roll
+MAX_TURNS_TO_KO = 99
+SPECIAL_TYPES = {'FIRE', 'WATER', 'GRASS', 'ELECTRIC', 'PSYCHIC', 'ICE', 'DRAGON'}
+IS_SPECIAL = np.array([name in SPECIAL_TYPES for name in TYPE_NAMES])
+
+_HP, _ATK, _DEF, _SPA, _SPD, _SPE = range(6)
+
+
+def stat_at_level(base, level, hp=False):
+    """Gen 1 stat with max DVs (15) and max stat experience."""
+    core = np.floor(((np.asarray(base, dtype=float) + 15) * 2 + 63) * np.asarray(level) / 100)
+    return core + (np.asarray(level) + 10 if hp else 5)
+
+
+def base_damage(level, power, attack, defense):
+    """Gen 1 damage before STAB, type effectiveness and the random roll (0 for power 0)."""
+    damage = np.floor(np.floor(np.floor(2 * level / 5 + 2) * power * attack / defense) / 50) + 2
+    return np.where(np.asarray(power) > 0, damage, 0.0)
+
+
+def turns_to_ko(pct, cap=MAX_TURNS_TO_KO):
+    """Hits needed to take 100% at `pct` per hit (`cap` if no damage)."""
+    pct = np.asarray(pct, dtype=float)
+    with np.errstate(divide='ignore'):
+        turns = np.ceil(np.where(pct > 0, 100.0 / pct, np.inf))
+    return np.minimum(turns, cap)
+
+
+class DamageEngine:
+    """
+    Expected damage between every pair of Pokémon ids.
+
+    Args:
+        names: Pokémon names indexed by id
+        types: (len(names), 2) type-chart ids
+        moveset: (len(names), n_moves) bool, moves each Pokémon can use
+        move_type: (n_moves,) type-chart id of every move
+        move_power: (n_moves,) base power (0 for status moves)
+        move_accuracy: optional (n_moves,) hit probability (default 1)
+    """
+
+    def __init__(self, names, types, moveset, move_type, move_power, move_accuracy=None):
+        n = len(names)
+        stats = base_stats_table(names)
+        self.names = list(names)
+        self.stats = np.where(stats == MISSING, UNKNOWN_STAT, stats).astype(float)
+        self.types = np.vstack([np.asarray(types, dtype=np.int64).reshape(n, 2), [[NO_TYPE, NO_TYPE]]])
+        self.moveset = np.vstack([np.asarray(moveset, dtype=bool).reshape(n, -1),
+                                  np.zeros((1, len(move_type)), dtype=bool)])
+        self.move_type = np.asarray(move_type, dtype=np.int64)
+        self.move_power = np.asarray(move_power, dtype=float)
+        self.move_accuracy = (np.ones(len(self.move_type)) if move_accuracy is None
+                              else np.asarray(move_accuracy, dtype=float))
+        self._best = {}
+
+    def _percent(self, attack_level, defend_level, move_type, power, accuracy):
+        """Expected % damage as (attacker, defender, move), for moves shaped (1 or n_attackers, 1, n_moves)."""
+        special = IS_SPECIAL[move_type]
+        attack = np.where(special, stat_at_level(self.stats[:, None, None, _SPA], attack_level),
+                          stat_at_level(self.stats[:, None, None, _ATK], attack_level))
+        defense = np.where(special, stat_at_level(self.stats[None, :, None, _SPD], defend_level),
+                           stat_at_level(self.stats[None, :, None, _DEF], defend_level))
+        hp = stat_at_level(self.stats[None, :, None, _HP], defend_level, hp=True)
+        damage = base_damage(attack_level, power, attack, defense)
+        stab = np.where((self.types[:, None, None, :] == move_type[..., None]).any(axis=-1)
+                        & (move_type != NO_TYPE), STAB, 1.0)
+        effectiveness = EFFECTIVENESS[move_type[..., None], self.types[None, :, None, :]].prod(axis=-1)
+        return 100.0 * damage * stab * effectiveness * RANDOM_MEAN * accuracy / hp
+
+    def move_damage(self, attack_level=DEFAULT_LEVEL, defend_level=DEFAULT_LEVEL):
+        """(n + 1, n + 1, n_moves) expected % damage of every move; 0 for moves outside the moveset."""
+        pct = self._percent(attack_level, defend_level, self.move_type[None, None, :],
+                            self.move_power, self.move_accuracy)
+        return np.where(self.moveset[:, None, :], pct, 0.0)
+
+    def best_damage(self, attack_level=DEFAULT_LEVEL, defend_level=DEFAULT_LEVEL):
+        """(n + 1, n + 1) expected % damage of the attacker's best move (cached per level pair)."""
+        key = (attack_level, defend_level)
+        if key not in self._best:
+            best = self.move_damage(attack_level, defend_level).max(axis=2, initial=0.0)
+            # default STAB move for the attackers without a damaging move
+            fallback_type = self.types[:, None, :1]
+            fallback = self._percent(attack_level, defend_level, fallback_type,
+                                     np.where(fallback_type != NO_TYPE, DEFAULT_POWER, 0), 1.0)[:, :, 0]
+            has_attack = (self.moveset & (self.move_power > 0)).any(axis=1)
+            self._best[key] = np.where(has_attack[:, None], best, fallback)
+        return self._best[key]
+
+    def expected_damage(self, attackers, defenders, attack_levels=None, defend_levels=None):
+        """
+        Best expected % damage for every (attacker, defender) pair of ids.
+
+        Args:
+            attackers, defenders: arrays of Pokémon ids (-1 or out of range = unknown)
+            attack_levels, defend_levels: arrays of levels (default / -1: `DEFAULT_LEVEL`)
+
+        Returns:
+            float array with the shape of `attackers`
+        """
+        n = len(self.names)
+        # ids outside the engine's vocabulary read the unknown entry
+        attackers, defenders = (np.where((ids >= 0) & (ids < n), ids, MISSING)
+                                for ids in (np.asarray(attackers, dtype=np.int64),
+                                            np.asarray(defenders, dtype=np.int64)))
+        levels = [np.full(attackers.shape, DEFAULT_LEVEL) if lv is None
+                  else np.where(np.asarray(lv) == MISSING, DEFAULT_LEVEL, lv)
+                  for lv in (attack_levels, defend_levels)]
+        out = np.zeros(attackers.shape)
+        pairs = np.stack([levels[0].ravel(), levels[1].ravel()], axis=1)
+        for attack_level, defend_level in np.unique(pairs, axis=0):
+            mask = (levels[0] == attack_level) & (levels[1] == defend_level)
+            table = self.best_damage(int(attack_level), int(defend_level))
+            out[mask] = table[attackers[mask], defenders[mask]]
+        return out
+
+
+def species_types(codes, type_ids, n_pokemon):
+    """(n_pokemon, 2) types of every Pokémon id from its first row in `codes`."""
+    types = np.full((n_pokemon, 2), NO_TYPE, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+    known = codes >= 0
+    ids, first = np.unique(codes[known], return_index=True)
+    types[ids] = np.asarray(type_ids)[known][first]
+    return types
+
+
+def damage_engine(turn_table, team_table):
+    """
+    `DamageEngine` over the Pokémon vocabulary shared by a `TurnTable` and a
+    `TeamTable` (e.g. both built with the same `Vocab`, or both from the cache).
+
+    Movesets are the (Pokémon, move) pairs of the timelines; every move takes
+    the type and the largest base power it was seen with.
+    """
+    names = team_table.vocab['pokemon']
+    if len(turn_table.vocab['pokemon']) > len(names):
+        names = turn_table.vocab['pokemon']
+    n_pokemon, n_moves = len(names), len(turn_table.vocab['move'])
+    chart_ids = np.array([type_id(name, normalize=True) for name in turn_table.vocab['move_type']] + [NO_TYPE],
+                         dtype=np.int64)
+
+    pokemon = np.concatenate([np.asarray(turn_table[f'{side}_name'], dtype=np.int64) for side in ('p1', 'p2')])
+    moves = np.concatenate([np.asarray(turn_table[f'{side}_move_id'], dtype=np.int64) for side in ('p1', 'p2')])
+    move_types = np.concatenate([np.asarray(turn_table[f'{side}_move_type'], dtype=np.int64) for side in ('p1', 'p2')])
+    powers = np.concatenate([np.asarray(turn_table[f'{side}_base_power'], dtype=float) for side in ('p1', 'p2')])
+
+    used = moves >= 0
+    move_type = np.full(n_moves, NO_TYPE, dtype=np.int64)
+    move_type[moves[used]] = chart_ids[move_types[used]]
+    move_power = np.zeros(n_moves)
+    np.maximum.at(move_power, moves[used], powers[used])
+    moveset = np.zeros((n_pokemon, n_moves), dtype=bool)
+    seen = used & (pokemon >= 0)
+    moveset[pokemon[seen], moves[seen]] = True
+
+    team_types = np.concatenate([team_table.types('team', normalize=True), team_table.types('lead', normalize=True)])
+    codes = np.concatenate([team_table['team_name'], team_table['lead_name']])
+    return DamageEngine(names, species_types(codes, team_types, n_pokemon), moveset, move_type, move_power)
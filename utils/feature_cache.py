@@ -0,0 +1,248 @@
+import os
+import re
+import sys
+import json
+import glob
+import types
+import shutil
+import inspect
+import pickle
+import hashlib
+
+import joblib
+import pandas as pd
+
+from utils.compact import compact_dtypes
+
+
+"""
+Persistent per-battle cache of computed feature rows.
+
+`cached_features(create_specialist_features, df)` stores every feature row
+together with a hash of the raw battle it was computed from. Entries live in
+one folder per feature function and version:
+
+    <cache_dir>/<function name>-<version hash>-<kwargs hash>/part-00000.pkl, part-00001.pkl, ...
+
+The version hash covers the source files of the feature function's module
+and of every project module it imports from, directly or not (e.g.
+`utils/replay.py`, `utils/turn_table.py`), plus an optional explicit
+`version` string, so editing any of the feature code starts a fresh entry.
+The keyword arguments forwarded to the builder (an `engine`, ...) get their
+own entry. `compact=True` / `categories=` are not forwarded: the parts keep
+the plain dtypes and the returned frame is compacted once, so the category
+codes cannot differ between parts.
+
+On a re-run only battles whose battle_id is new, or whose content hash
+changed, are computed; the rest is read back in bulk. With a
+DataFrame the hash is taken over the pickled raw columns; with the path of a
+.jsonl file it is the hash of the raw line, and cached battles are not even
+parsed (the two kinds of hash do not match each other: a battle cached from
+a DataFrame is recomputed once when the file path is used, and vice versa).
+
+New rows are flushed to a new part file after every chunk, so an interrupted
+extraction resumes from the last flushed chunk. At the end of a run the
+parts are compacted into one file.
+"""
+
+
+FEATURE_CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = '.feature_cache'
+# columns that feature functions read: the content hash only covers these
+HASH_COLUMNS = ['p1_team_details', 'p2_lead_details', 'p2_team_details', 'battle_timeline']
+HASH_COLUMN = '_content_hash'
+_BATTLE_ID = re.compile(rb'"battle_id"\s*:\s*(-?\d+)')
+# builder keywords that only change how the rows are computed, not the rows
+EXECUTION_KWARGS = ('n_jobs', 'shard_size')
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _project_module(obj):
+    """Module of `obj` (a module, function or class) if it is a source file of this project."""
+    module = obj if isinstance(obj, types.ModuleType) else sys.modules.get(getattr(obj, '__module__', None) or '')
+    path = getattr(module, '__file__', None)
+    if path and os.path.abspath(path).startswith(PROJECT_ROOT + os.sep) and 'site-packages' not in path:
+        return module
+    return None
+
+
+def project_sources(feature_fn):
+    """Source files of the feature function's module and of the project modules it imports from."""
+    root = _project_module(inspect.unwrap(feature_fn))
+    seen, todo = set(), [root] if root is not None else []
+    while todo:
+        module = todo.pop()
+        if module.__name__ in seen:
+            continue
+        seen.add(module.__name__)
+        for value in vars(module).values():
+            dependency = _project_module(value)
+            if dependency is not None and dependency.__name__ not in seen:
+                todo.append(dependency)
+    return sorted(os.path.abspath(sys.modules[name].__file__) for name in seen)
+
+
+def feature_version(feature_fn, version=None):
+    """Hash of the feature code (`project_sources`), the function's qualified name and optional `version`."""
+    fn = inspect.unwrap(feature_fn)
+    h = hashlib.sha1(f"{FEATURE_CACHE_VERSION}:{fn.__module__}.{fn.__qualname__}:{version}".encode())
+    sources = project_sources(fn)
+    if not sources:
+        source = inspect.getsourcefile(fn)
+        sources = [source] if source and os.path.exists(source) else []
+    for source in sources:
+        h.update(os.path.relpath(source, PROJECT_ROOT).encode())
+        with open(source, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def kwargs_version(kwargs):
+    """Hash of the keyword arguments forwarded to the builder (execution-only ones excluded)."""
+    return joblib.hash({k: v for k, v in kwargs.items() if k not in EXECUTION_KWARGS})
+
+
+def content_hashes(df, columns=None):
+    """One SHA-1 per battle, over the pickled raw columns the features read."""
+    columns = [c for c in (columns or HASH_COLUMNS) if c in df.columns]
+    records = zip(*(df[c] for c in columns))
+    return [hashlib.sha1(pickle.dumps(values, protocol=4)).hexdigest() for values in records]
+
+
+def _scan_jsonl(path, chunksize):
+    """Yields blocks of (battle_ids, line hashes, lines) without parsing the battles."""
+    ids, hashes, lines = [], [], []
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            match = _BATTLE_ID.search(line)
+            ids.append(int(match.group(1)) if match else json.loads(line)['battle_id'])
+            hashes.append(hashlib.sha1(line).hexdigest())
+            lines.append(line)
+            if len(lines) == chunksize:
+                yield ids, hashes, lines
+                ids, hashes, lines = [], [], []
+    if lines:
+        yield ids, hashes, lines
+
+
+def cache_path_for_features(feature_fn, cache_dir=None, version=None, kwargs=None):
+    """Directory of the cache entry for `feature_fn` called with `kwargs` (it may not exist yet)."""
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    name = getattr(feature_fn, '__name__', 'features')
+    return os.path.join(cache_dir, f"{name}-{feature_version(feature_fn, version)[:16]}-"
+                                   f"{kwargs_version(kwargs or {})[:8]}")
+
+
+def _parts(target_dir):
+    return sorted(glob.glob(os.path.join(target_dir, 'part-*.pkl')))
+
+
+def read_feature_cache(target_dir):
+    """All cached rows (indexed by battle_id, with the content hash column); None if empty."""
+    parts = [pd.read_pickle(p) for p in _parts(target_dir)]
+    if not parts:
+        return None
+    rows = pd.concat(parts)
+    # a battle recomputed later (changed content) lives in a newer part
+    return rows[~rows.index.duplicated(keep='last')]
+
+
+def _write_part(rows, target_dir):
+    os.makedirs(target_dir, exist_ok=True)
+    existing = _parts(target_dir)
+    number = int(os.path.basename(existing[-1])[5:10]) + 1 if existing else 0
+    path = os.path.join(target_dir, f"part-{number:05d}.pkl")
+    tmp = f"{path}.tmp-{os.getpid()}"
+    rows.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+def compact_feature_cache(target_dir):
+    """Merges the part files of an entry into a single one."""
+    parts = _parts(target_dir)
+    if len(parts) <= 1:
+        return
+    rows = read_feature_cache(target_dir)
+    merged = os.path.join(target_dir, 'part-00000.pkl')
+    tmp = f"{merged}.tmp-{os.getpid()}"
+    rows.to_pickle(tmp)
+    for part in parts[1:]:
+        os.remove(part)
+    os.replace(tmp, merged)
+
+
+def _remove_stale_entries(feature_fn, cache_dir, keep):
+    """Drops the entries of older versions of `feature_fn` (entries of other kwargs are kept)."""
+    name = getattr(feature_fn, '__name__', 'features')
+    current = os.path.basename(keep).rsplit('-', 1)[0] + '-'
+    for entry in glob.glob(os.path.join(cache_dir, f"{glob.escape(name)}-*")):
+        if not os.path.basename(entry).startswith(current) and os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _update(feature_fn, ids, hashes, load, target_dir, cached, chunksize, kwargs):
+    """Computes (and flushes) the rows of the battles that are new or changed."""
+    if cached is not None:
+        known = cached[HASH_COLUMN].reindex(ids).to_numpy()
+        todo = [i for i, h in enumerate(hashes) if known[i] != h]
+    else:
+        todo = list(range(len(ids)))
+
+    new_rows = []
+    for start in range(0, len(todo), chunksize):
+        positions = todo[start:start + chunksize]
+        rows = feature_fn(load(positions), **kwargs)
+        rows[HASH_COLUMN] = [hashes[i] for i in positions]
+        _write_part(rows, target_dir)
+        new_rows.append(rows)
+    return new_rows
+
+
+def cached_features(feature_fn, df, cache_dir=None, version=None, chunksize=1000, **kwargs):
+    """
+    `feature_fn(df)` backed by the per-battle feature cache.
+
+    Args:
+        feature_fn: a `create_*features*` builder (returns a DataFrame indexed by battle_id)
+        df: battles DataFrame, an iterable of chunks, or the path of a .jsonl file
+        cache_dir: where cache entries live (default: `.feature_cache` in the working dir)
+        version: extra version tag, e.g. when a data file the features read changed
+        chunksize: battles computed between two flushes to disk
+        **kwargs: forwarded to `feature_fn`, except `compact` / `categories`
+            (applied to the result with `utils.compact.compact_dtypes`)
+
+    Returns:
+        pd.DataFrame indexed by battle_id, rows in the order of `df`
+    """
+    compact, categories = kwargs.pop('compact', False), kwargs.pop('categories', None)
+    target_dir = cache_path_for_features(feature_fn, cache_dir, version, kwargs)
+    cached = read_feature_cache(target_dir)
+
+    all_ids, new_rows = [], []
+    if isinstance(df, str):
+        # raw lines are hashed, only the battles to compute are parsed
+        for ids, hashes, lines in _scan_jsonl(df, chunksize):
+            load = lambda positions: pd.DataFrame([json.loads(lines[i]) for i in positions])
+            new_rows += _update(feature_fn, ids, hashes, load, target_dir, cached, chunksize, kwargs)
+            all_ids += ids
+    else:
+        for chunk in ([df] if isinstance(df, pd.DataFrame) else df):
+            if not len(chunk):
+                continue
+            ids = chunk['battle_id'].tolist()
+            load = lambda positions: chunk.iloc[positions]
+            new_rows += _update(feature_fn, ids, content_hashes(chunk), load, target_dir, cached, chunksize, kwargs)
+            all_ids += ids
+
+    frames = ([cached] if cached is not None else []) + new_rows
+    compact_feature_cache(target_dir)
+    _remove_stale_entries(feature_fn, cache_dir or DEFAULT_CACHE_DIR, keep=target_dir)
+    if not frames:
+        return pd.DataFrame()
+    rows = pd.concat(frames)
+    rows = rows[~rows.index.duplicated(keep='last')]
+    rows = rows.loc[all_ids].drop(columns=HASH_COLUMN)
+    return compact_dtypes(rows, categories=categories) if compact else rows
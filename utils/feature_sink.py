@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+Preallocated columnar storage for feature rows.
+
+Instead of keeping one dict per battle and calling `pd.DataFrame(rows)` at
+the end, feature rows are written straight into typed numpy columns:
+
+    sink = FeatureSink(n_battles)
+    for i, battle in enumerate(battles):
+        sink.write(i, extractor_features(battle))
+    frame = sink.to_frame(index)          # wraps the columns, no copy
+
+A `FeatureSchema` (column name -> dtype) can be declared up front; columns
+that are not declared are added the first time they appear, in order of first
+appearance, like `pd.DataFrame(list_of_dicts)`. Column dtypes follow the same
+inference as pandas: ints stay int64 until a float or a missing value shows
+up (then float64), bools mixed with numbers and anything else (strings,
+arrays) become object columns. Missing values are NaN.
+
+`ChunkedFeatureSink` is the appendable version for streams of unknown length:
+rows go into fixed-size chunks that are only concatenated at the end.
+"""
+
+
+_BOOL = np.dtype(bool)
+_INT = np.dtype(np.int64)
+_FLOAT = np.dtype(np.float64)
+_OBJECT = np.dtype(object)
+
+
+def value_dtype(value):
+    """Column dtype a single value asks for (None for a missing value)."""
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return _BOOL
+    if isinstance(value, (int, np.integer)):
+        return _INT
+    if isinstance(value, (float, np.floating)):
+        return _FLOAT
+    return _OBJECT
+
+
+def common_dtype(current, new):
+    """Dtype that holds values of both `current` and `new` (None = missing value)."""
+    if new is None:
+        # NaN needs a float (or object) column
+        return _FLOAT if current in (_INT, _FLOAT) else _OBJECT
+    if current == new:
+        return current
+    if _OBJECT in (current, new) or _BOOL in (current, new):
+        return _OBJECT
+    return _FLOAT
+
+
+def _empty(dtype, size):
+    if dtype == _FLOAT:
+        return np.full(size, np.nan)
+    if dtype == _OBJECT:
+        return np.full(size, np.nan, dtype=object)
+    return np.zeros(size, dtype=dtype)
+
+
+class FeatureSchema:
+    """
+    Ordered column names and dtypes of a feature set.
+
+    Args:
+        columns: dict name -> dtype, or list of (name, dtype) pairs
+    """
+
+    def __init__(self, columns=()):
+        self.dtypes = {}
+        for name, dtype in (columns.items() if isinstance(columns, dict) else columns):
+            self.dtypes[name] = np.dtype(dtype)
+
+    @classmethod
+    def from_row(cls, row):
+        """Schema inferred from one feature dict (missing values give float columns)."""
+        return cls({name: value_dtype(value) or _FLOAT for name, value in row.items()})
+
+    @property
+    def names(self):
+        return list(self.dtypes)
+
+    def __len__(self):
+        return len(self.dtypes)
+
+    def __contains__(self, name):
+        return name in self.dtypes
+
+
+class FeatureSink:
+    """
+    Typed columns for `size` rows, filled by row index.
+
+    Args:
+        size: number of rows to preallocate
+        schema: optional `FeatureSchema` (or dict name -> dtype) of the known columns
+    """
+
+    def __init__(self, size, schema=None):
+        if schema is not None and not isinstance(schema, FeatureSchema):
+            schema = FeatureSchema(schema)
+        self.size = size
+        self.columns = {}
+        self.written = 0
+        for name, dtype in (schema.dtypes.items() if schema is not None else ()):
+            self.columns[name] = _empty(dtype, size)
+
+    @property
+    def schema(self):
+        return FeatureSchema({name: col.dtype for name, col in self.columns.items()})
+
+    def _retype(self, name, dtype):
+        self.columns[name] = self.columns[name].astype(dtype)
+
+    def write(self, i, row):
+        """Writes the feature dict `row` into row `i`."""
+        columns = self.columns
+        known = len(columns)
+        matched = 0
+        for name, value in row.items():
+            col = columns.get(name)
+            if col is None:
+                # new column: the rows written so far are missing
+                dtype = value_dtype(value) or _FLOAT
+                col = columns[name] = _empty(common_dtype(dtype, None) if self.written else dtype, self.size)
+            else:
+                matched += 1
+                dtype = value_dtype(value)
+                if dtype != col.dtype:
+                    wider = common_dtype(col.dtype, dtype)
+                    if wider != col.dtype:
+                        self._retype(name, wider)
+                        col = columns[name]
+            col[i] = np.nan if value is None and col.dtype != _OBJECT else value
+        if matched < known:
+            for name in [c for c in columns if c not in row]:
+                wider = common_dtype(columns[name].dtype, None)
+                if wider != columns[name].dtype:
+                    self._retype(name, wider)
+                columns[name][i] = np.nan
+        self.written = max(self.written, i + 1)
+
+    def to_frame(self, index=None, rows=None):
+        """
+        DataFrame over the columns (no copy: every column keeps its own array).
+
+        Args:
+            index: optional index (array or pd.Index) of the written rows
+            rows: number of rows to keep (default: up to the last row written)
+        """
+        rows = self.written if rows is None else rows
+        data = {name: col[:rows] for name, col in self.columns.items()}
+        return pd.DataFrame(data, index=index, copy=False)
+
+
+class ChunkedFeatureSink:
+    """
+    Appendable feature rows for streams of unknown length.
+
+    Rows are appended to `FeatureSink` chunks of `chunk_size` rows; `to_frame`
+    concatenates them once at the end (columns missing from a chunk are NaN).
+    """
+
+    def __init__(self, schema=None, chunk_size=4096):
+        self.schema = schema
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.index = []
+
+    def __len__(self):
+        return sum(chunk.written for chunk in self.chunks)
+
+    def append(self, row, index=None):
+        """Appends one feature dict (and its index value)."""
+        if not self.chunks or self.chunks[-1].written == self.chunk_size:
+            schema = self.chunks[-1].schema if self.chunks else self.schema
+            self.chunks.append(FeatureSink(self.chunk_size, schema))
+        chunk = self.chunks[-1]
+        chunk.write(chunk.written, row)
+        self.index.append(index)
+
+    def frames(self, index_name=None):
+        """One DataFrame per chunk, e.g. to write them out while streaming."""
+        start = 0
+        for chunk in self.chunks:
+            index = pd.Index(self.index[start:start + chunk.written], name=index_name)
+            start += chunk.written
+            yield chunk.to_frame(index)
+
+    def to_frame(self, index_name=None):
+        frames = list(self.frames(index_name))
+        if not frames:
+            return pd.DataFrame()
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
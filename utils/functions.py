@@ -1,8 +1,9 @@
+import functools
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 from collections.abc import Mapping, Sequence
-from tqdm import tqdm
 
 from utils.extra import (
     pokemon_base_stats_nested,
@@ -14,6 +15,10 @@ from utils.extra import (
     POKEMON_RANKING,
     POKEMON_LIST
 )
+from utils.interning import intern_battles
+from utils.compact import compact_dtypes
+from utils.battle_cache import MISSING, STATS as TEAM_STATS
+from utils.team_table import build_team_table
 
 
 """
@@ -22,15 +27,19 @@ from raw battle logs (JSONL → DataFrame rows).
 
 This module provides:
 1. Base stat extraction:
-   - `extract_base_stats` flattens the first 1000 Pokémon team entries into numeric base stat rows.
+   - `extract_base_stats` flattens the first 1000 Pokémon team entries into numeric base stat rows
+     (through the typed team table of `utils/team_table.py`).
    - `get_base_stats` retrieves canonical or fallback stats for a Pokémon.
 
 2. Battle timeline parsing:
    - `get_pokemons_seen_in_battle` returns which Pokémon appeared for each player.
-   - `get_all_pokemons_used` scans the full dataset for every Pokémon name across teams, leads, and timeline states.
+   - `get_all_pokemons_used` lists every Pokémon name across teams, leads, and timeline states
+     (the ids and flag arrays themselves live in `utils/interning.py`).
 
 3. Encoding utilities:
    - `encode_pokemon_set` converts a set of Pokémon names into a multi-hot strength-ranking vector.
+   - `encode_pokemon_sets` does the same for many sets at once, as a sparse CSR matrix, and
+     `sparse_seen_pokemons` turns the `*_seen_pokemons` array columns into sparse 0/1 columns.
    - `pokemon_embeddings` maps each Pokémon to a fixed 6-dimensional stat embedding.
 
 4. Gameplay logic helpers:
@@ -40,6 +49,8 @@ This module provides:
    - `safe_get` safely traverses deeply nested dictionaries.
    - `extract_levels` extracts Pokémon levels from the team structure.
    - `check_missing` recursively detects missing, null, or malformed values anywhere in a dict/list tree.
+   - `accepts_chunks` lets a feature builder consume a stream of DataFrame chunks (see `load_jsonl(..., chunksize=...)`),
+     run on a process pool with `n_jobs=...` and return compact dtypes with `compact=True`.
 
 Everything assumes Showdown-style Gen 1 battle logs with fields like:
 `p1_team_details`, `p2_lead_details`, and `battle_timeline`.
@@ -48,27 +59,11 @@ Everything assumes Showdown-style Gen 1 battle logs with fields like:
 
 
 def extract_base_stats(df):
-    stats = []
-    for _, row in df.head(1000).iterrows():
-        team = row.get("p1_team_details")
-        if isinstance(team, list):
-            for poke in team:
-                def grab_stat(field):
-                    val = safe_get(poke, field, "value")
-                    if val is None and isinstance(poke.get(field), (int, float)):
-                        val = poke[field]
-                    return val
-                stat_entry = {
-                    'hp': grab_stat('base_hp'),
-                    'atk': grab_stat('base_atk'),
-                    'def': grab_stat('base_def'),
-                    'spa': grab_stat('base_spa'),
-                    'spd': grab_stat('base_spd'),
-                    'spe': grab_stat('base_spe')
-                }
-                if all(isinstance(v, (int, float)) for v in stat_entry.values()):
-                    stats.append(stat_entry)
-    return pd.DataFrame(stats)
+    """Base stats (hp..spe) of the P1 team slots of the first 1000 battles that have all six."""
+    teams = build_team_table(df['p1_team_details'].head(1000), None)
+    stats = np.stack([teams[f'team_{stat}'] for stat in TEAM_STATS], axis=1)
+    complete = (stats != MISSING).all(axis=1)
+    return pd.DataFrame(stats[complete], columns=['hp', 'atk', 'def', 'spa', 'spd', 'spe'])
 
 
 
@@ -99,6 +94,62 @@ def encode_pokemon_set(pokemon_set):
     return vector
 
 
+SEEN_POKEMON_COLUMNS = ['p1_seen_pokemons', 'p2_seen_pokemons']
+
+
+def multi_hot_matrix(rows, cols, n_rows, n_cols=None):
+    """CSR int8 matrix with a 1 at every (row, col) pair (duplicates count once)."""
+    n_cols = len(POKEMON_LIST) if n_cols is None else n_cols
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n_rows, n_cols))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def encode_pokemon_sets(pokemon_sets):
+    """
+    Batched `encode_pokemon_set`: one row per set, as a sparse matrix.
+
+    Args:
+        pokemon_sets: iterable of sets (or lists) of Pokémon names
+
+    Returns:
+        scipy.sparse.csr_matrix (n_sets, len(POKEMON_LIST)) of int8
+    """
+    rows, cols = [], []
+    n = 0
+    for n, pokemon_set in enumerate(pokemon_sets, start=1):
+        for p in pokemon_set or ():
+            rank = POKEMON_RANKING.get(p)
+            if rank:  # skip unknown Pokémon
+                rows.append(n - 1)
+                cols.append(rank - 1)
+    return multi_hot_matrix(rows, cols, n)
+
+
+def replace_with_sparse_columns(df, column, matrix):
+    """`df` with `column` replaced, at the same position, by the sparse columns `{column}_{i}` of `matrix`."""
+    names = [f"{column}_{i}" for i in range(matrix.shape[1])]
+    expanded = pd.DataFrame.sparse.from_spmatrix(matrix, index=df.index, columns=names)
+    position = df.columns.get_loc(column)
+    return pd.concat([df.iloc[:, :position], expanded, df.iloc[:, position + 1:]], axis=1)
+
+
+def sparse_seen_pokemons(df, columns=None):
+    """
+    Replaces the multi-hot array columns (`p1_seen_pokemons`, `p2_seen_pokemons`) with
+    sparse int8 columns `p1_seen_pokemons_0`, ..., which models can take directly.
+    """
+    for column in columns or SEEN_POKEMON_COLUMNS:
+        if column in df.columns and df[column].dtype == object:
+            values = df[column].tolist()
+            dense = np.stack(values) if values else np.zeros((0, len(POKEMON_LIST)))
+            df = replace_with_sparse_columns(df, column, sparse.csr_matrix(dense, dtype=np.int8))
+    return df
+
+
 def get_pokemons_seen_in_battle(battle_timeline):
     """
     Extracts the set of Pokémon seen for each player during the battle.
@@ -153,33 +204,8 @@ def get_base_stats(name):
 
 
 def get_all_pokemons_used(df):
-    all_pokemons = set()
-    
-    for _, row in tqdm(df.iterrows(), total=df.shape[0], desc="Collecting Pokémon names"):
-        # Player 1 team
-        for p in row.get('p1_team_details', []):
-            if 'name' in p:
-                all_pokemons.add(p['name'])
-        
-        # Player 2 lead
-        p2_lead = row.get('p2_lead_details', {})
-        if 'name' in p2_lead:
-            all_pokemons.add(p2_lead['name'])
-        
-        # Pokémon seen in battle timeline
-        timeline = row.get('battle_timeline', [])
-        for turn in timeline:
-            # Player 1
-            p1_state = turn.get('p1_pokemon_state')
-            if p1_state and 'name' in p1_state:
-                all_pokemons.add(p1_state['name'])
-            
-            # Player 2
-            p2_state = turn.get('p2_pokemon_state')
-            if p2_state and 'name' in p2_state:
-                all_pokemons.add(p2_state['name'])
-    
-    return sorted(all_pokemons)  # sorted list for easier reference
+    """Sorted names of every Pokémon in the teams, leads and timelines (one pass, see `intern_battles`)."""
+    return sorted(intern_battles(df)['pokemon'].names)
 
 def safe_get(d, *keys):
     """Traverse nested dicts or return None if something’s missing."""
@@ -190,19 +216,43 @@ def safe_get(d, *keys):
             return None
     return d
 
+def accepts_chunks(feature_fn):
+    """
+    Decorator for the `create_*features*` builders: they keep taking a DataFrame,
+    but can also be given an iterable of DataFrame chunks (e.g. the generator
+    returned by `load_jsonl(path, chunksize=...)`). Each chunk is processed and
+    released before the next one is read, and the per-chunk results are concatenated.
+
+    With `n_jobs` (-1 = all cores) the battles are split across a process pool
+    (`utils.parallel.run_parallel`); the rows come back in the serial order.
+
+    With `compact=True` the result goes through `utils.compact.compact_dtypes`
+    (fixed-width ints, float32, Categorical lead names, sparse seen-Pokémon columns)
+    once all the rows are in; `categories=` (e.g. from `shared_categories(train_X, test_X)`)
+    is passed on, so train and test get the same category codes.
+    """
+    @functools.wraps(feature_fn)
+    def wrapper(df, *args, n_jobs=None, shard_size=None, compact=False, categories=None, **kwargs):
+        if compact:
+            frame = wrapper(df, *args, n_jobs=n_jobs, shard_size=shard_size, **kwargs)
+            return compact_dtypes(frame, categories=categories)
+        if n_jobs not in (None, 1):
+            from utils.parallel import run_parallel
+            # the workers get `wrapper` itself (picklable by name) and run it serially
+            return run_parallel(wrapper, df, *args, n_jobs=n_jobs, shard_size=shard_size, **kwargs)
+        if isinstance(df, pd.DataFrame):
+            return feature_fn(df, *args, **kwargs)
+        parts = [feature_fn(chunk, *args, **kwargs) for chunk in df if len(chunk)]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts)
+    return wrapper
+
+
 def extract_levels(df):
-    levels = []
-    for _, row in df.head(1000).iterrows():
-        team = row.get("p1_team_details")
-        if isinstance(team, list):
-            for poke in team:
-                # Handle both nested and flat structure
-                lvl = safe_get(poke, "level", "value")
-                if lvl is None and isinstance(poke.get("level"), (int, float)):
-                    lvl = poke["level"]
-                if isinstance(lvl, (int, float)):
-                    levels.append(lvl)
-    return levels
+    """Levels of the P1 team slots of the first 1000 battles (flat or {'value': ...})."""
+    levels = build_team_table(df['p1_team_details'].head(1000), None)['team_level']
+    return levels[levels != MISSING].tolist()
 
 
 # === Function to recursively detect missing / malformed values ===
@@ -0,0 +1,147 @@
+import numpy as np
+
+from utils.extra import (
+    META_THREATS_GEN1,
+    STATUS_MOVES,
+    SETUP_MOVES,
+    KEY_ATTACKS,
+    POKEMON_RANKING,
+    STATUS_WEIGHTS
+)
+from utils.battle_cache import Vocab, MISSING
+
+
+"""
+Integer interning of Pokémon, move, type and status names, with flag arrays.
+
+Names are turned into compact ids once, in order of first appearance (the
+columnar cache and the turn table already store ids, `intern_battles` does the
+same in one pass over a DataFrame). An `InternedVocab` then exposes the
+lookup tables of `utils/extra.py` as arrays indexed by id:
+
+    pokemon = InternedVocab('pokemon', table.vocab['pokemon'])
+    is_meta = pokemon.is_meta_threat[table['p1_name']]      # bool per turn
+    weight = InternedVocab('status', STATUS_NAMES).status_weight[codes]
+
+so membership tests become array gathers. Every flag array has one extra
+trailing entry (False / 0) that id -1 (`MISSING`) reads, so missing values
+need no masking. A set becomes a bool array, a dict an array of its values.
+
+Matching is exact, as in the feature modules; `vocab.flag(name, normalize=str.title)`
+gives the `.title()` variant used by `features_kayo`.
+"""
+
+
+VOCAB_FLAGS = {
+    'pokemon': {
+        'is_meta_threat': META_THREATS_GEN1,
+        'strength_rank': POKEMON_RANKING,
+    },
+    'move': {
+        'is_status_move': STATUS_MOVES,
+        'is_setup_move': SETUP_MOVES,
+        'is_key_attack': KEY_ATTACKS,
+    },
+    'status': {
+        'status_weight': STATUS_WEIGHTS,
+    },
+}
+
+
+def flag_array(names, lookup, normalize=None):
+    """
+    Array of `lookup` over `names`, plus the trailing entry read by id -1.
+
+    Args:
+        names: list of names indexed by id (None for a missing name)
+        lookup: set (-> bool array) or dict (-> array of values, 0 if absent)
+        normalize: optional function applied to each name before the lookup
+
+    Returns:
+        np.ndarray of length len(names) + 1
+    """
+    keys = [normalize(name) if normalize and name is not None else name for name in names]
+    if isinstance(lookup, dict):
+        values = [lookup.get(key, 0) for key in keys]
+        return np.array(values + [0], dtype=np.asarray(list(lookup.values()) or [0]).dtype)
+    return np.array([key in lookup for key in keys] + [False])
+
+
+class InternedVocab:
+    """
+    Names of one kind ('pokemon', 'move', 'type', 'status', ...) indexed by id.
+
+    The flags of `VOCAB_FLAGS[kind]` are attributes (`vocab.is_setup_move`),
+    built on first access.
+    """
+
+    def __init__(self, kind, names):
+        self.kind = kind
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self._flags = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getattr__(self, name):
+        lookup = VOCAB_FLAGS.get(self.__dict__.get('kind'), {}).get(name)
+        if lookup is None:
+            raise AttributeError(f"'{self.kind}' vocabulary has no flag '{name}'")
+        return self.flag(name)
+
+    def flag(self, name, normalize=None):
+        """Flag array `name` of `VOCAB_FLAGS[kind]`, optionally on normalized names."""
+        key = (name, normalize)
+        if key not in self._flags:
+            self._flags[key] = flag_array(self.names, VOCAB_FLAGS[self.kind][name], normalize)
+        return self._flags[key]
+
+    def encode(self, names):
+        """Ids of `names` (-1 for names that are not in the vocabulary)."""
+        ids = self.ids
+        return np.array([ids.get(name, MISSING) for name in names], dtype=np.int64)
+
+
+def intern_vocabularies(vocab):
+    """`InternedVocab` for every kind of a `BattleColumns.vocab` / `TurnTable.vocab` dict."""
+    return {kind: InternedVocab(kind, names) for kind, names in vocab.items()}
+
+
+def intern_battles(df):
+    """
+    Pokémon, move, type and status vocabularies of a battles DataFrame, in one pass.
+
+    Pokémon ids follow the order of first appearance in P1's team, P2's lead and
+    the timeline, battle by battle.
+
+    Returns:
+        dict kind -> InternedVocab
+    """
+    vocab = {kind: Vocab() for kind in ('pokemon', 'move', 'type', 'status')}
+    pokemon, move, types, status = (vocab[k].codes for k in ('pokemon', 'move', 'type', 'status'))
+
+    def add_pokemon(mon):
+        name = mon.get('name')
+        if name is not None:
+            pokemon.setdefault(name, len(pokemon))
+        for t in mon.get('types') or []:
+            types.setdefault(t, len(types))
+
+    for team, lead, timeline in zip(df['p1_team_details'], df['p2_lead_details'], df['battle_timeline']):
+        for mon in team or []:
+            add_pokemon(mon)
+        add_pokemon(lead or {})
+        for turn in timeline or []:
+            for side in ('p1', 'p2'):
+                state = turn.get(f'{side}_pokemon_state') or {}
+                if state.get('name') is not None:
+                    pokemon.setdefault(state['name'], len(pokemon))
+                if state.get('status') is not None:
+                    status.setdefault(state['status'], len(status))
+                details = turn.get(f'{side}_move_details') or {}
+                if details.get('name') is not None:
+                    move.setdefault(details['name'], len(move))
+                if details.get('type') is not None:
+                    types.setdefault(details['type'], len(types))
+    return {kind: InternedVocab(kind, v.to_list()) for kind, v in vocab.items()}
@@ -0,0 +1,168 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+"""
+Byte-offset sidecar index of a JSONL file of battles.
+
+One streaming pass records, for every line, where it starts and how long it
+is, plus a few small per-battle fields that filters can be evaluated on
+without parsing the battles:
+
+    offsets, lengths     int64  byte range of row i
+    battle_id            int64  -1 if missing or not an int
+    team_size            int64  number of P1 team slots
+    p1_min_level         int64  lowest / highest P1 team level
+    p1_max_level         int64  (-1 for a missing or non-numeric level)
+
+The index is saved next to the file (`train.jsonl.idx.npz`, or in
+`.battle_cache` when that directory is read-only, e.g. the Kaggle input)
+together with the file size and mtime, and rebuilt when they change. From
+then on any set of rows is read with one seek per row:
+
+    index = load_jsonl_index('Data/train.jsonl')
+    index.battles([4877])                         # one battle, without loading the file
+    mask = index.level_mask(100)                  # the level-100 filter of `main.load_data`
+    mask[4877] = False
+    train_df = index.frame(np.flatnonzero(mask))  # only the kept rows are read and parsed
+
+Row numbers are positions in the file (blank lines do not count), the same
+index `load_jsonl` gives.
+"""
+
+
+INDEX_SUFFIX = '.idx.npz'
+FALLBACK_INDEX_DIR = '.battle_cache'
+INDEX_FIELDS = ['offsets', 'lengths', 'battle_id', 'team_size', 'p1_min_level', 'p1_max_level']
+
+
+def _level(mon):
+    level = mon.get('level') if isinstance(mon, dict) else None
+    return int(level) if isinstance(level, (int, float)) and not isinstance(level, bool) else -1
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+class JsonlIndex:
+    """Offsets and filter fields of every row of a JSONL file (see module docstring)."""
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self._rows_by_id = None
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def __len__(self):
+        return len(self.fields['offsets'])
+
+    def row_of(self, battle_ids):
+        """Row of each battle_id (KeyError if one is not in the file)."""
+        if self._rows_by_id is None:
+            self._rows_by_id = pd.Index(self.fields['battle_id'])
+        rows = self._rows_by_id.get_indexer(np.atleast_1d(battle_ids))
+        if (rows < 0).any():
+            missing = np.atleast_1d(battle_ids)[rows < 0]
+            raise KeyError(f"battle_id not in {self.path}: {missing[:10].tolist()}")
+        return rows
+
+    def level_mask(self, level=100):
+        """Rows whose P1 team is entirely at `level` (an empty team passes, like `all([])`)."""
+        same = (self.fields['p1_min_level'] == level) & (self.fields['p1_max_level'] == level)
+        return same | (self.fields['team_size'] == 0)
+
+    def read(self, rows):
+        """Parsed battles (dicts) of `rows`, in the given order; the file is read in offset order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        battles = [None] * len(rows)
+        offsets, lengths = self.fields['offsets'], self.fields['lengths']
+        with open(self.path, 'rb') as f:
+            for k in np.argsort(offsets[rows], kind='stable'):
+                f.seek(offsets[rows[k]])
+                battles[k] = json.loads(f.read(lengths[rows[k]]))
+        return battles
+
+    def battles(self, battle_ids):
+        """Parsed battles with the given battle_ids."""
+        return self.read(self.row_of(battle_ids))
+
+    def frame(self, rows=None):
+        """DataFrame of `rows` (default: all), indexed by row number like `load_jsonl`."""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        return pd.DataFrame(self.read(rows), index=pd.Index(rows))
+
+    def iter_frames(self, rows=None, chunksize=1000):
+        """`frame` in chunks of at most `chunksize` rows, like `load_jsonl(..., chunksize=...)`."""
+        if chunksize is None or chunksize < 1:
+            raise ValueError("chunksize must be a positive integer.")
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), chunksize):
+            yield self.frame(rows[start:start + chunksize])
+
+
+def build_jsonl_index(path):
+    """Scans `path` once and returns its `JsonlIndex`."""
+    values = {name: [] for name in INDEX_FIELDS}
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            battle = json.loads(line)
+            battle_id = battle.get('battle_id')
+            team = battle.get('p1_team_details')
+            levels = [_level(mon) for mon in team] if isinstance(team, list) else []
+            values['offsets'].append(start)
+            values['lengths'].append(len(line))
+            values['battle_id'].append(battle_id if isinstance(battle_id, int) and not isinstance(battle_id, bool)
+                                       else -1)
+            values['team_size'].append(len(levels))
+            values['p1_min_level'].append(min(levels, default=-1))
+            values['p1_max_level'].append(max(levels, default=-1))
+    return JsonlIndex(path, {name: np.array(v, dtype=np.int64) for name, v in values.items()})
+
+
+def _index_paths(path):
+    """Sidecar next to the file, then the fallback location."""
+    return [path + INDEX_SUFFIX, os.path.join(FALLBACK_INDEX_DIR, os.path.basename(path) + INDEX_SUFFIX)]
+
+
+def load_jsonl_index(path, rebuild=False):
+    """
+    Returns the index of a JSONL file, building and saving it on first use.
+
+    Args:
+        path: path to the .jsonl file
+        rebuild: ignore a saved index
+
+    Returns:
+        JsonlIndex
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    stamp = _file_stamp(path)
+    candidates = _index_paths(path)
+    if not rebuild:
+        for index_path in candidates:
+            if os.path.exists(index_path):
+                with np.load(index_path) as saved:
+                    if np.array_equal(saved['stamp'], stamp):
+                        return JsonlIndex(path, {name: saved[name] for name in INDEX_FIELDS})
+
+    index = build_jsonl_index(path)
+    for index_path in candidates:
+        try:
+            os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+            with open(index_path, 'wb') as f:
+                np.savez(f, stamp=stamp, **index.fields)
+            break
+        except OSError:
+            continue
+    return index
@@ -1,8 +1,74 @@
 import os
+import json
+import numpy as np
 import pandas as pd
 
+from utils.jsonl_index import load_jsonl_index
 
-def load_jsonl(path):
+
+def _check_exists(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"File not found: {path}")
-    return pd.read_json(path, lines=True)
\ No newline at end of file
+
+
+def iter_battles(path):
+    """
+    Yields one battle (a plain dict) per line of a JSONL file.
+
+    Only the current line is held in memory, so this works on dumps that are
+    much bigger than the available RAM. Blank lines are skipped.
+    """
+    _check_exists(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_jsonl(path, chunksize=1000):
+    """
+    Yields DataFrames of at most `chunksize` battles each.
+
+    The index keeps counting across chunks, so row `i` of the file has index `i`
+    exactly like in `pd.read_json(path, lines=True)` (positional filters such as
+    the row removed in `main.load_data` keep working chunk by chunk).
+    """
+    if chunksize is None or chunksize < 1:
+        raise ValueError("chunksize must be a positive integer.")
+
+    buffer = []
+    start = 0
+    for battle in iter_battles(path):
+        buffer.append(battle)
+        if len(buffer) == chunksize:
+            yield pd.DataFrame(buffer, index=pd.RangeIndex(start, start + len(buffer)))
+            start += len(buffer)
+            buffer = []
+    if buffer:
+        yield pd.DataFrame(buffer, index=pd.RangeIndex(start, start + len(buffer)))
+
+
+def load_jsonl(path, chunksize=None, rows=None):
+    """
+    Loads a JSONL file of battles.
+
+    Args:
+        path: path to the .jsonl file
+        chunksize: if None the whole file is returned as one DataFrame,
+            otherwise a generator of DataFrames with at most `chunksize` rows
+        rows: optional row numbers or boolean mask of the rows to load; only
+            those lines are read, through the sidecar index (`utils.jsonl_index`)
+
+    Returns:
+        pd.DataFrame or generator of pd.DataFrame
+    """
+    _check_exists(path)
+    if rows is not None:
+        rows = np.asarray(rows)
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows
+        index = load_jsonl_index(path)
+        return index.frame(rows) if chunksize is None else index.iter_frames(rows, chunksize)
+    if chunksize is not None:
+        return iter_jsonl(path, chunksize)
+    return pd.read_json(path, lines=True)
@@ -0,0 +1,91 @@
+import os
+import inspect
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+from tqdm.auto import tqdm
+
+
+"""
+Process-pool execution of the feature builders.
+
+Every battle is independent, so a DataFrame (or a stream of chunks from
+`load_jsonl(..., chunksize=...)`) is cut into shards that are processed by a
+pool of worker processes. Results are put back in submission order, so the
+output has exactly the same index order as the serial run. A single progress
+bar in the main process counts the battles of every finished shard; builders
+with a `progress` argument get `progress=False` in the workers.
+"""
+
+
+def resolve_n_jobs(n_jobs):
+    """Same convention as sklearn/joblib: -1 = all cores, -2 = all but one, ..."""
+    cpus = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, cpus + 1 + n_jobs)
+    return n_jobs
+
+
+def _run_shard(feature_fn, shard, args, kwargs):
+    return feature_fn(shard, *args, **kwargs)
+
+
+def _iter_shards(data, shard_size, n_jobs):
+    if isinstance(data, pd.DataFrame):
+        if shard_size is None:
+            # a few shards per worker keeps the pool busy when battles have different lengths
+            shard_size = max(1, int(np.ceil(len(data) / (4 * n_jobs))))
+        for start in range(0, len(data), shard_size):
+            yield data.iloc[start:start + shard_size]
+    else:
+        for chunk in data:
+            if len(chunk):
+                yield chunk
+
+
+def run_parallel(feature_fn, data, *args, n_jobs=-1, shard_size=None, desc=None, **kwargs):
+    """
+    Runs `feature_fn` on shards of `data` in a process pool and concatenates the results.
+
+    Args:
+        feature_fn: module-level feature builder (must be picklable), e.g. `create_specialist_features`
+        data: battles DataFrame or an iterable of DataFrame chunks
+        n_jobs: number of worker processes (-1 = all cores)
+        shard_size: battles per task (default: ~4 tasks per worker; ignored for streams)
+        desc: label of the progress bar
+        *args, **kwargs: forwarded to `feature_fn` (plus `progress=False` if it takes one)
+
+    Returns:
+        pd.DataFrame with the same rows, in the same order, as `feature_fn(data)`
+    """
+    n_jobs = resolve_n_jobs(n_jobs)
+    total = len(data) if isinstance(data, pd.DataFrame) else None
+    desc = desc or f"{getattr(feature_fn, '__name__', 'features')} ({n_jobs} workers)"
+    if 'progress' in inspect.signature(feature_fn).parameters:
+        # workers would each draw their own bar on top of the main one
+        kwargs = {**kwargs, 'progress': False}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool, \
+            tqdm(total=total, desc=desc, unit='battle') as bar:
+        pending = {}
+        for i, shard in enumerate(_iter_shards(data, shard_size, n_jobs)):
+            pending[pool.submit(_run_shard, feature_fn, shard, args, kwargs)] = (i, len(shard))
+            # bounded number of shards in flight: a stream is never read ahead too far
+            if len(pending) >= 2 * n_jobs:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, size = pending.pop(future)
+                    results[index] = future.result()
+                    bar.update(size)
+        for future in list(pending):
+            index, size = pending.pop(future)
+            results[index] = future.result()
+            bar.update(size)
+
+    if not results:
+        return pd.DataFrame()
+    return pd.concat([results[i] for i in sorted(results)])
@@ -0,0 +1,118 @@
+import pandas as pd
+
+
+"""
+Lazy feature registry.
+
+A feature set is a `FeatureRegistry` of named nodes. Every node declares the
+raw DataFrame columns it reads (`inputs`) and the other nodes it is built from
+(`depends`); its function receives them positionally, in that order:
+
+    FEATURES = FeatureRegistry('specialist')
+
+    @FEATURES.register('lead_speed_diff', depends=('_leads',))
+    def lead_speed_diff(leads):
+        return leads['p1_base_spe'] - leads['p2_base_spe']
+
+`FEATURES.compute(df, ['lead_speed_diff', ...])` evaluates only the dependency
+closure of the requested columns, each node once. Names starting with '_' are
+intermediates (shared tables, replays, ...) and are never returned as columns.
+A node can also `provide` several columns at once by returning a mapping.
+"""
+
+
+class FeatureRegistry:
+
+    def __init__(self, name):
+        self.name = name
+        self.nodes = {}
+        self.providers = {}
+
+    def register(self, name, inputs=(), depends=(), provides=None):
+        """
+        Decorator registering `fn(*inputs, *depends)` as node `name`.
+
+        Args:
+            name: node name ('_' prefix = intermediate)
+            inputs: raw DataFrame columns passed to the function
+            depends: other nodes passed to the function (after the inputs)
+            provides: optional list of columns, if the function returns a mapping column -> values
+        """
+        def decorator(fn):
+            if name in self.nodes:
+                raise ValueError(f"Feature '{name}' is already registered in '{self.name}'.")
+            self.nodes[name] = (fn, tuple(inputs), tuple(depends))
+            for column in (provides or [name]):
+                self.providers[column] = name
+            return fn
+        return decorator
+
+    @property
+    def columns(self):
+        """Every public column, in registration order."""
+        return [column for column in self.providers if not column.startswith('_')]
+
+    def closure(self, columns, skip=()):
+        """Nodes needed for `columns`, in evaluation order (dependencies first), except `skip`."""
+        order = []
+        state = {node: 'done' for node in skip}
+
+        def visit(node, path):
+            if state.get(node) == 'done':
+                return
+            if state.get(node) == 'visiting':
+                raise ValueError(f"Cyclic feature dependency: {' -> '.join(path + [node])}")
+            if node not in self.nodes:
+                raise KeyError(f"Unknown feature '{node}' in '{self.name}'.")
+            state[node] = 'visiting'
+            for dep in self.nodes[node][2]:
+                visit(dep, path + [node])
+            state[node] = 'done'
+            order.append(node)
+
+        for column in columns:
+            if column not in self.providers:
+                raise KeyError(f"Unknown feature '{column}' in '{self.name}'.")
+            visit(self.providers[column], [])
+        return order
+
+    def inputs(self, columns):
+        """Raw DataFrame columns read by the closure of `columns`."""
+        needed = []
+        for node in self.closure(columns):
+            needed.extend(c for c in self.nodes[node][1] if c not in needed)
+        return needed
+
+    def compute(self, df, columns=None, index='battle_id', given=None):
+        """
+        Computes `columns` (default: all) for the battles in `df`.
+
+        Args:
+            df: battles DataFrame
+            columns: feature names (default: every public column)
+            index: column of `df` used as index of the result
+            given: optional dict node -> precomputed value (e.g. a cached '_turn_table');
+                those nodes and their own dependencies are not evaluated
+
+        Returns:
+            pd.DataFrame indexed by `index`, with the requested columns in the requested order
+        """
+        columns = self.columns if columns is None else list(columns)
+        values = dict(given or {})
+        plan = self.closure(columns, skip=values)
+        needed = {c for node in plan for c in self.nodes[node][1]}
+        missing = [c for c in sorted(needed) if c not in df.columns]
+        if missing:
+            raise KeyError(f"Missing input columns for '{self.name}' features: {missing}")
+
+        for node in plan:
+            fn, inputs, depends = self.nodes[node]
+            values[node] = fn(*(df[c] for c in inputs), *(values[d] for d in depends))
+
+        out = {}
+        for column in columns:
+            node = self.providers[column]
+            value = values[node] if node == column else values[node][column]
+            # positional values: a Series would otherwise be realigned on its own index
+            out[column] = value.to_numpy() if isinstance(value, pd.Series) else value
+        return pd.DataFrame(out, index=pd.Index(df[index].to_numpy(), name=index))
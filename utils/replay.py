@@ -0,0 +1,241 @@
+import pandas as pd
+from tqdm.auto import tqdm
+
+from utils.feature_sink import FeatureSink, ChunkedFeatureSink
+
+
+"""
+Single-pass replay of the battle timelines.
+
+The feature modules all need the same bookkeeping while walking a timeline:
+which Pokémon have been seen on each side and their last known hp_pct/status.
+`replay_features` walks every timeline exactly once, keeps that state in a
+`BattleState` (one `SideState` per player, with running team totals), and
+hands it to a list of `Extractor`s:
+
+    start(state)   once per battle, before the first turn (static features)
+    turn(state)    after every turn, once the seen-state has been updated
+    finish(state)  once per battle, returns the dict of features
+
+so computing several feature sets costs a single traversal:
+
+    specialist, advanced = replay_features(df, [SpecialistExtractor(), AdvancedExtractor()])
+
+The feature dicts are not kept: each one is written into the extractor's
+`FeatureSink` (typed columns preallocated for the whole DataFrame, see
+utils/feature_sink.py) as soon as the battle is done. An extractor can declare
+its columns up front with a `schema`; otherwise they are added as they appear.
+"""
+
+
+class SideState:
+    """
+    Seen Pokémon of one side, stored in parallel slot lists, plus running totals.
+
+    Every Pokémon gets a slot the first time it is seen (hp_pct 100, status None).
+    Each update adjusts the totals by the change of that single slot, so reading
+    them never walks the team:
+
+        total_hp       sum of the last known hp_pct of the seen Pokémon
+        status_count   seen Pokémon whose status is not None
+        fainted_count  seen Pokémon with hp_pct <= 0
+        boost_sum      sum of the boosts of the active Pokémon in the current turn
+
+    A state without a 'status' key keeps the previous status, or resets it to
+    None with `keep_missing_status=False`.
+    """
+
+    __slots__ = ('slots', 'hp', 'status', 'total_hp', 'status_count', 'fainted_count', 'boost_sum',
+                 'keep_missing_status')
+
+    def __init__(self, names=(), keep_missing_status=True):
+        self.keep_missing_status = keep_missing_status
+        self.slots = {}
+        self.hp = []
+        self.status = []
+        self.total_hp = 0
+        self.status_count = 0
+        self.fainted_count = 0
+        self.boost_sum = 0
+        for name in names:
+            self.slot(name)
+
+    def __len__(self):
+        return len(self.hp)
+
+    def slot(self, name):
+        """Slot of `name`, adding the Pokémon if it has not been seen yet."""
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.hp)
+            self.hp.append(100)
+            self.status.append(None)
+            self.total_hp += 100
+        return slot
+
+    def update(self, state):
+        """Applies one `*_pokemon_state` dict."""
+        boosts = state.get('boosts')
+        self.boost_sum = sum(boosts.values()) if boosts else 0
+        name = state.get('name')
+        if not name:
+            return
+        slot = self.slot(name)
+        hp = state.get('hp_pct')
+        if hp is not None:
+            old = self.hp[slot]
+            self.total_hp += hp - old
+            self.fainted_count += (hp <= 0) - (old <= 0)
+            self.hp[slot] = hp
+        if 'status' in state or not self.keep_missing_status:
+            status = state.get('status')
+            self.status_count += (status is not None) - (self.status[slot] is not None)
+            self.status[slot] = status
+
+    def as_dict(self):
+        """name -> {'hp_pct', 'status'}, the layout of the old `*_seen_status` dicts."""
+        return {name: {'hp_pct': self.hp[slot], 'status': self.status[slot]}
+                for name, slot in self.slots.items()}
+
+
+class BattleState:
+    """
+    State of one battle during the replay.
+
+    Attributes:
+        battle: the raw battle (dict with the DataFrame columns)
+        p1_team, p2_lead, timeline: shortcuts into `battle`
+        num_turns: number of the last turn (0 for an empty timeline)
+        p1, p2: `SideState` of every Pokémon seen so far
+            (P1's whole team and P2's lead are known from the start)
+        p1_reset, p2_reset: the same with `keep_missing_status=False`, only
+            tracked when `reset_missing_status` (None otherwise); see `sides`
+        index, turn: position and dict of the current turn
+        p1_state, p2_state: `*_pokemon_state` of the current turn ({} if missing)
+    """
+
+    __slots__ = ('battle', 'p1_team', 'p2_lead', 'timeline', 'num_turns',
+                 'p1', 'p2', 'p1_reset', 'p2_reset', 'index', 'turn', 'p1_state', 'p2_state')
+
+    def __init__(self, battle, reset_missing_status=False):
+        self.battle = battle
+        self.p1_team = battle['p1_team_details']
+        self.p2_lead = battle['p2_lead_details']
+        self.timeline = battle['battle_timeline'] or []
+        self.num_turns = self.timeline[-1].get('turn', 0) if self.timeline else 0
+        self.p1 = SideState(p['name'] for p in self.p1_team)
+        self.p2 = SideState([self.p2_lead['name']])
+        self.p1_reset = self.p2_reset = None
+        if reset_missing_status:
+            self.p1_reset = SideState((p['name'] for p in self.p1_team), keep_missing_status=False)
+            self.p2_reset = SideState([self.p2_lead['name']], keep_missing_status=False)
+        self.index = -1
+        self.turn = None
+        self.p1_state = {}
+        self.p2_state = {}
+
+    @property
+    def p1_seen(self):
+        return self.p1.as_dict()
+
+    @property
+    def p2_seen(self):
+        return self.p2.as_dict()
+
+    def sides(self, extractor):
+        """(p1, p2) side states following `extractor.keep_missing_status`."""
+        if extractor.keep_missing_status:
+            return self.p1, self.p2
+        return self.p1_reset, self.p2_reset
+
+    def advance(self, index, turn):
+        """Moves to `turn` and applies its hp_pct/status/boosts to both sides."""
+        self.index = index
+        self.turn = turn
+        self.p1_state = turn.get('p1_pokemon_state') or {}
+        self.p2_state = turn.get('p2_pokemon_state') or {}
+        self.p1.update(self.p1_state)
+        self.p2.update(self.p2_state)
+        if self.p1_reset is not None:
+            self.p1_reset.update(self.p1_state)
+            self.p2_reset.update(self.p2_state)
+
+
+class Extractor:
+    """
+    Base class of the pluggable feature extractors.
+
+    Subclasses keep their per-battle accumulators on `self`, reset them in
+    `start` and return the feature dict (without 'battle_id') from `finish`.
+    """
+
+    name = 'features'
+    desc = 'Replaying battles'
+    schema = None  # optional FeatureSchema / dict name -> dtype of the features
+    keep_missing_status = True  # False: a state without 'status' resets it to None (read via `state.sides(self)`)
+
+    def start(self, state):
+        pass
+
+    def turn(self, state):
+        pass
+
+    def finish(self, state):
+        return {}
+
+
+def replay_battle(battle, extractors):
+    """Replays one battle and returns the feature dict of every extractor."""
+    state = BattleState(battle, reset_missing_status=not all(e.keep_missing_status for e in extractors))
+    for extractor in extractors:
+        extractor.start(state)
+    for index, turn in enumerate(state.timeline):
+        state.advance(index, turn)
+        for extractor in extractors:
+            extractor.turn(state)
+    return [extractor.finish(state) for extractor in extractors]
+
+
+def _replay_rows(df, extractors, desc, progress=True):
+    """Yields (row, battle_id, feature dicts) for every battle of `df`."""
+    for i, battle in enumerate(tqdm(df.to_dict('records'), total=df.shape[0], desc=desc, disable=not progress)):
+        yield i, battle['battle_id'], replay_battle(battle, extractors)
+
+
+def _replay_frame(df, extractors, desc, progress=True):
+    sinks = [FeatureSink(len(df), extractor.schema) for extractor in extractors]
+    battle_ids = []
+    for i, battle_id, features in _replay_rows(df, extractors, desc, progress):
+        battle_ids.append(battle_id)
+        for sink, row in zip(sinks, features):
+            sink.write(i, row)
+    index = pd.Index(battle_ids, name='battle_id')
+    return [sink.to_frame(index) for sink in sinks]
+
+
+def replay_features(df, extractors, desc=None, progress=True):
+    """
+    Computes several feature sets with one pass over the timelines.
+
+    Args:
+        df: battles DataFrame, or an iterable of DataFrame chunks
+        extractors: list of `Extractor` instances
+        desc: label of the progress bar (default: the first extractor's)
+        progress: show the per-battle progress bar
+
+    Returns:
+        list of DataFrames indexed by battle_id, one per extractor, in the same order
+    """
+    extractors = list(extractors)
+    desc = desc or extractors[0].desc
+    if isinstance(df, pd.DataFrame):
+        return _replay_frame(df, extractors, desc, progress)
+    # streaming: rows are appended to chunked buffers, concatenated once at the end
+    sinks = [ChunkedFeatureSink(extractor.schema) for extractor in extractors]
+    for chunk in df:
+        for _, battle_id, features in _replay_rows(chunk, extractors, desc, progress):
+            for sink, row in zip(sinks, features):
+                sink.append(row, battle_id)
+    if not len(sinks[0]):
+        return [pd.DataFrame() for _ in extractors]
+    return [sink.to_frame('battle_id') for sink in sinks]
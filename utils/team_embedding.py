@@ -0,0 +1,129 @@
+import numpy as np
+
+from utils.extra import pokemon_embeddings
+from utils.battle_cache import MISSING
+
+
+"""
+Batched team-embedding aggregation.
+
+Teams are materialized once as an (n_battles, team_size) matrix of Pokémon ids
+(padded with -1), the embeddings are gathered into an (n_battles, team_size,
+dim) tensor and every statistic is one masked reduction over axis 1:
+
+    ids = team_id_matrix(team_codes, team_offsets)
+    block = team_embedding_block(ids, embedding_table(names))   # mean | max | min [| std]
+
+The statistics are written into slices of a single preallocated block
+(float32 by default, pass `out=` to fill part of a larger feature matrix).
+Empty teams get zeros, as `aggregate_team_embedding` in features_olya.
+"""
+
+
+TEAM_SIZE = 6
+EMBEDDING_DIM = 6  # hp, atk, def, spa, spd, spe
+TEAM_STATS = ('mean', 'max', 'min')
+
+
+def embedding_table(names, dim=EMBEDDING_DIM):
+    """(len(names) + 1, dim) embeddings indexed by id; the last row (zeros) is read by id -1 and unknown names."""
+    table = np.zeros((len(names) + 1, dim))
+    for i, name in enumerate(names):
+        if name in pokemon_embeddings:
+            table[i] = pokemon_embeddings[name]
+    return table
+
+
+def team_id_matrix(codes, offsets, width=None):
+    """
+    Ragged team ids (flat `codes` + `offsets`) as a padded matrix.
+
+    Args:
+        codes: Pokémon id of every team slot, battle after battle
+        offsets: `offsets[i]:offsets[i + 1]` are the slots of battle i
+        width: number of columns (default: the largest team, at least `TEAM_SIZE`)
+
+    Returns:
+        np.ndarray (n_battles, width) of ids, -1 after the end of each team
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    if width is None:
+        width = max(TEAM_SIZE, int(lengths.max()) if len(lengths) else 0)
+    ids = np.full((len(lengths), width), MISSING, dtype=np.int64)
+    position = np.arange(len(codes)) - np.repeat(offsets[:-1], lengths)
+    keep = position < width
+    ids[np.repeat(np.arange(len(lengths)), lengths)[keep], position[keep]] = codes[keep]
+    return ids
+
+
+def team_embedding_columns(prefix, dim=EMBEDDING_DIM, std=False):
+    """Column names of a block: `{prefix}_team_emb_0..` in the order mean, max, min (, std)."""
+    n_stats = len(TEAM_STATS) + bool(std)
+    return [f'{prefix}_team_emb_{i}' for i in range(n_stats * dim)]
+
+
+def team_embedding_block(ids, table, std=False, out=None, dtype=np.float32):
+    """
+    Mean, max, min (and optionally std) of the member embeddings of every team.
+
+    Args:
+        ids: (n, team_size) id matrix from `team_id_matrix` (-1 = empty slot)
+        table: embeddings from `embedding_table`
+        std: also compute the (population) standard deviation
+        out: optional preallocated (n, n_stats * dim) array to write into
+        dtype: dtype of the block when `out` is not given
+
+    Returns:
+        the (n, n_stats * dim) block, [mean | max | min (| std)]
+    """
+    n, dim = len(ids), table.shape[1]
+    n_stats = len(TEAM_STATS) + bool(std)
+    if out is None:
+        out = np.empty((n, n_stats * dim), dtype=dtype)
+    members = ids >= 0
+    counts = members.sum(axis=1)
+    vectors = table[ids]  # empty slots read the zero row
+    mask = members[:, :, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = vectors.sum(axis=1) / counts[:, None]
+    empty = counts == 0
+    blocks = [
+        mean,
+        np.where(mask, vectors, -np.inf).max(axis=1),
+        np.where(mask, vectors, np.inf).min(axis=1),
+    ]
+    if std:
+        deviation = np.where(mask, vectors - mean[:, None, :], 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            blocks.append(np.sqrt((deviation ** 2).sum(axis=1) / counts[:, None]))
+    for k, values in enumerate(blocks):
+        values[empty] = 0.0
+        out[:, k * dim:(k + 1) * dim] = values
+    return out
+
+
+def seen_embedding_mean(battle_index, ids, n_battles, table):
+    """
+    Mean embedding of the distinct Pokémon of every battle (e.g. the ones seen in the
+    timeline: `battle_index` and `ids` of the turn rows). Zeros if none.
+    """
+    battle_index = np.asarray(battle_index, dtype=np.int64)
+    ids = np.asarray(ids, dtype=np.int64)
+    known = ids >= 0
+    keys = np.unique(battle_index[known] * (len(table) + 1) + ids[known])
+    battles, members = keys // (len(table) + 1), keys % (len(table) + 1)
+    counts = np.bincount(battles, minlength=n_battles)
+    sums = np.stack([np.bincount(battles, weights=table[members, d], minlength=n_battles)
+                     for d in range(table.shape[1])], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts[:, None] > 0, sums / counts[:, None], 0.0)
+
+
+def cosine_similarity_rows(a, b):
+    """Row-wise cosine similarity, 0 where either row is all zeros."""
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    dots = (a * b).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(norms > 0, dots / norms, 0.0)
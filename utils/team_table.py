@@ -0,0 +1,220 @@
+import numpy as np
+
+from utils.extra import pokemon_base_stats_nested
+from utils.battle_cache import Vocab, MISSING, STATS, _int_or_missing
+from utils.type_chart import type_id, NO_TYPE
+
+
+"""
+Typed table of the team details.
+
+`p1_team_details` becomes one row per (battle, slot) and `p2_lead_details`
+one row per battle, with the same column names as the columnar cache
+(`utils.battle_cache`), so both sources give the same `TeamTable`:
+
+    team_name, lead_name         int64  Pokémon id (`vocab['pokemon']`), -1 if missing
+    team_level, lead_level       int64  -1 if missing
+    team_type1/2, lead_type1/2   int64  type id (`vocab['type']`), -1 if missing
+    team_base_*, lead_base_*     int64  base stats as given (flat or {'value': ...}), -1 if missing
+    team_offsets                        `team_offsets[i]:team_offsets[i + 1]` are the slots of battle i
+
+The dicts are read once (`build_team_table`) or not at all
+(`team_table_from_columns`). Missing base stats are then filled for every
+row at once by a join on the Pokémon id against `pokemon_base_stats_nested`,
+with the rules of `fill_missing_stats` (features_olya): a Pokémon with a
+missing stat takes the table values for the missing ones, or 80 everywhere if
+its name is not in the table; a row without a name keeps -1.
+
+    teams = build_team_table(df['p1_team_details'], df['p2_lead_details'])
+    teams.lead_stats('p1') - teams.lead_stats('p2')     # (n, 6) lead stat diffs
+    teams.team_mean(teams.stats['team'][:, 5])          # average team speed
+"""
+
+
+STAT_INDEX = {stat: i for i, stat in enumerate(STATS)}
+UNKNOWN_STAT = 80
+
+
+def base_stats_table(names):
+    """(len(names) + 1, 6) base stats by Pokémon id from `pokemon_base_stats_nested` (-1 if unknown)."""
+    table = np.full((len(names) + 1, len(STATS)), MISSING, dtype=np.int64)
+    for i, name in enumerate(names):
+        info = pokemon_base_stats_nested.get((name or '').lower())
+        if info:
+            table[i] = [info[stat]['value'] for stat in STATS]
+    return table
+
+
+def fill_base_stats(stats, codes, names):
+    """
+    Vectorized `fill_missing_stats`.
+
+    Args:
+        stats: (n, 6) base stats, -1 where missing
+        codes: (n,) Pokémon ids (-1 = no name)
+        names: Pokémon names indexed by id
+
+    Returns:
+        (n, 6) filled stats (rows without a name keep their -1)
+    """
+    stats = np.asarray(stats, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+    named = np.array([bool(name) for name in names] + [False])[codes]
+    known = base_stats_table(names)[codes]
+    missing = stats == MISSING
+    to_fill = missing.any(axis=1) & named
+    filled = np.where(missing & to_fill[:, None], known, stats)
+    filled[to_fill & (known[:, 0] == MISSING)] = UNKNOWN_STAT
+    return filled
+
+
+def _value(field):
+    """Number of a stat/level field, flat (`100`) or nested (`{'value': 100}`)."""
+    return _int_or_missing(field.get('value') if isinstance(field, dict) else field)
+
+
+def _fast_value(field):
+    """`_value`, with plain ints (the usual case) returned as they are."""
+    return field if type(field) is int else _value(field)
+
+
+def _take(values, rows, fill=MISSING):
+    """`values[rows]`, with `fill` where the row is -1."""
+    values = np.asarray(values)
+    padded = np.concatenate([values, np.full((1,) + values.shape[1:], fill, dtype=values.dtype)])
+    return padded[rows]
+
+
+class TeamTable:
+    """
+    P1 team slots and P2 leads as typed columns, plus the filled base stats
+    (`stats['team']`: one row per slot, `stats['lead']`: one row per battle).
+    """
+
+    def __init__(self, columns, vocab):
+        self.columns = columns
+        self.vocab = vocab
+        self.team_offsets = np.asarray(columns['team_offsets'], dtype=np.int64)
+        self.stats = {
+            prefix: fill_base_stats(np.stack([columns[f'{prefix}_{stat}'] for stat in STATS], axis=1),
+                                    columns[f'{prefix}_name'], vocab['pokemon'])
+            for prefix in ('team', 'lead')
+        }
+        self._team_battle = None
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.team_offsets) - 1
+
+    @property
+    def team_sizes(self):
+        return np.diff(self.team_offsets)
+
+    @property
+    def team_battle(self):
+        """Battle of every team slot."""
+        if self._team_battle is None:
+            self._team_battle = np.repeat(np.arange(len(self)), self.team_sizes)
+        return self._team_battle
+
+    def p1_lead_rows(self):
+        """Team row of P1's lead in every battle (-1 for an empty team)."""
+        return np.where(self.team_sizes > 0, self.team_offsets[:-1], MISSING)
+
+    def lead_stats(self, side, missing=0):
+        """(n, 6) filled base stats of P1's lead (first team slot) or P2's lead, `missing` where unknown."""
+        stats = _take(self.stats['team'], self.p1_lead_rows()) if side == 'p1' else self.stats['lead']
+        return np.where(stats == MISSING, missing, stats)
+
+    def lead_names(self, side):
+        """Name of each lead (None where missing)."""
+        names = np.array(list(self.vocab['pokemon']) + [None], dtype=object)
+        codes = _take(self['team_name'], self.p1_lead_rows()) if side == 'p1' else self['lead_name']
+        return names[codes]
+
+    def types(self, prefix, rows=None, normalize=False):
+        """(n, 2) type-chart ids (`utils.type_chart`) of the given rows of 'team' or 'lead'."""
+        chart_ids = np.array([type_id(name, normalize) for name in self.vocab['type']] + [NO_TYPE], dtype=np.int64)
+        codes = np.stack([self[f'{prefix}_type{i}'] for i in (1, 2)], axis=1)
+        return chart_ids[codes if rows is None else _take(codes, rows)]
+
+    def lead_types(self, side, normalize=False):
+        """(n, 2) type-chart ids of P1's lead or P2's lead."""
+        if side == 'p1':
+            return self.types('team', self.p1_lead_rows(), normalize)
+        return self.types('lead', normalize=normalize)
+
+    def team_stat(self, stat, default=None):
+        """Base stat of every team slot: filled, or as given with `default` where missing."""
+        if default is None:
+            return self.stats['team'][:, STAT_INDEX[stat]]
+        values = np.asarray(self[f'team_{stat}'], dtype=np.int64)
+        return np.where(values == MISSING, default, values)
+
+    def team_sum(self, values):
+        return np.bincount(self.team_battle, weights=np.asarray(values, dtype=float), minlength=len(self))
+
+    def team_mean(self, values):
+        """Mean of a per-slot array over each team (NaN for an empty team)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.team_sum(values) / self.team_sizes
+
+
+def build_team_table(p1_team_details, p2_lead_details, vocab=None):
+    """
+    Flattens the team details in one pass over the dicts.
+
+    Args:
+        p1_team_details: iterable of teams (lists of Pokémon dicts)
+        p2_lead_details: iterable of lead dicts, one per battle (None: teams only)
+        vocab: optional dict kind -> `Vocab` ('pokemon', 'type') to extend, e.g.
+            to share the Pokémon ids with a turn table
+
+    Returns:
+        TeamTable
+    """
+    vocab = dict(vocab or {})
+    for kind in ('pokemon', 'type'):
+        vocab.setdefault(kind, Vocab())
+    pokemon, types_vocab = vocab['pokemon'], vocab['type']
+    cols = {f'{prefix}_{key}': [] for prefix in ('team', 'lead')
+            for key in ['name', 'level', 'type1', 'type2'] + STATS}
+
+    def adder(prefix):
+        # bound appends resolved once: this runs for every Pokémon of every battle
+        name, level, type1, type2 = (cols[f'{prefix}_{key}'].append for key in ('name', 'level', 'type1', 'type2'))
+        stats = [(stat, cols[f'{prefix}_{stat}'].append) for stat in STATS]
+
+        def add(mon):
+            types = list(mon.get('types') or [])
+            name(pokemon.code(mon.get('name')))
+            level(_fast_value(mon.get('level')))
+            type1(types_vocab.code(types[0] if len(types) > 0 else None))
+            type2(types_vocab.code(types[1] if len(types) > 1 else None))
+            for stat, append in stats:
+                append(_fast_value(mon.get(stat)))
+        return add
+
+    add_team, add_lead = adder('team'), adder('lead')
+    offsets = [0]
+    for team in p1_team_details:
+        team = team if isinstance(team, list) else []
+        for mon in team:
+            add_team(mon)
+        offsets.append(offsets[-1] + len(team))
+    for mon in p2_lead_details if p2_lead_details is not None else []:
+        add_lead(mon or {})
+
+    columns = {name: np.array(values, dtype=np.int64) for name, values in cols.items()}
+    columns['team_offsets'] = np.array(offsets, dtype=np.int64)
+    return TeamTable(columns, {'pokemon': pokemon.to_list(), 'type': types_vocab.to_list()})
+
+
+def team_table_from_columns(cols):
+    """`TeamTable` over the team/lead columns of a `BattleColumns` cache entry (no dicts)."""
+    names = ['team_offsets'] + [f'{prefix}_{key}' for prefix in ('team', 'lead')
+                                for key in ['name', 'level', 'type1', 'type2'] + STATS]
+    columns = {name: np.asarray(cols[name], dtype=np.int64) for name in names}
+    return TeamTable(columns, {'pokemon': cols.vocab['pokemon'], 'type': cols.vocab['type']})
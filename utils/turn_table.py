@@ -0,0 +1,265 @@
+import os
+import json
+import numpy as np
+
+from utils.battle_cache import Vocab, MISSING, MISSING_STATUS_KEY, MISSING_BOOST, BOOST_KEYS
+
+
+"""
+Flattened "turn table" of the battle timelines.
+
+Every turn of every battle becomes one row with typed columns, and
+`offsets[i]:offsets[i + 1]` are the rows of battle i. Timeline features can
+then be written as segment reductions over whole columns (`segment_sum`,
+`segment_mean`, ...) instead of walking the nested turn dicts in Python.
+
+Columns (for side in p1/p2):
+    turn                 int16   turn number (-1 if missing)
+    {side}_name          int16   Pokémon id (`vocab['pokemon']`), -1 if no state
+    {side}_hp_pct        float64 NaN if missing
+    {side}_status        int8    `STATUS_CODES`, -1 for None, -2 if the key is missing
+    {side}_has_boosts    int8    1 if the state has a 'boosts' dict
+    {side}_boost_sum     int16   sum of the boosts (0 if none)
+    {side}_action        int8    `ACTION_CODES`, -1 if missing
+    {side}_has_move      int8    1 if `{side}_move_details` is set
+    {side}_move_id       int16   move id (`vocab['move']`), -1 if no move
+    {side}_move_type     int16   move type id (`vocab['move_type']`), -1 if missing
+    {side}_base_power    int16   0 if missing
+
+With a `path` the table is written as one `.npy` per column and reopened
+with `mmap_mode='r'`, so several worker processes can share it without copies.
+"""
+
+
+STATUS_CODES = {'nostatus': 0, 'par': 1, 'slp': 2, 'frz': 3, 'tox': 4, 'psn': 5, 'brn': 6, 'fnt': 7}
+STATUS_OTHER = len(STATUS_CODES)
+STATUS_NAMES = list(STATUS_CODES) + ['other']
+
+ACTION_CODES = {'attack': 0, 'switch': 1}
+ACTION_OTHER = len(ACTION_CODES)
+
+SIDES = ('p1', 'p2')
+TURN_TABLE_VERSION = 1
+
+_DTYPES = {'turn': 'int16'}
+for _side in SIDES:
+    _DTYPES.update({
+        f'{_side}_name': 'int16', f'{_side}_hp_pct': 'float64', f'{_side}_status': 'int8',
+        f'{_side}_has_boosts': 'int8', f'{_side}_boost_sum': 'int16', f'{_side}_action': 'int8',
+        f'{_side}_has_move': 'int8', f'{_side}_move_id': 'int16', f'{_side}_move_type': 'int16',
+        f'{_side}_base_power': 'int16',
+    })
+TURN_COLUMNS = list(_DTYPES)
+
+
+class TurnTable:
+    """
+    Columns of the flattened timelines plus the per-battle `offsets`.
+
+    `table['p1_hp_pct']` returns a column, `table.battle_index` maps every row
+    to its battle and the `segment_*` helpers reduce a per-turn array to one
+    value per battle.
+    """
+
+    def __init__(self, columns, offsets, vocab, path=None):
+        self.columns = columns
+        self.offsets = np.asarray(offsets)
+        self.vocab = vocab
+        self.path = path
+        self._battle_index = None
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_turns(self):
+        return int(self.offsets[-1])
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def battle_index(self):
+        if self._battle_index is None:
+            self._battle_index = np.repeat(np.arange(len(self)), self.lengths)
+        return self._battle_index
+
+    def battle(self, i):
+        """All columns of battle i, as a dict of (views on the) arrays."""
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return {name: col[lo:hi] for name, col in self.columns.items()}
+
+    # --- Segment reductions (one value per battle) ---
+
+    def segment_sum(self, values):
+        return np.bincount(self.battle_index, weights=np.asarray(values, dtype=float), minlength=len(self))
+
+    def segment_count(self, mask):
+        return np.bincount(self.battle_index, weights=np.asarray(mask, dtype=float), minlength=len(self))
+
+    def segment_mean(self, values, empty=np.nan):
+        lengths = self.lengths
+        out = np.full(len(self), empty, dtype=float)
+        nonzero = lengths > 0
+        out[nonzero] = self.segment_sum(values)[nonzero] / lengths[nonzero]
+        return out
+
+    def segment_max(self, values, empty=np.nan):
+        return self._segment_ufunc(np.maximum, values, empty)
+
+    def segment_min(self, values, empty=np.nan):
+        return self._segment_ufunc(np.minimum, values, empty)
+
+    def _segment_ufunc(self, ufunc, values, empty):
+        values = np.asarray(values, dtype=float)
+        out = np.full(len(self), empty, dtype=float)
+        nonzero = self.lengths > 0
+        if values.size:
+            # reduceat needs strictly valid start indices: only use non-empty segments
+            out[nonzero] = ufunc.reduceat(values, self.offsets[:-1][nonzero])
+        return out
+
+    def first_index(self):
+        """Row of the first turn of each battle (-1 for empty timelines)."""
+        return np.where(self.lengths > 0, self.offsets[:-1], -1)
+
+    def last_index(self):
+        """Row of the last turn of each battle (-1 for empty timelines)."""
+        return np.where(self.lengths > 0, self.offsets[1:] - 1, -1)
+
+
+def build_turn_table(timelines, path=None, vocab=None):
+    """
+    Builds the turn table in a single pass over the timelines.
+
+    Args:
+        timelines: iterable of `battle_timeline` lists (e.g. `df['battle_timeline']`)
+        path: optional folder; if given the columns are saved there and memory-mapped
+        vocab: optional dict of `Vocab` for 'pokemon', 'move', 'move_type' to share ids across tables
+
+    Returns:
+        TurnTable
+    """
+    vocab = vocab or {}
+    vocab = {kind: vocab.get(kind) or Vocab() for kind in ('pokemon', 'move', 'move_type')}
+    pokemon_codes = vocab['pokemon'].codes
+    move_codes = vocab['move'].codes
+    type_codes = vocab['move_type'].codes
+    nan = float('nan')
+
+    def side_row(state, move, action):
+        # name, hp_pct, status, has_boosts, boost_sum, action, has_move, move_id, move_type, base_power
+        state = state or {}
+        name = state.get('name')
+        hp = state.get('hp_pct')
+        boosts = state.get('boosts')
+        if 'status' not in state:
+            status = MISSING_STATUS_KEY
+        elif state['status'] is None:
+            status = MISSING
+        else:
+            status = STATUS_CODES.get(state['status'], STATUS_OTHER)
+        row = (
+            pokemon_codes.setdefault(name, len(pokemon_codes)) if name else MISSING,
+            nan if hp is None else hp,
+            status,
+            1 if 'boosts' in state else 0,
+            sum(boosts.values()) if boosts else 0,
+            MISSING if action is None else ACTION_CODES.get(action, ACTION_OTHER),
+        )
+        if move:
+            move_name, move_type = move.get('name'), move.get('type')
+            return row + (
+                1,
+                MISSING if move_name is None else move_codes.setdefault(move_name, len(move_codes)),
+                MISSING if move_type is None else type_codes.setdefault(move_type, len(type_codes)),
+                move.get('base_power') or 0,
+            )
+        return row + (0, MISSING, MISSING, 0)
+
+    rows = []
+    offsets = [0]
+    for timeline in timelines:
+        timeline = timeline or []
+        for turn in timeline:
+            number = turn.get('turn')
+            rows.append(
+                (number if isinstance(number, int) else MISSING,)
+                + side_row(turn.get('p1_pokemon_state'), turn.get('p1_move_details'), turn.get('p1_action'))
+                + side_row(turn.get('p2_pokemon_state'), turn.get('p2_move_details'), turn.get('p2_action'))
+            )
+        offsets.append(offsets[-1] + len(timeline))
+
+    # column order of `rows` is the order of TURN_COLUMNS
+    matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(TURN_COLUMNS))
+    columns = {name: matrix[:, j].astype(_DTYPES[name]) for j, name in enumerate(TURN_COLUMNS)}
+    offsets = np.array(offsets, dtype='int64')
+    table = TurnTable(columns, offsets,
+                      {kind: v.to_list() for kind, v in vocab.items()})
+    if path is not None:
+        return save_turn_table(table, path)
+    return table
+
+
+def turn_table_from_columns(cols, path=None):
+    """
+    Builds the turn table from a `BattleColumns` cache entry without touching
+    any dict: every column is derived with array operations.
+    """
+    status_lut = np.array([STATUS_CODES.get(s, STATUS_OTHER) for s in cols.vocab['status']] + [0], dtype='int8')
+    action_lut = np.array([ACTION_CODES.get(a, ACTION_OTHER) for a in cols.vocab['action']] + [0], dtype='int8')
+
+    columns = {'turn': np.asarray(cols['turn'], dtype='int16')}
+    for side in SIDES:
+        status = np.asarray(cols[f'{side}_status'])
+        action = np.asarray(cols[f'{side}_action'])
+        move = np.asarray(cols[f'{side}_move_name'])
+        boosts = np.stack([np.asarray(cols[f'{side}_boost_{key}'], dtype='int16') for key in BOOST_KEYS])
+        base_power = np.asarray(cols[f'{side}_move_base_power'], dtype='int16')
+        columns.update({
+            f'{side}_name': np.asarray(cols[f'{side}_name'], dtype='int16'),
+            f'{side}_hp_pct': np.asarray(cols[f'{side}_hp_pct'], dtype='float64'),
+            f'{side}_status': np.where(status >= 0, status_lut[np.maximum(status, 0)], status).astype('int8'),
+            f'{side}_has_boosts': np.asarray(cols[f'{side}_has_boosts'], dtype='int8'),
+            f'{side}_boost_sum': np.where(boosts == MISSING_BOOST, 0, boosts).sum(axis=0).astype('int16'),
+            f'{side}_action': np.where(action >= 0, action_lut[np.maximum(action, 0)], MISSING).astype('int8'),
+            f'{side}_has_move': (move != MISSING).astype('int8'),
+            f'{side}_move_id': move.astype('int16'),
+            f'{side}_move_type': np.where(move != MISSING, cols[f'{side}_move_type'], MISSING).astype('int16'),
+            f'{side}_base_power': np.where((move != MISSING) & (base_power > 0), base_power, 0).astype('int16'),
+        })
+    vocab = {'pokemon': cols.vocab['pokemon'], 'move': cols.vocab['move'], 'move_type': cols.vocab['type']}
+    table = TurnTable(columns, np.asarray(cols['turn_offsets'], dtype='int64'), vocab)
+    if path is not None:
+        return save_turn_table(table, path)
+    return table
+
+
+def save_turn_table(table, path):
+    """Writes every column as `.npy` into `path` and returns the memory-mapped table."""
+    os.makedirs(path, exist_ok=True)
+    for name, col in table.columns.items():
+        out = np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+',
+                                        dtype=col.dtype, shape=col.shape)
+        out[:] = col
+        out.flush()
+        del out
+    np.save(os.path.join(path, 'offsets.npy'), table.offsets)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': TURN_TABLE_VERSION, 'vocab': table.vocab}, f)
+    return open_turn_table(path)
+
+
+def open_turn_table(path, mmap_mode='r'):
+    """Opens a saved turn table; the columns are memory-mapped (read-only by default)."""
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != TURN_TABLE_VERSION:
+        raise ValueError(f"Turn table at {path} has version {meta.get('version')}, expected {TURN_TABLE_VERSION}.")
+    columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in TURN_COLUMNS}
+    offsets = np.load(os.path.join(path, 'offsets.npy'))
+    return TurnTable(columns, offsets, meta['vocab'], path=path)
@@ -0,0 +1,113 @@
+import numpy as np
+
+from utils.extra import TYPE_CHART_GEN1
+
+
+"""
+Dense form of `TYPE_CHART_GEN1` and batched matchup kernels.
+
+Every type name gets an integer id and the chart becomes a square matrix,
+`EFFECTIVENESS[attack_type, defending_type]`. Id 0 stands for "no type"
+(padding and 'NOTYPE'), id 1 for names missing from the chart. Their rows and
+columns are all 1.0, which is exactly what `get_type_effectiveness` returns
+for them, so padded type lists need no masking in products; unknown names
+still count as a STAB type in `best_stab_advantage`, 'NOTYPE' does not.
+
+Type lists are encoded once into an (n, width) int array (`encode_types`),
+with the strings looked up once per distinct list, and the kernels work on
+whole columns of battles:
+
+    p1 = encode_types(p1_lead_types); p2 = encode_types(p2_lead_types)
+    lead_type_product(p1, p2)      # prod over P1 types of get_type_effectiveness(t, p2_types)
+    best_stab_advantage(p1, p2)    # get_best_stab_advantage(p1_types, p2_types)
+
+Lookups are case-sensitive like `get_type_effectiveness` (the chart is upper
+case, the battle logs are not); `encode_types(..., normalize=True)` upper-cases
+names first, like `get_best_stab_advantage`.
+"""
+
+
+NO_TYPE = 0
+UNKNOWN_TYPE = 1
+TYPE_NAMES = [None, None] + sorted(set(TYPE_CHART_GEN1).union(*TYPE_CHART_GEN1.values()))
+TYPE_IDS = {name: i for i, name in enumerate(TYPE_NAMES) if name is not None}
+
+
+def _build_matrix():
+    matrix = np.ones((len(TYPE_NAMES), len(TYPE_NAMES)))
+    for attack, row in TYPE_CHART_GEN1.items():
+        for defend, multiplier in row.items():
+            matrix[TYPE_IDS[attack], TYPE_IDS[defend]] = multiplier
+    return matrix
+
+
+EFFECTIVENESS = _build_matrix()
+
+
+def type_id(name, normalize=False):
+    """Id of a type name (`UNKNOWN_TYPE` if it is not in the chart)."""
+    if name is None or name.upper() == 'NOTYPE':
+        return NO_TYPE
+    if normalize:
+        name = name.upper()
+    return TYPE_IDS.get(name, UNKNOWN_TYPE)
+
+
+def encode_types(type_lists, width=None, normalize=False):
+    """
+    Encodes type lists as a padded int array.
+
+    Args:
+        type_lists: iterable of lists/tuples of type names (one per battle)
+        width: number of columns (default: longest list, at least 1)
+        normalize: upper-case the names before the lookup
+
+    Returns:
+        np.ndarray (n, width) of type ids, padded with `NO_TYPE`
+    """
+    rows, distinct = [], {}
+    for types in type_lists:
+        key = tuple(types) if types is not None else ()
+        rows.append(distinct.setdefault(key, len(distinct)))
+    if width is None:
+        width = max([len(key) for key in distinct] + [1])
+    table = np.zeros((len(distinct) + 1, width), dtype=np.int64)
+    for key, row in distinct.items():
+        ids = [type_id(name, normalize) for name in key][:width]
+        table[row, :len(ids)] = ids
+    return table[np.asarray(rows, dtype=np.int64)] if rows else table[:0]
+
+
+def effectiveness(attack_types, defend_types):
+    """
+    Multiplier of every attacking type against every defender.
+
+    Args:
+        attack_types: (n, a) type ids
+        defend_types: (n, d) type ids
+
+    Returns:
+        (n, a) array: product over the defender's types, as `get_type_effectiveness`
+    """
+    return EFFECTIVENESS[attack_types[:, :, None], defend_types[:, None, :]].prod(axis=2)
+
+
+def lead_type_product(attack_types, defend_types):
+    """Product over the attacker's types of their effectiveness (1.0 for an empty list)."""
+    return effectiveness(attack_types, defend_types).prod(axis=1)
+
+
+def max_type_effectiveness(attack_types, defend_types):
+    """Best attacking type, never below 1.0 (`max([...] + [1.0])`)."""
+    return np.maximum(effectiveness(attack_types, defend_types).max(axis=1), 1.0)
+
+
+def best_stab_advantage(attack_types, defend_types):
+    """
+    Batched `get_best_stab_advantage`: best STAB multiplier of the attacker,
+    1.0 when it has no type besides 'NOTYPE'.
+    """
+    eff = effectiveness(attack_types, defend_types)
+    typed = attack_types != NO_TYPE
+    best = np.where(typed, eff, -np.inf).max(axis=1)
+    return np.where(typed.any(axis=1), best, 1.0)